@@ -0,0 +1,90 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+import collections
+import time
+
+ADMITTED, QUEUED, REJECTED = "admitted", "queued", "rejected"
+
+DEFAULT_MAX_CONNECTIONS = 10000
+DEFAULT_MAX_SESSIONS = 10000
+DEFAULT_MAX_PER_IP = 64
+DEFAULT_MAX_QUEUE = 1000
+DEFAULT_IDLE_TIMEOUT = 300.0  # Seconds without input before a connection is closed
+
+
+class AdmissionController:
+    """Decide which connections get a slot and keep the rest in a fair queue.
+
+    Connections beyond max_connections wait first come, first served and get
+    a slot as soon as one is released. A single address can hold at most
+    max_per_ip slots and queue entries together, so one host can't fill the
+    queue for everybody else.
+    """
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, max_sessions=DEFAULT_MAX_SESSIONS,
+                 max_per_ip=DEFAULT_MAX_PER_IP, max_queue=DEFAULT_MAX_QUEUE):
+        self.max_connections = max_connections
+        self.max_sessions = max_sessions
+        self.max_per_ip = max_per_ip
+        self.max_queue = max_queue
+        self.active = 0
+        self.per_ip = collections.Counter()
+        self.queue = collections.OrderedDict()  # addr -> ticket, oldest first
+        self.release_interval = None  # Moving average of seconds between two released slots
+        self.last_release = None
+
+    def request(self, addr, ticket):
+        """Return (decision, reason) for a new connection from addr."""
+        ip = addr[0]
+        if self.per_ip[ip] >= self.max_per_ip:
+            return REJECTED, "Too many connections from your address."
+        if self.active < self.max_connections and not self.queue:
+            self.active += 1
+            self.per_ip[ip] += 1
+            return ADMITTED, None
+        if len(self.queue) >= self.max_queue:
+            return REJECTED, "Server capacity reached. Please try again later."
+        self.queue[addr] = ticket
+        self.per_ip[ip] += 1
+        return QUEUED, None
+
+    def release(self, addr):
+        """Free the slot held by addr and return the tickets admitted in its place."""
+        self._forget(addr)
+        self.active -= 1
+        now = time.monotonic()
+        if self.last_release is not None:
+            interval = now - self.last_release
+            if self.release_interval is None:
+                self.release_interval = interval
+            else:
+                self.release_interval = 0.9 * self.release_interval + 0.1 * interval
+        self.last_release = now
+
+        admitted = []
+        while self.queue and self.active < self.max_connections:
+            _, ticket = self.queue.popitem(last=False)
+            self.active += 1
+            admitted.append(ticket)
+        return admitted
+
+    def withdraw(self, addr):
+        """Drop a queued connection that went away before it got a slot."""
+        if self.queue.pop(addr, None) is not None:
+            self._forget(addr)
+
+    def _forget(self, addr):
+        ip = addr[0]
+        self.per_ip[ip] -= 1
+        if self.per_ip[ip] <= 0:
+            del self.per_ip[ip]
+
+    def estimated_wait(self, position):
+        """Expected seconds until the connection at position gets a slot, None if unknown."""
+        if self.release_interval is None:
+            return None
+        return position * self.release_interval
+
+    def can_open_session(self, open_sessions):
+        return open_sessions < self.max_sessions
@@ -0,0 +1,189 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""asyncio entry point for the Connect 4 server.
+
+Speaks the same text protocol as server.py and reuses its command handling,
+but runs every connection as a coroutine on one event loop instead of
+handing ready sockets to a thread pool.
+
+Usage:
+    python async_server.py <host> <port> [options, see server.py --help]
+"""
+
+import asyncio
+import logging
+import admission
+import server
+import session_store
+
+# A client whose unsent output grows past this is too slow to keep up
+MAX_PENDING_OUTPUT = 256 * 1024
+# drain() only waits while the transport holds more than this. With it at the
+# low water mark of server.reading_paused, the buffer is always down to where
+# reads resume once drain() returns, no need to watch it drain any further
+WRITE_BUFFER_HIGH_WATER = server.OUTPUT_LOW_WATER
+
+
+def log(message, *args, level=logging.DEBUG):
+    server.log(message, *args, level=level)
+
+
+async def write_loop(data, writer, output_ready, can_read):
+    """Flush queued output whenever there is some, waiting for the socket to drain.
+
+    can_read is cleared while the client has too much output pending, see
+    server.OUTPUT_HIGH_WATER, and set again once the output has drained.
+    Output queued while drain() waits sets output_ready, so the loop comes
+    round to write it and checks again.
+    """
+    while True:
+        await output_ready.wait()
+        output_ready.clear()
+        if data.out_size > MAX_PENDING_OUTPUT:
+            log("Dropping slow client %s with %d bytes pending", data.addr, data.out_size, level=logging.WARNING)
+            writer.transport.abort()
+            return
+        if data.outb:
+            server.output_bytes_sent_total.inc(data.out_size)
+            writer.writelines(server.take_output(data))
+            await writer.drain()
+            if not server.reading_paused(data, data.out_size + writer.transport.get_write_buffer_size()):
+                can_read.set()
+            if not data.outb:
+                server.output_drained(data)
+
+
+async def handle_connection(reader, writer):
+    addr = writer.get_extra_info("peername")
+    log("Accepted connection from %s", addr, level=logging.INFO)
+
+    output_ready = asyncio.Event()
+    can_read = asyncio.Event()
+    can_read.set()
+    data = None  # Until open_connection() returns, it already queues the reason for a rejection
+
+    def notify():
+        output_ready.set()
+        if data is not None and server.reading_paused(data, data.out_size + writer.transport.get_write_buffer_size()):
+            can_read.clear()
+
+    decision, data = server.open_connection(addr, close=writer.transport.abort, notify=notify)
+    if decision == admission.REJECTED:
+        writer.writelines(server.take_output(data))
+        await writer.drain()
+        writer.close()
+        return
+
+    writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH_WATER)
+    writer_task = asyncio.create_task(write_loop(data, writer, output_ready, can_read))
+    try:
+        while not writer_task.done():
+            await can_read.wait()
+            recv_data = await reader.read(1024)
+            if not recv_data:
+                break
+            try:
+                server.receive(data, recv_data)
+            except Exception as exc:
+                log("Failed to process command from %s: %r", addr, exc, level=logging.WARNING)
+    except ConnectionError:
+        pass
+    finally:
+        log("Closing connection to %s", addr, level=logging.INFO)
+        server.close_connection(data)
+        writer_task.cancel()
+        writer.close()
+
+
+def watch_timers(loop):
+    """Run server.timers on the event loop, waking up for the next deadline."""
+    handle = None
+    wake_at = None
+
+    def arm(deadline):
+        nonlocal handle, wake_at
+        if handle is not None and wake_at <= deadline:
+            return
+        if handle is not None:
+            handle.cancel()
+        # The loop's clock is time.monotonic(), like the timers' deadlines
+        handle, wake_at = loop.call_at(deadline, run), deadline
+
+    def run():
+        nonlocal handle
+        handle = None
+        server.run_timers()
+        deadline = server.timers.next_deadline()
+        if deadline is not None:
+            arm(deadline)
+
+    server.timers_changed = arm
+    run()
+
+
+async def snapshot_sessions():
+    while True:
+        await asyncio.sleep(session_store.DEFAULT_SNAPSHOT_INTERVAL)
+        try:
+            server.snapshot_sessions()
+        except Exception as exc:
+            # An exception would end the task, and no session would be saved after it
+            log("Session snapshot failed: %r", exc, level=logging.ERROR)
+
+
+def watch_ai_moves(loop):
+    """Collect AI moves from the process pool on wakeups and deadlines."""
+    timer = None
+
+    def on_wakeup():
+        nonlocal timer
+        try:
+            server.wakeup_recv.recv(4096)
+        except BlockingIOError:
+            pass
+        server.collect_ai_moves()
+        server.collect_ponders()
+        if timer is not None:
+            timer.cancel()
+        timeout = server.ai_wait_timeout()
+        timer = loop.call_later(timeout, on_wakeup) if timeout is not None else None
+
+    server.wakeup_recv.setblocking(False)
+    server.wakeup_send.setblocking(False)
+    loop.add_reader(server.wakeup_recv, on_wakeup)
+
+
+async def main(args):
+    server.configure_ai(args)
+    server.configure_admission(args)
+    server.configure_clocks(args)
+    server.configure_game_log(args)
+    server.configure_session_store(args)
+    server.configure_admin(args)
+    watch_ai_moves(asyncio.get_running_loop())
+    watch_timers(asyncio.get_running_loop())
+    snapshots = asyncio.create_task(snapshot_sessions())
+    listener = await asyncio.start_server(handle_connection, args.host, args.port, backlog=args.backlog)
+    print(f"Listening on {args.host}:{args.port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        # Runs before the connection tasks are cancelled, their sessions stay saved
+        server.close_session_store()
+    snapshots.cancel()
+
+
+if __name__ == "__main__":
+    args = server.parse_args("Connect 4 game server (asyncio).")
+    server.configure_logging(args)
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        print("Caught keyboard interrupt, exiting")
+    finally:
+        server.close_game_log()
+        server.close_session_store()
+        if server.ai_pool is not None:
+            server.ai_pool.shutdown(wait=False, cancel_futures=True)
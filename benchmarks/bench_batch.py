@@ -0,0 +1,71 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Positions per second of the NumPy batch API against the scalar functions.
+
+Needs NumPy. Run from the repository root:
+    python -m benchmarks.bench_batch [--positions N] [--seed S]
+"""
+
+import argparse
+import random
+import time
+import game_ai
+import game_logic
+import game_logic_batch
+
+
+def random_positions(count, seed):
+    """Positions from random games that are still going on."""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = game_logic.create_board()
+        for _ in range(rng.randrange(game_logic.BOARD_SIZE)):
+            column = rng.choice([col for col in range(game_logic.COLUMNS) if board.can_play(col)])
+            token = board.current_token
+            row = board.play(column, token)
+            if board.has_won_at(row, column, token):
+                board.undo()
+                break
+        positions.append(board)
+    return positions
+
+
+def scalar(boards):
+    for board in boards:
+        game_logic.check_win(board, game_logic.PLAYER1)
+        game_logic.check_win(board, game_logic.PLAYER2)
+        game_logic.is_draw(board)
+        [board.can_play(col) for col in range(game_logic.COLUMNS)]
+        game_ai.find_winning_move(board, game_logic.PLAYER2)
+        game_ai.find_winning_move(board, game_logic.PLAYER1)
+
+
+def batch(cells):
+    game_logic_batch.analyse(cells)
+
+
+def run(count, seed):
+    boards = random_positions(count, seed)
+    cells = game_logic_batch.from_boards(boards)
+
+    start = time.perf_counter()
+    scalar(boards)
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch(cells)
+    batch_time = time.perf_counter() - start
+
+    print(f"{count} positions: win, draw, legal moves, winning and blocking columns")
+    print(f"scalar {count / scalar_time:>12,.0f} positions/s")
+    print(f"batch  {count / batch_time:>12,.0f} positions/s ({scalar_time / batch_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--positions", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    run(args.positions, args.seed)
@@ -0,0 +1,60 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Cost of sending one game's updates to many spectators.
+
+Spectators are simulated without sockets, a third of them each on text,
+full binary and delta updates. Their queues are emptied after every
+update, so the numbers show the server's fan-out work alone. Run from the
+repository root:
+    python -m benchmarks.bench_fanout [--spectators 10 100 1000]
+"""
+
+import argparse
+import random
+import time
+import server
+from benchmarks.bench_matchmaking import connect, fake_addr, reset
+
+SPECTATE_COMMANDS = ("SPECTATE", "SPECTATE BINARY", "SPECTATE DELTA")
+
+
+def time_updates(spectators, moves):
+    reset()
+    player = connect(fake_addr(0))
+    server.process_command("START_GAME 2 easy 1000 DELTA", player, None)
+    viewers = [connect(fake_addr(index + 1)) for index in range(spectators)]
+    for index, viewer in enumerate(viewers):
+        server.process_command(SPECTATE_COMMANDS[index % 3], viewer, None)
+        server.take_output(viewer)
+
+    session = server.active_sessions[player.session_id]
+    elapsed = 0.0
+    sent = 0
+    for _ in range(moves):
+        column = random.choice([col for col in range(7) if session.board.can_play(col)])
+        start = time.perf_counter()
+        server.handle_move(player, column)
+        elapsed += time.perf_counter() - start
+        server.take_output(player)
+        for viewer in viewers:
+            sent += viewer.out_size
+            server.take_output(viewer)
+    return elapsed / moves, sent / moves
+
+
+def run(counts, moves):
+    print(f"{'spectators':>10}{'us/update':>11}{'us/viewer':>11}{'bytes/update':>14}")
+    for count in counts:
+        per_update, sent = time_updates(count, moves)
+        print(f"{count:>10}{per_update * 1e6:>11.1f}{per_update * 1e6 / max(count, 1):>11.2f}{sent:>14.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spectators", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--moves", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    run(args.spectators, args.moves)
@@ -0,0 +1,351 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Time per call of the engine and server hot paths, with a regression gate.
+
+Every benchmark runs over a corpus of positions from seeded random games,
+so runs on the same machine see the same work. A round goes over the
+corpus until MIN_ROUND_TIME has passed and the best of --repeat rounds
+counts, in nanoseconds per call. No network is used: server.process_command
+is driven with connections that only queue their output.
+
+--save stores the results as the baseline, a JSON file. Without it they are
+compared with the baseline and the run fails (exit status 1) when a path got
+slower by more than --threshold. Baselines only compare on one machine, save
+one before making a change.
+
+--profile NAME runs one benchmark under cProfile, --stacks FILE samples it
+into collapsed stacks for the flame graph tools instead.
+
+Run from the repository root:
+    python -m benchmarks.bench_hot_paths --save
+    python -m benchmarks.bench_hot_paths [--threshold 0.2] [--only check_win is_draw]
+    python -m benchmarks.bench_hot_paths --profile process_command
+"""
+
+import argparse
+import cProfile
+import gc
+import json
+import os
+import platform
+import pstats
+import random
+import sys
+import threading
+import time
+import game_ai
+import game_logic
+import game_session
+import game_threats
+import metrics
+import server
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_THRESHOLD = 0.2  # Share a path may get slower before the run fails
+DEFAULT_POSITIONS = 2000
+DEFAULT_GAMES = 200
+DEFAULT_REPEAT = 5
+DEFAULT_SEED = 4
+MIN_ROUND_TIME = 0.1  # Seconds of timed calls per round, shorter rounds are mostly noise
+
+
+def random_game(rng):
+    """Columns of a random game played to its end."""
+    board = game_logic.create_board()
+    moves = []
+    while True:
+        column = rng.choice([col for col in range(game_logic.COLUMNS) if board.can_play(col)])
+        row = board.play(column, board.current_token)
+        moves.append(column)
+        if board.has_won_at(row, column, game_logic.TOKENS[(len(moves) - 1) & 1]) or board.is_full():
+            return moves
+
+
+def make_corpus(positions, games, seed):
+    """Positions still in play, the column played next in each, and whole games."""
+    rng = random.Random(seed)
+    corpus = {"positions": [], "games": [random_game(rng) for _ in range(games)]}
+    while len(corpus["positions"]) < positions:
+        moves = random_game(rng)
+        # Any position before the last move is still in play
+        board = game_logic.create_board()
+        for column in moves[:rng.randrange(len(moves))]:
+            board.play(column, board.current_token)
+        next_column = rng.choice([col for col in range(game_logic.COLUMNS) if board.can_play(col)])
+        corpus["positions"].append((board, next_column))
+    return corpus
+
+
+def session_at(board):
+    """A two player session in the position."""
+    session = game_session.GameSession(player1="p1")
+    session.sit("p2", game_logic.PLAYER2)
+    session.state = game_session.READY
+    session.board = board.copy()
+    session.turn = board.current_token
+    return session
+
+
+# Each benchmark takes the corpus and returns (setup, run). setup() does
+# the untimed work of one round and returns what run() needs, run() returns
+# the number of calls it made.
+
+def bench_make_move(corpus):
+    def setup():
+        return [(board.copy(), column, board.current_token) for board, column in corpus["positions"]]
+
+    def run(moves):
+        make_move = game_logic.make_move
+        for board, column, token in moves:
+            make_move(board, column, token)
+        return len(moves)
+    return setup, run
+
+
+def bench_check_win(corpus):
+    def run(_):
+        check_win = game_logic.check_win
+        for board, _ in corpus["positions"]:
+            check_win(board, game_logic.PLAYER1)
+            check_win(board, game_logic.PLAYER2)
+        return 2 * len(corpus["positions"])
+    return lambda: None, run
+
+
+def bench_is_draw(corpus):
+    def run(_):
+        is_draw = game_logic.is_draw
+        for board, _ in corpus["positions"]:
+            is_draw(board)
+        return len(corpus["positions"])
+    return lambda: None, run
+
+
+def bench_find_winning_move(corpus):
+    def run(_):
+        find_winning_move = game_ai.find_winning_move
+        for board, _ in corpus["positions"]:
+            find_winning_move(board, board.current_token)
+        return len(corpus["positions"])
+    return lambda: None, run
+
+
+def bench_algorithmic_ai_move(corpus):
+    def setup():
+        # Every call computes its move, as for a position no session had before
+        game_ai.decisions.clear()
+        random.seed(DEFAULT_SEED)
+
+    def run(_):
+        algorithmic_ai_move = game_ai.algorithmic_ai_move
+        for board, _ in corpus["positions"]:
+            algorithmic_ai_move(board)
+        return len(corpus["positions"])
+    return setup, run
+
+
+def bench_hard_ai_move(corpus):
+    def setup():
+        random.seed(DEFAULT_SEED)
+
+    def run(_):
+        # Counted from scratch every call, a session only adds the moves since its last turn
+        threat_ai_move = game_threats.threat_ai_move
+        for board, _ in corpus["positions"]:
+            threat_ai_move(board)
+        return len(corpus["positions"])
+    return setup, run
+
+
+def bench_session_make_move(corpus):
+    def setup():
+        return [(session_at(board), column) for board, column in corpus["positions"]]
+
+    def run(sessions):
+        for session, column in sessions:
+            session.make_move(column, session.player_at(session.turn), play_ai=False)
+        return len(sessions)
+    return setup, run
+
+
+def bench_serialize_board(corpus):
+    sessions = [session_at(board) for board, _ in corpus["positions"]]
+
+    def run(_):
+        for session in sessions:
+            session.serialize_board()
+        return len(sessions)
+    return lambda: None, run
+
+
+def bench_process_command(corpus):
+    def setup():
+        reset_server()
+        players = [server.open_connection(("10.0.0.1", port), close=None)[1] for port in (1, 2)]
+        for data in players:
+            server.process_command("START_GAME 1", data, None)
+        # Moves alternate between the players, every game starts with the first
+        sequence = []
+        for moves in corpus["games"]:
+            sequence.extend((f"MOVE {column}", players[index & 1]) for index, column in enumerate(moves))
+        return sequence
+
+    def run(sequence):
+        process_command = server.process_command
+        for command, data in sequence:
+            process_command(command, data, None)
+        return len(sequence)
+    return setup, run
+
+
+def reset_server():
+    server.active_sessions.clear()
+    server.waiting_sessions.clear()
+    server.clients.clear()
+    server.session_timers.clear()
+    server.timers = server.timing_wheel.TimingWheel()
+    server.admission_control = server.admission.AdmissionController(max_connections=10 ** 6,
+                                                                    max_sessions=10 ** 6, max_per_ip=10 ** 6)
+
+
+BENCHMARKS = {
+    "make_move": bench_make_move,
+    "check_win": bench_check_win,
+    "is_draw": bench_is_draw,
+    "find_winning_move": bench_find_winning_move,
+    "algorithmic_ai_move": bench_algorithmic_ai_move,
+    "hard_ai_move": bench_hard_ai_move,
+    "session_make_move": bench_session_make_move,
+    "serialize_board": bench_serialize_board,
+    "process_command": bench_process_command,
+}
+
+
+def time_round(setup, run):
+    """Nanoseconds per call of one round."""
+    elapsed = calls = 0
+    while elapsed < MIN_ROUND_TIME * 1e9:
+        state = setup()
+        # As in timeit, a collection in the middle would land on whichever path runs
+        gc.disable()
+        start = time.perf_counter_ns()
+        calls += run(state)
+        elapsed += time.perf_counter_ns() - start
+        gc.enable()
+    return elapsed / calls
+
+
+def time_benchmarks(names, corpus, repeat):
+    """Best nanoseconds per call of each benchmark over repeat rounds.
+
+    The rounds of all benchmarks take turns, so a stretch where the machine
+    is busy with something else doesn't spoil every round of one of them.
+    """
+    benchmarks = {name: BENCHMARKS[name](corpus) for name in names}
+    best = {}
+    for _ in range(repeat):
+        for name, (setup, run) in benchmarks.items():
+            per_call = time_round(setup, run)
+            best[name] = min(best.get(name, per_call), per_call)
+    return best
+
+
+def profile_benchmark(name, corpus, repeat, stacks_path=None):
+    """Run one benchmark under cProfile, or the sampling profiler when stacks_path is given.
+
+    cProfile leaves the setup of each round out, the samples keep it under its own frame.
+    """
+    setup, run = BENCHMARKS[name](corpus)
+    if stacks_path is not None:
+        metrics.profiler.start(threading.get_ident(), interval=0.001)
+        for _ in range(repeat):
+            run(setup())
+        with open(stacks_path, "w") as stacks:
+            stacks.write(metrics.profiler.stop())
+        print(f"Wrote collapsed stacks of {name} to {stacks_path}")
+        return
+    profile = cProfile.Profile()
+    for _ in range(repeat):
+        state = setup()
+        profile.enable()
+        run(state)
+        profile.disable()
+    pstats.Stats(profile).sort_stats("cumulative").print_stats(25)
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(path, results, args):
+    baseline = {"python": platform.python_version(), "machine": platform.machine(), "seed": args.seed,
+                "positions": args.positions, "games": args.games, "results": results}
+    with open(path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+    print(f"Saved the baseline to {path}")
+
+
+def compare(results, baseline, threshold):
+    """Print the results against the baseline, return the names of the paths that regressed."""
+    previous = baseline["results"] if baseline is not None else {}
+    regressions = []
+    print(f"{'benchmark':<22}{'ns/call':>10}{'baseline':>10}{'change':>9}")
+    for name, per_call in results.items():
+        before = previous.get(name)
+        if before is None:
+            print(f"{name:<22}{per_call:>10.0f}{'-':>10}{'-':>9}")
+            continue
+        change = per_call / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<22}{per_call:>10.0f}{before:>10.0f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="benchmarks to run, all by default")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="rounds per benchmark, the best counts")
+    parser.add_argument("--positions", type=int, default=DEFAULT_POSITIONS, help="positions in the corpus")
+    parser.add_argument("--games", type=int, default=DEFAULT_GAMES, help="games replayed by process_command")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown, as a share of the baseline, that fails the run")
+    parser.add_argument("--profile", choices=BENCHMARKS, help="profile this benchmark instead of timing")
+    parser.add_argument("--stacks", help="with --profile, write collapsed stacks here instead of cProfile output")
+    args = parser.parse_args(argv)
+
+    corpus = make_corpus(args.positions, args.games, args.seed)
+    if args.profile is not None:
+        profile_benchmark(args.profile, corpus, args.repeat, args.stacks)
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is not None and (baseline.get("seed"), baseline.get("positions"), baseline.get("games")) != \
+            (args.seed, args.positions, args.games):
+        print("The baseline was taken on a different corpus, comparing anyway")
+    results = time_benchmarks(args.only or list(BENCHMARKS), corpus, args.repeat)
+    regressions = compare(results, None if args.save else baseline, args.threshold)
+    if args.save:
+        if baseline is not None:
+            results = {**baseline["results"], **results}
+        save_baseline(args.baseline, results, args)
+        return 0
+    if baseline is None:
+        print(f"No baseline at {args.baseline}, run with --save to store one")
+    elif regressions:
+        print(f"Slower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Per-event cost of matchmaking, client lookup and session eviction.
+
+Simulates clients without sockets, so the numbers show the cost of the
+server's bookkeeping alone. Run from the repository root:
+    python -m benchmarks.bench_matchmaking [--sizes 1000 5000 20000]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+import server
+
+
+def fake_addr(index):
+    return ("10.0.0.1", index)
+
+
+def connect(addr):
+    _, data = server.open_connection(addr, close=None)
+    return data
+
+
+def populate(count):
+    """Connect count clients, half in PvP games and half in AI games."""
+    for index in range(count):
+        data = connect(fake_addr(index))
+        if index % 4 >= 2:
+            server.process_command("START_GAME 2 easy 1", data, None)
+        else:
+            server.process_command("START_GAME 1", data, None)
+
+
+def time_events(count, events):
+    next_index = count
+    start = time.perf_counter()
+    for _ in range(events):
+        # A pair connects, gets matched, plays one move each and leaves
+        first = connect(fake_addr(next_index))
+        second = connect(fake_addr(next_index + 1))
+        server.process_command("START_GAME 1", first, None)
+        server.process_command("START_GAME 1", second, None)
+        server.handle_move(first, 3)
+        server.handle_move(second, 3)
+        server.close_connection(first)
+        server.close_connection(second)
+        next_index += 2
+    return (time.perf_counter() - start) / (events * 8)
+
+
+def reset():
+    server.active_sessions.clear()
+    server.waiting_sessions.clear()
+    server.clients.clear()
+    server.session_timers.clear()
+    server.timers = server.timing_wheel.TimingWheel()
+    server.admission_control = server.admission.AdmissionController(max_connections=10 ** 6,
+                                                                    max_sessions=10 ** 6, max_per_ip=10 ** 6)
+
+
+def run(sizes, events):
+    print(f"{'clients':>8}{'sessions':>10}{'us/event':>10}")
+    for count in sizes:
+        reset()
+        with contextlib.redirect_stdout(io.StringIO()):
+            populate(count)
+            sessions = len(server.active_sessions)
+            per_event = time_events(count, events)
+        print(f"{count:>8}{sessions:>10}{per_event * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--events", type=int, default=500, help="connect/move/leave rounds per size")
+    args = parser.parse_args()
+    run(args.sizes, args.events)
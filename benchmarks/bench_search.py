@@ -0,0 +1,56 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Nodes per second and latency per move of the expert search.
+
+Run from the repository root:
+    python -m benchmarks.bench_search [--budget SECONDS] [--depth N]
+"""
+
+import argparse
+import time
+import game_logic
+import game_search
+
+# Move sequences in the usual 1-based column notation, from the opening to
+# positions close to the end of the game
+TEST_POSITIONS = {
+    "empty": "",
+    "opening": "4453",
+    "early": "4453261",
+    "middle": "52753311433677442422121",
+    "late": "1233722555341321451114725",
+}
+
+
+def board_from_moves(moves):
+    board = game_logic.create_board()
+    for move in moves:
+        board.play(int(move) - 1, board.current_token)
+    return board
+
+
+def run(budget, depth, repeat):
+    print(f"{'position':<10}{'move':>6}{'depth':>7}{'nodes':>10}{'ms/move':>10}{'knodes/s':>10}")
+    for name, moves in TEST_POSITIONS.items():
+        board = board_from_moves(moves)
+        nodes = elapsed = 0
+        for _ in range(repeat):
+            searcher = game_search.Searcher()
+            start = time.perf_counter()
+            column, _, reached = searcher.best_move(board, budget, depth)
+            elapsed += time.perf_counter() - start
+            nodes += searcher.nodes
+        ms_per_move = elapsed / repeat * 1000
+        rate = nodes / elapsed / 1000 if elapsed else 0
+        print(f"{name:<10}{column:>6}{reached:>7}{nodes // repeat:>10}{ms_per_move:>10.1f}{rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=game_search.DEFAULT_TIME_BUDGET,
+                        help="time budget per move in seconds (0 for none)")
+    parser.add_argument("--depth", type=int, default=None, help="maximum search depth")
+    parser.add_argument("--repeat", type=int, default=3, help="searches per position")
+    args = parser.parse_args()
+    run(args.budget or None, args.depth, args.repeat)
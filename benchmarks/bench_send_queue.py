@@ -0,0 +1,167 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Bytes copied and system calls per byte delivered by the send queue.
+
+A backlog of update-sized messages is queued for one client and flushed
+to a Unix socket while the other end reads it in pieces, the way a slow
+client drains its output. Three queues are compared: one bytes buffer that
+is appended to and sliced after every send, as the server first kept its
+output, a deque of chunks sent one send() at a time, and server.send_output.
+Copies are counted by the harness: the copy into the socket buffer of every
+byte sent, and for the server's queue every buffer it hands to sendmsg()
+that is neither a queued message nor a view of one. The messages come
+encoded already, the copy protocol.frame() makes when it builds one is the
+same whatever the queue and isn't counted.
+Run from the repository root:
+    python -m benchmarks.bench_send_queue [--messages 1000 10000]
+"""
+
+import argparse
+import collections
+import random
+import socket
+import time
+import server
+
+READ_SIZE = 16 * 1024
+
+
+class CountingSocket:
+    """Forwards sends to a socket, counting the calls and the buffers sendmsg() gets that were copied."""
+
+    def __init__(self, sock, queued):
+        self.sock = sock
+        self.calls = 0
+        self.queued = {id(encoded) for encoded in queued}  # The messages stay alive, so their ids do
+        self.copied = 0
+
+    def send(self, data):
+        self.calls += 1
+        return self.sock.send(data)
+
+    def sendmsg(self, buffers):
+        self.calls += 1
+        for buffer in buffers:
+            owner = buffer.obj if isinstance(buffer, memoryview) else buffer
+            if id(owner) not in self.queued:
+                self.copied += len(buffer)
+        return self.sock.sendmsg(buffers)
+
+
+class BufferQueue:
+    """One bytes buffer, every append and partial send copies what is left."""
+
+    def __init__(self):
+        self.outb = b""
+        self.copied = 0
+
+    def queue(self, encoded):
+        self.outb += encoded
+        self.copied += len(self.outb)
+
+    def flush(self, sock):
+        while self.outb:
+            try:
+                sent = sock.send(self.outb)
+            except BlockingIOError:
+                return
+            self.outb = self.outb[sent:]
+            self.copied += sent + len(self.outb)
+
+    def pending(self):
+        return len(self.outb)
+
+
+class ChunkQueue:
+    """A deque of chunks sent one at a time, the rest of a partial send is copied."""
+
+    def __init__(self):
+        self.outb = collections.deque()
+        self.size = 0
+        self.copied = 0
+
+    def queue(self, encoded):
+        self.outb.append(encoded)
+        self.size += len(encoded)
+
+    def flush(self, sock):
+        while self.outb:
+            chunk = self.outb[0]
+            try:
+                sent = sock.send(chunk)
+            except BlockingIOError:
+                return
+            self.size -= sent
+            self.copied += sent
+            if sent < len(chunk):
+                self.outb[0] = chunk[sent:]
+                self.copied += len(chunk) - sent
+                return
+            self.outb.popleft()
+
+    def pending(self):
+        return self.size
+
+
+class ServerQueue:
+    """The server's own queue and server.send_output()."""
+
+    def __init__(self):
+        self.data = server.new_connection_data(("bench", 0))
+        self.copied = 0
+
+    def queue(self, encoded):
+        server.queue_output(self.data, encoded)
+
+    def flush(self, sock):
+        # The copy into the socket buffer, sock counts the ones made before sendmsg()
+        before = self.data.out_size
+        server.send_output(self.data, sock)
+        self.copied += before - self.data.out_size
+
+    def pending(self):
+        return self.data.out_size
+
+
+def messages(count, seed=1):
+    rng = random.Random(seed)
+    return [bytes(rng.randrange(40, 400)) for _ in range(count)]
+
+
+def drain(make_queue, backlog):
+    sender, receiver = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 32 * 1024)
+    sender.setblocking(False)
+    counted = CountingSocket(sender, backlog)
+    queue = make_queue()
+    delivered = 0
+    start = time.perf_counter()
+    for encoded in backlog:
+        queue.queue(encoded)
+    while queue.pending():
+        queue.flush(counted)
+        delivered += len(receiver.recv(READ_SIZE))
+    while delivered < sum(map(len, backlog)):
+        delivered += len(receiver.recv(READ_SIZE))
+    elapsed = time.perf_counter() - start
+    sender.close()
+    receiver.close()
+    return (queue.copied + counted.copied) / delivered, counted.calls, elapsed
+
+
+def run(counts):
+    queues = {"buffer": BufferQueue, "chunks": ChunkQueue, "server": ServerQueue}
+    print(f"{'messages':>9}{'queue':>8}{'copies/B':>10}{'sends':>8}{'ms':>9}")
+    for count in counts:
+        backlog = messages(count)
+        for name, make_queue in queues.items():
+            ratio, calls, elapsed = drain(make_queue, backlog)
+            print(f"{count:>9}{name:>8}{ratio:>10.2f}{calls:>8}{elapsed * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+    run(args.messages)
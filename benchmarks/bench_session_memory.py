@@ -0,0 +1,105 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Memory held per GameSession, against the session object it replaced.
+
+LegacySession keeps the state the way GameSession did before it got
+__slots__: a __dict__, a uuid4 string id, a players dict, a spectator
+set, a resume token dict and a move log of tuples. Idle sessions are
+fresh AI games, active ones have a spectator and a few moves played.
+Run from the repository root:
+    python -m benchmarks.bench_session_memory [--sessions 10000 100000]
+"""
+
+import argparse
+import gc
+import secrets
+import tracemalloc
+import uuid
+import game_logic
+import game_session
+
+ACTIVE_MOVES = (3, 3, 2, 4, 5, 1, 2, 6)
+
+
+class LegacySession:
+    """State of a session as GameSession used to keep it, without the behaviour."""
+
+    def __init__(self, player1, ai_difficulty=None, is_ai_game=False, num_wins=1):
+        self.session_id = str(uuid.uuid4())
+        self.board = game_logic.create_board()
+        self.players = {player1: game_logic.PLAYER1}
+        self.ai_difficulty = ai_difficulty
+        self.is_ai_game = is_ai_game
+        if is_ai_game:
+            self.players["AI"] = game_logic.PLAYER2
+        self.turn = game_logic.PLAYER1
+        self.winner = None
+        self.draw = False
+        self.state = "waiting"
+        self.player_wins = 0
+        self.ai_wins = 0
+        self.num_wins = num_wins
+        self.player_moves = 0
+        self.ai_moves = 0
+        self.seq = 0
+        self.move_log = []
+        self.broadcast_seq = 0
+        self.spectators = set()
+        self.resume_tokens = {game_logic.PLAYER1: secrets.token_bytes(8), game_logic.PLAYER2: secrets.token_bytes(8)}
+
+    def add_spectator(self, addr):
+        self.spectators.add(addr)
+
+
+def play_legacy(session, column):
+    token = session.board.current_token
+    row = game_logic.make_move(session.board, column, token)
+    session.seq += 1
+    session.move_log.append((session.seq, column, row, token))
+
+
+def play(session, column):
+    game_logic.make_move(session.board, column, session.board.current_token)
+    session.seq += 1
+
+
+def bytes_per_session(make, play_move, count, active):
+    """Traced memory per session for count sessions kept in a dict, as the server does."""
+    addrs = [("127.0.0.1", 1024 + index % 60000) for index in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = {}
+    for addr in addrs:
+        session = make(addr)
+        if active:
+            for column in ACTIVE_MOVES:
+                play_move(session, column)
+            session.add_spectator(("127.0.0.2", addr[1]))
+        sessions[session.session_id] = session
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / count
+
+
+def run(counts):
+    kinds = {
+        "legacy": (lambda addr: LegacySession(addr, "hard", is_ai_game=True), play_legacy),
+        "slots": (lambda addr: game_session.GameSession(addr, "hard", is_ai_game=True), play),
+    }
+    print(f"{'sessions':>9}{'state':>8}{'legacy B':>10}{'slots B':>9}{'saved':>7}")
+    for count in counts:
+        for active in (False, True):
+            sizes = {name: bytes_per_session(make, play_move, count, active)
+                     for name, (make, play_move) in kinds.items()}
+            saved = 1 - sizes["slots"] / sizes["legacy"]
+            print(f"{count:>9}{'active' if active else 'idle':>8}{sizes['legacy']:>10.0f}{sizes['slots']:>9.0f}"
+                  f"{saved:>7.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+    run(args.sessions)
@@ -0,0 +1,417 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Put load on a running server with scripted clients.
+
+Opens many non-blocking connections from one process. Each one sends
+START_GAME built with client.create_request in delta mode, plays random
+legal moves until its series is over and then disconnects. Half of the
+clients play each other by default and the rest play the AI.
+
+Latency is measured from sending a move to receiving the update that
+answers it, so for AI games it includes the AI's thinking time. --think
+makes the clients wait before every move the way a person would, which
+gives a server started with --ponder-budget time to ponder:
+    python -m benchmarks.load_test --clients 4 --pvp-ratio 0 --difficulties expert --think 3 \
+        --spawn server --ponder-budget 60
+
+Run from the repository root, either against a server that is already up
+or with --spawn to start one on a free localhost port. A spawned server's
+CPU time is reported once it has shut down:
+    python -m benchmarks.load_test --clients 2000 --spawn server
+    python -m benchmarks.load_test --host 127.0.0.1 --port 5000 --clients 500
+"""
+
+import argparse
+import collections
+import os
+import random
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import time
+import client
+import game_logic
+import protocol
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+DEFAULT_CLIENTS = 1000
+DEFAULT_RAMP = 500.0  # New connections per second
+DEFAULT_TIMEOUT = 120.0
+SERVER_START_TIMEOUT = 10.0
+
+# Notices that mean the server turned the client away or dropped its game
+FAILURE_NOTICES = {
+    "Invalid move": "invalid_move",
+    "Too many connections": "rejected",
+    "capacity reached": "rejected",
+    "opponent left": "opponent_left",
+    "All game tables are taken": "no_session",
+    "Failed to create or join": "no_session",
+    "Unknown": "unknown_command",
+}
+
+
+class Stats:
+    def __init__(self):
+        self.connect_times = []
+        self.latencies = []
+        self.thinking = []  # Clients waiting out their think time before a move
+        self.moves = 0
+        self.games = 0
+        self.series = 0
+        self.queued = 0
+        self.errors = collections.Counter()
+
+
+class LoadClient:
+    """One scripted player speaking the binary protocol, with full or delta updates."""
+
+    def __init__(self, index, game_type, difficulty, num_wins, stats, mode=protocol.DELTA, think=0.0):
+        self.index = index
+        self.think = think
+        self.play_at = None
+        self.game_type = game_type
+        self.difficulty = difficulty
+        self.num_wins = num_wins
+        self.stats = stats
+        self.mode = mode
+        self.sock = None
+        self.inb = b""
+        self.outb = b""
+        self.connect_started = None
+        self.connected = False
+        self.done = False
+        self.token = None
+        self.heights = [0] * game_logic.COLUMNS
+        self.seq = 0
+        self.awaiting_snapshot = False
+        self.move_sent = None  # perf_counter() of the move waiting for its update
+
+    def start(self, sel, addr):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.connect_started = time.perf_counter()
+        self.sock.connect_ex(addr)
+        sel.register(self.sock, selectors.EVENT_WRITE, data=self)
+
+    def on_connected(self, sel):
+        error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self.fail(sel, "connect_failed")
+            return
+        self.connected = True
+        self.stats.connect_times.append(time.perf_counter() - self.connect_started)
+        if self.game_type == "2":
+            request = client.create_request("start_game", "2", self.difficulty, self.num_wins, self.mode)
+            self.token = game_logic.PLAYER1  # The human side always opens against the AI
+        else:
+            request = client.create_request("start_game", "1", None, None, self.mode)
+        self.send(sel, request)
+
+    def send(self, sel, payload):
+        self.outb += payload
+        try:
+            sent = self.sock.send(self.outb)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self.fail(sel, "send_failed")
+            return
+        self.outb = self.outb[sent:]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if self.outb else 0)
+        sel.modify(self.sock, events, data=self)
+
+    def play(self, sel):
+        if self.think:
+            self.play_at = time.perf_counter() + self.think
+            self.stats.thinking.append(self)
+        else:
+            self.send_move(sel)
+
+    def send_move(self, sel):
+        columns = [col for col in range(game_logic.COLUMNS) if self.heights[col] < game_logic.ROWS]
+        self.move_sent = time.perf_counter()
+        self.send(sel, client.create_request("move", random.choice(columns), mode=self.mode))
+
+    def on_readable(self, sel):
+        try:
+            received = self.sock.recv(65536)
+        except OSError:
+            received = b""
+        if not received:
+            self.fail(sel, "closed_by_server")
+            return
+        self.inb += received
+        while not self.done:
+            payload, self.inb = protocol.split_frame(self.inb)
+            if payload is None:
+                return
+            self.handle_message(sel, payload)
+
+    def handle_message(self, sel, payload):
+        message_type = payload[0]
+        if message_type == protocol.MSG_TEXT:
+            text = payload[1:].decode("utf-8")
+            if text.startswith("Server is full"):
+                self.stats.queued += 1
+            elif text.startswith("New AI game session created"):
+                self.play(sel)
+            else:
+                for notice, error in FAILURE_NOTICES.items():
+                    if notice in text:
+                        self.fail(sel, error)
+                        return
+        elif message_type == protocol.MSG_READY:
+            self.token = protocol.CODE_TOKENS[payload[1]]
+            if self.token == game_logic.PLAYER1:
+                self.play(sel)
+        elif message_type == protocol.MSG_UPDATE:
+            update = protocol.decode_update(payload)
+            self.heights = board_heights(update["board"])
+            self.handle_update(sel, update)
+        elif message_type == protocol.MSG_DELTA:
+            self.handle_delta(sel, protocol.decode_delta(payload))
+        elif message_type == protocol.MSG_SNAPSHOT:
+            snapshot = protocol.decode_snapshot(payload)
+            self.seq, self.awaiting_snapshot = snapshot["seq"], False
+            self.heights = board_heights(snapshot["board"])
+            if snapshot["turn"] == self.token and self.move_sent is None:
+                self.play(sel)
+        elif message_type == protocol.MSG_STATUS:
+            # A game lost on time, it doesn't answer a move
+            status = protocol.decode_status(payload)
+            self.seq, self.move_sent = max(self.seq, status["seq"]), None
+            if self in self.stats.thinking:
+                self.stats.thinking.remove(self)
+            self.handle_update(sel, status)
+
+    def handle_delta(self, sel, delta):
+        if self.awaiting_snapshot or delta["seq"] <= self.seq:
+            return
+        if delta["seq"] != self.seq + 1:
+            self.stats.errors["sequence_gap"] += 1
+            self.awaiting_snapshot = True
+            self.send(sel, client.create_request("snapshot", mode=self.mode))
+            return
+        self.seq = delta["seq"]
+        self.heights[delta["column"]] += 1
+        self.handle_update(sel, delta)
+
+    def handle_update(self, sel, update):
+        if self.move_sent is not None:
+            self.stats.latencies.append(time.perf_counter() - self.move_sent)
+            self.stats.moves += 1
+            self.move_sent = None
+        if update["series"] != protocol.SERIES_NONE:
+            self.stats.games += 1
+            self.stats.series += 1
+            self.finish(sel)
+            return
+        if update["status"] != protocol.STATUS_ONGOING:
+            # The server has already reset the board for the next game
+            self.stats.games += 1
+            self.heights = [0] * game_logic.COLUMNS
+            if self.token == game_logic.PLAYER1:
+                self.play(sel)
+            return
+        if update["turn"] == self.token:
+            self.play(sel)
+
+    def fail(self, sel, error):
+        self.stats.errors[error] += 1
+        self.finish(sel)
+
+    def finish(self, sel):
+        if self.done:
+            return
+        self.done = True
+        sel.unregister(self.sock)
+        self.sock.close()
+
+
+def board_heights(board):
+    return [sum(row[col] != game_logic.EMPTY for row in board) for col in range(game_logic.COLUMNS)]
+
+
+def raise_open_file_limit():
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(module, port, clients, ai_workers, workers=None, ponder_budget=None):
+    """Start server.py, async_server.py or supervisor.py on localhost with room for every client."""
+    limit = str(clients + 16)
+    command = [sys.executable, f"{module}.py", "127.0.0.1", str(port), "--max-connections", limit,
+               "--max-sessions", limit, "--max-per-ip", limit, "--backlog", limit]
+    if ai_workers is not None:
+        command += ["--ai-workers", str(ai_workers)]
+    if workers is not None:
+        command += ["--workers", str(workers)]
+    if ponder_budget is not None:
+        command += ["--ponder-budget", str(ponder_budget)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(command, cwd=root, stdout=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    stop_server(process)
+    raise RuntimeError(f"{module}.py did not start listening on port {port}")
+
+
+def stop_server(process):
+    # SIGINT lets the server shut its AI pool down, SIGTERM would orphan the workers
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        # SIGINT is ignored when the run was started in the background, take the workers down too
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def children_cpu():
+    """CPU seconds of the child processes reaped so far, None where resource is missing.
+
+    A spawned server counts once stop_server() has waited for it, with the
+    AI pool workers it waited for on shutdown.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def make_clients(count, pvp_ratio, difficulties, num_wins, stats, mode, think=0.0):
+    pvp = int(count * pvp_ratio) & ~1  # Opponents come in pairs
+    game_types = ["1"] * pvp + ["2"] * (count - pvp)
+    random.shuffle(game_types)
+    return [LoadClient(index, game_type, random.choice(difficulties), num_wins, stats, mode, think)
+            for index, game_type in enumerate(game_types)]
+
+
+def run(addr, count, pvp_ratio, difficulties, num_wins, ramp, timeout, mode=protocol.DELTA, think=0.0):
+    stats = Stats()
+    load_clients = make_clients(count, pvp_ratio, difficulties, num_wins, stats, mode, think)
+    sel = selectors.DefaultSelector()
+    started = 0
+    start = time.perf_counter()
+    deadline = start + timeout
+
+    while time.perf_counter() < deadline:
+        # Open connections at the ramp rate
+        due = count if ramp <= 0 else min(count, int((time.perf_counter() - start) * ramp) + 1)
+        while started < due:
+            load_clients[started].start(sel, addr)
+            started += 1
+        if started == count and not sel.get_map():
+            break
+        for key, mask in sel.select(timeout=0.05):
+            load_client = key.data
+            if not load_client.connected:
+                load_client.on_connected(sel)
+                continue
+            if mask & selectors.EVENT_READ:
+                load_client.on_readable(sel)
+            if mask & selectors.EVENT_WRITE and not load_client.done:
+                load_client.send(sel, b"")
+        if stats.thinking:
+            now = time.perf_counter()
+            thought = [load_client for load_client in stats.thinking if load_client.play_at <= now]
+            stats.thinking = [load_client for load_client in stats.thinking if load_client.play_at > now]
+            for load_client in thought:
+                if not load_client.done:
+                    load_client.send_move(sel)
+    elapsed = time.perf_counter() - start
+
+    unfinished = [load_client for load_client in load_clients if not load_client.done]
+    for load_client in unfinished:
+        if load_client.sock is not None:
+            load_client.fail(sel, "unfinished")
+    sel.close()
+    report(stats, count, elapsed)
+    return stats
+
+
+def report(stats, count, elapsed):
+    connect_times = sorted(stats.connect_times)
+    latencies = sorted(stats.latencies)
+    print(f"clients            {count} ({len(connect_times)} connected)")
+    print(f"elapsed            {elapsed:.2f} s")
+    print(f"moves              {stats.moves} ({stats.moves / elapsed:.0f} moves/s)")
+    print(f"games finished     {stats.games}, series finished {stats.series}")
+    print(f"queued by server   {stats.queued}")
+    print(f"connect ms         p50 {percentile(connect_times, 0.5) * 1000:.2f}  "
+          f"p95 {percentile(connect_times, 0.95) * 1000:.2f}  p99 {percentile(connect_times, 0.99) * 1000:.2f}")
+    print(f"move latency ms    p50 {percentile(latencies, 0.5) * 1000:.2f}  "
+          f"p95 {percentile(latencies, 0.95) * 1000:.2f}  p99 {percentile(latencies, 0.99) * 1000:.2f}")
+    errors = ", ".join(f"{error} {number}" for error, number in stats.errors.most_common()) or "none"
+    print(f"errors             {errors}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scripted load against the Connect 4 server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--spawn", choices=("server", "async_server", "supervisor"),
+                        help="start this server on a free localhost port for the run")
+    parser.add_argument("--ai-workers", type=int, help="passed to the spawned server")
+    parser.add_argument("--workers", type=int, help="server processes when spawning the supervisor")
+    parser.add_argument("--ponder-budget", type=float, help="passed to the spawned server")
+    parser.add_argument("--clients", type=int, default=DEFAULT_CLIENTS)
+    parser.add_argument("--pvp-ratio", type=float, default=0.5, help="share of clients that play each other")
+    parser.add_argument("--difficulties", nargs="+", default=["easy", "hard"],
+                        help="AI difficulties, picked at random per AI client")
+    parser.add_argument("--wins", type=int, default=1, help="wins to take an AI series")
+    parser.add_argument("--ramp", type=float, default=DEFAULT_RAMP,
+                        help="new connections per second, 0 opens them all at once")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument("--mode", choices=(protocol.DELTA, protocol.BINARY), default=protocol.DELTA,
+                        help="get one delta per move or the whole board with every update")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds each client waits before a move")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.spawn is None and args.port is None:
+        parser.error("give --port of a running server or --spawn one")
+
+    random.seed(args.seed)
+    raise_open_file_limit()
+    server_process = None
+    if args.spawn is not None:
+        args.host, args.port = "127.0.0.1", free_port()
+        cpu_before = children_cpu()
+        server_process = spawn_server(args.spawn, args.port, args.clients, args.ai_workers, args.workers,
+                                      args.ponder_budget)
+    try:
+        run((args.host, args.port), args.clients, args.pvp_ratio, args.difficulties, args.wins,
+            args.ramp, args.timeout, args.mode, args.think)
+    finally:
+        if server_process is not None:
+            stop_server(server_process)
+            if cpu_before is not None:
+                print(f"server cpu         {children_cpu() - cpu_before:.2f} s, with start-up and shutdown")
@@ -8,6 +8,8 @@ import types
 import sys
 import threading
 import time
+import game_logic
+import protocol
 
 
 sel = selectors.DefaultSelector()
@@ -15,18 +17,23 @@ sel = selectors.DefaultSelector()
 
 def get_player_choice():
     print("Welcome to Connect 4!")
-    print("Do you want to play against (1) another player or (2) the AI?")
-    game_type = input("Enter 1 for another player, 2 for AI: ").strip()
+    print("Do you want to play against (1) another player or (2) the AI, (3) watch a game or (4) resume a game?")
+    game_type = input("Enter 1 for another player, 2 for AI, 3 to watch, 4 to resume: ").strip()
 
     ai_difficulty = None
     num_wins = None
 
+    if game_type == "4":
+        # The token the server sent when the game started, passed on as ai_difficulty
+        ai_difficulty = input("Enter your resume token: ").strip()
+
     if game_type == "2":
         print("Select AI difficulty level:")
         print("1: Easy")
         print("2: Hard")
-        difficulty_choice = input("Enter difficulty level (1-2): ").strip()
-        ai_difficulty = "easy" if difficulty_choice == "1" else "hard"
+        print("3: Expert")
+        difficulty_choice = input("Enter difficulty level (1-3): ").strip()
+        ai_difficulty = {"1": "easy", "3": "expert"}.get(difficulty_choice, "hard")
 
         invalid_count = 0
         suspension_duration = 60  # Initial suspension duration in seconds
@@ -51,14 +58,46 @@ def get_player_choice():
     return game_type, ai_difficulty, num_wins
     
 
-def create_request(action, value="", extra="", num_wins=""):
+def create_request(action, value="", extra="", num_wins="", mode=protocol.TEXT):
     if action == "start_game":
-        return f"START_GAME {value} {extra} {num_wins}".encode('utf-8')
+        if mode == protocol.BINARY:
+            # The newline marks where the switch to framed messages happens
+            return f"START_GAME {value} {extra} {num_wins} BINARY\n".encode('utf-8')
+        if mode == protocol.DELTA:
+            return f"START_GAME {value} {extra} {num_wins} BINARY DELTA\n".encode('utf-8')
+        return f"START_GAME {value} {extra} {num_wins}\n".encode('utf-8')
     elif action == "move":
-        return f"MOVE {value}".encode('utf-8')
+        if mode != protocol.TEXT:
+            return protocol.move_frame(int(value))
+        return f"MOVE {value}\n".encode('utf-8')
+    elif action == "spectate":
+        # value is a session id, empty to watch the most popular game
+        if mode == protocol.BINARY:
+            return f"SPECTATE {value} BINARY\n".encode('utf-8')
+        if mode == protocol.DELTA:
+            return f"SPECTATE {value} BINARY DELTA\n".encode('utf-8')
+        return f"SPECTATE {value}\n".encode('utf-8')
+    elif action == "resume":
+        # value is the resume token the server sent when the player took its seat
+        if mode == protocol.BINARY:
+            return f"RESUME {value} BINARY\n".encode('utf-8')
+        if mode == protocol.DELTA:
+            return f"RESUME {value} BINARY DELTA\n".encode('utf-8')
+        return f"RESUME {value}\n".encode('utf-8')
+    elif action == "snapshot":
+        if mode != protocol.TEXT:
+            return protocol.text_frame("SNAPSHOT")
+        return b"SNAPSHOT\n"
     return None
 
-def start_connection(host, port, game_type, ai_difficulty, num_wins):
+def first_request(game_type, ai_difficulty, num_wins, mode):
+    if game_type == "3":
+        return create_request("spectate", mode=mode)
+    if game_type == "4":
+        return create_request("resume", ai_difficulty, mode=mode)
+    return create_request("start_game", game_type, ai_difficulty, num_wins, mode)
+
+def start_connection(host, port, game_type, ai_difficulty, num_wins, mode=protocol.DELTA):
     server_addr = (host, port)
     print(f"Starting connection to {server_addr}")
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -70,8 +109,13 @@ def start_connection(host, port, game_type, ai_difficulty, num_wins):
         connid=1,
         msg_total=0,
         recv_total=0,
-        messages=[create_request("start_game", game_type, ai_difficulty, num_wins)],
+        messages=[first_request(game_type, ai_difficulty, num_wins, mode)],
         outb=b"",
+        inb=b"",
+        mode=mode,
+        board=game_logic.create_board().to_rows(),  # Copy of the board kept up to date from deltas
+        seq=0,
+        awaiting_snapshot=False,
     )
     print(f"Message queued to be sent: {data.messages[0]}")
     sel.register(sock, events, data=data)
@@ -120,6 +164,10 @@ def handle_server_response(response, data):
                 # The game has ended, but the series may continue
                 # Continue reading the response to check for win counts and series winner
 
+        # Handle clock updates of a server that plays on the clock
+        if "Time left:" in line:
+            print(line.strip())
+
         # Handle win count updates
         if "Player wins:" in line:
             win_counts = line.split("Player wins:")[1].strip()
@@ -142,13 +190,94 @@ def handle_server_response(response, data):
             print("Invalid move. Try again.")
 
 
+def handle_binary_message(payload, data):
+    message_type = payload[0]
+    if message_type == protocol.MSG_TEXT:
+        handle_server_response(payload[1:].decode('utf-8'), data)
+    elif message_type == protocol.MSG_READY:
+        token = protocol.CODE_TOKENS[payload[1]]
+        print(f"Both players connected. The game starts now. You play {token}.")
+    elif message_type == protocol.MSG_UPDATE:
+        update = protocol.decode_update(payload)
+        if update["ai_column"] is not None:
+            print(f"AI made a move in column {update['ai_column']}.")
+        print_board(update["board"])
+        print_status(update)
+    elif message_type == protocol.MSG_DELTA:
+        handle_delta(protocol.decode_delta(payload), data)
+    elif message_type == protocol.MSG_SNAPSHOT:
+        snapshot = protocol.decode_snapshot(payload)
+        data.board, data.seq, data.awaiting_snapshot = snapshot["board"], snapshot["seq"], False
+        print_board(data.board)
+        print_status(dict(snapshot, series=protocol.SERIES_NONE))
+    elif message_type == protocol.MSG_STATUS:
+        handle_status(protocol.decode_status(payload), data)
+
+def handle_delta(delta, data):
+    """Apply one move to the local board, asking for a snapshot if one went missing."""
+    if data.awaiting_snapshot or delta["seq"] <= data.seq:
+        return  # The snapshot on its way already has this move
+    if delta["seq"] != data.seq + 1:
+        print("Missed an update, asking the server for the whole board.")
+        data.awaiting_snapshot = True
+        data.messages.append(create_request("snapshot", mode=data.mode))
+        return
+    data.seq = delta["seq"]
+    data.board[delta["row"]][delta["column"]] = delta["token"]
+    print(f"{delta['token']} played column {delta['column']}.")
+    print_board(data.board)
+    if delta["status"] != protocol.STATUS_ONGOING:
+        data.board = game_logic.create_board().to_rows()  # The next game starts empty
+    print_status(delta)
+
+def handle_status(status, data):
+    """A game that ended without a move, on a timeout. The next one starts on an empty board."""
+    data.seq = max(data.seq, status["seq"])
+    if status["status"] != protocol.STATUS_ONGOING:
+        data.board = game_logic.create_board().to_rows()
+    print_status(status)
+
+def print_board(board):
+    print("Current board state:")
+    for row in board:
+        print('|'.join(row))
+
+def print_clock(clock):
+    def seconds(left):
+        return "no limit" if left is None else f"{left:.1f}s"
+    player1, player2, move = clock
+    line = f"Time left: {game_logic.PLAYER1} {seconds(player1)}, {game_logic.PLAYER2} {seconds(player2)}"
+    print(line + (f", this move {seconds(move)}" if move is not None else ""))
+
+def print_status(update):
+    status = update["status"]
+    if update.get("clock") is not None:
+        print_clock(update["clock"])
+    if status == protocol.STATUS_ONGOING:
+        print(f"Game status: ONGOING, {update['turn']} to move")
+    else:
+        result = "DRAW" if status == protocol.STATUS_DRAW else f"WIN {protocol.WINNER_TOKENS[status]}"
+        print(f"Game over: {result}")
+        print(f"Current win counts: {update['player_wins']}, AI wins: {update['ai_wins']}")
+    if update["series"] != protocol.SERIES_NONE:
+        series_winner = "PLAYER" if update["series"] == protocol.SERIES_PLAYER else "AI"
+        print(f"Series winner: {series_winner}")
+        sys.exit(0)
+
 def service_connection(key, mask):
     sock = key.fileobj
     data = key.data
     if mask & selectors.EVENT_READ:
         try:
             recv_data = sock.recv(1024)
-            if recv_data:
+            if recv_data and data.mode != protocol.TEXT:
+                data.inb += recv_data
+                while True:
+                    payload, data.inb = protocol.split_frame(data.inb)
+                    if payload is None:
+                        break
+                    handle_binary_message(payload, data)
+            elif recv_data:
                 response = recv_data.decode('utf-8')
                 print(f"Received: {response}")
                 handle_server_response(response, data)
@@ -164,7 +293,7 @@ def service_connection(key, mask):
             sys.exit(0)
     if mask & selectors.EVENT_WRITE and data.messages:
         data.outb = data.messages.pop(0)
-        print(f"Sending: {data.outb.decode('utf-8')}")
+        print(f"Sending: {data.outb!r}")
         sock.send(data.outb)
 
 def user_input_thread(data):
@@ -175,14 +304,14 @@ def user_input_thread(data):
             sel.close()  # Close the selector to trigger closing the main event loop
             sys.exit(0)  # Exit the client application
         elif user_input.isdigit():
-            action = create_request("move", user_input) 
+            action = create_request("move", user_input, mode=data.mode)
             data.messages.append(action)
-            print(f"Move queued to be sent: {action.decode('utf-8')}")
+            print(f"Move queued to be sent: {action!r}")
         else:
             print("Invalid input. Please enter a valid column number or 'q' to quit.")
 
-def main(host, port, game_type, ai_difficulty, num_wins):
-    data = start_connection(host, port, game_type, ai_difficulty, num_wins)
+def main(host, port, game_type, ai_difficulty, num_wins, mode=protocol.DELTA):
+    data = start_connection(host, port, game_type, ai_difficulty, num_wins, mode)
     input_thread = threading.Thread(target=user_input_thread, args=(data,), daemon=True)
     input_thread.start()
 
@@ -200,10 +329,11 @@ def main(host, port, game_type, ai_difficulty, num_wins):
         sel.close()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("usage:", sys.argv[0], "<host> <port>")
+    if len(sys.argv) not in (3, 4) or sys.argv[3:] not in ([], [protocol.TEXT], [protocol.BINARY], [protocol.DELTA]):
+        print("usage:", sys.argv[0], "<host> <port> [delta|binary|text]")
         sys.exit(1)
 
     game_type, ai_difficulty, num_wins = get_player_choice()
     host, port = sys.argv[1], int(sys.argv[2])
-    main(host, port, game_type, ai_difficulty, num_wins)
+    mode = sys.argv[3] if len(sys.argv) == 4 else protocol.DELTA
+    main(host, port, game_type, ai_difficulty, num_wins, mode)
@@ -2,12 +2,45 @@
 # Student's ID: 316172410
 
 import random
+import time
 import game_logic  
+import game_search
+import game_threats
+import opening_book
+import position_cache
+
+DIFFICULTIES = ("easy", "hard", "expert")
+book = None  # OpeningBook used by the expert AI, see load_opening_book()
+
+# AI decisions of every session in the process, by (kind, Board.canonical_key()).
+# Columns are stored for the canonical orientation, NO_COLUMN if there is no move.
+decisions = position_cache.PositionCache()
+FORCED, EXPERT = 0, 1
+NO_COLUMN = -1
+
+def load_opening_book(path=opening_book.DEFAULT_PATH):
+    global book
+    book = opening_book.OpeningBook(path)
+    return book
+
+# Shared multiprocessing.Value the server bumps to stop pondering, see ponder_ai_move()
+ponder_generation = None
+# Shared multiprocessing.Value, the server's real moves with a ticket up to it give up, see compute_ai_move()
+move_cutoff = None
+
+# Run once in every AI worker process
+def init_ai_worker(book_path=None, generation=None, cutoff=None):
+    global ponder_generation, move_cutoff
+    ponder_generation = generation
+    move_cutoff = cutoff
+    if book_path:
+        load_opening_book(book_path)
 
 def random_ai_move(board):
     
+    board = game_logic.as_board(board)
     # Find columns that are not full
-    valid_columns = [col for col in range(len(board[0])) if board[0][col] == game_logic.EMPTY]
+    valid_columns = [col for col in range(game_logic.COLUMNS) if board.can_play(col)]
     # Pick a random column from the list of valid columns
     if valid_columns:
         return random.choice(valid_columns)
@@ -15,35 +48,153 @@ def random_ai_move(board):
         return None
 
 def find_winning_move(board, player_token):
-    for col in range(len(board[0])):
-        temp_board = [row[:] for row in board]  # Create a copy of the board
-        for row in range(len(board) - 1, -1, -1):
-            if temp_board[row][col] == game_logic.EMPTY:
-                temp_board[row][col] = player_token
-                if game_logic.check_win(temp_board, player_token):
-                    return col
-                break
+    board = game_logic.as_board(board)
+    for col in range(game_logic.COLUMNS):
+        # Try the move in place and take it back, no board copies needed
+        row = board.play(col, player_token)
+        if row is not None:
+            won = board.has_won_at(row, col, player_token)
+            board.undo()
+            if won:
+                return col
     return None
 
-def algorithmic_ai_move(board):
+def forced_move(board):
+    # The AI plays whichever side is to move (PLAYER2 in server games)
+    ai_token = board.current_token
+    player_token = game_logic.PLAYER1 if ai_token == game_logic.PLAYER2 else game_logic.PLAYER2
+
     # First, check if AI can win in the next move
-    winning_move = find_winning_move(board, game_logic.PLAYER2)
+    winning_move = find_winning_move(board, ai_token)
     if winning_move is not None:
         return winning_move
     
     # Next, check to block the player's winning move
-    player_win_move = find_winning_move(board, game_logic.PLAYER1)
-    if player_win_move is not None:
-        return player_win_move
+    return find_winning_move(board, player_token)
+
+def likely_replies(board):
+    """Columns the player to move is most likely to play, best guesses first.
+
+    A winning move or a block comes first, then the columns nearest the centre.
+    """
+    board = game_logic.as_board(board)
+    token = board.current_token
+    other = game_logic.PLAYER1 if token == game_logic.PLAYER2 else game_logic.PLAYER2
+    columns = [find_winning_move(board, token), find_winning_move(board, other)] + list(game_search.MOVE_ORDER)
+    return [col for col in dict.fromkeys(columns) if col is not None and board.can_play(col)]
+
+# The hard AI before game_threats, still played in tournament.py as "algorithmic"
+def algorithmic_ai_move(board):
+    board = game_logic.as_board(board)
+    forced = decide(FORCED, board, forced_move)
+    if forced is not None:
+        return forced
 
     # As a fallback, make a random move
     return random_ai_move(board)
 
 
-def ai_move(board, difficulty):
+def expert_ai_move(board, time_budget=game_search.DEFAULT_TIME_BUDGET):
+    board = game_logic.as_board(board)
+    # Early positions are answered straight from the book, no search needed
+    if book is not None:
+        book_move = book.lookup(board)
+        if book_move is not None:
+            return book_move
+    return decide(EXPERT, board, lambda position: game_search.expert_ai_move(position, time_budget))
+
+
+def mirror_column(column):
+    return game_logic.COLUMNS - 1 - column
+
+def cached_decision(kind, board):
+    """The cached column for the position or its mirror image, NO_COLUMN, or None if nothing is cached."""
+    key, mirrored = board.canonical_key()
+    column = decisions.get((kind, key))
+    if column is None or column == NO_COLUMN:
+        return column
+    if mirrored:
+        column = mirror_column(column)
+    # A hash collision could hand back a full column
+    return column if board.can_play(column) else None
+
+def remember_decision(kind, board, column):
+    key, mirrored = board.canonical_key()
+    if column is None:
+        column = NO_COLUMN
+    elif mirrored:
+        column = mirror_column(column)
+    decisions.put((kind, key), column)
+
+def decide(kind, board, compute):
+    """compute(board) served from the cache when the position or its mirror image came up before."""
+    column = cached_decision(kind, board)
+    if column is None:
+        column = compute(board)
+        remember_decision(kind, board, column)
+        return column
+    return None if column == NO_COLUMN else column
+
+def cached_ai_move(board, difficulty):
+    """The expert AI's move if it can be answered without a search, None otherwise.
+
+    Lets the server skip the trip to the process pool for positions any
+    session has seen before.
+    """
+    if difficulty != "expert":
+        return None
+    if book is not None:
+        book_move = book.lookup(board)
+        if book_move is not None:
+            return book_move
+    column = cached_decision(EXPERT, board)
+    return None if column == NO_COLUMN else column
+
+
+# threats is the game_threats.ThreatCounts a session keeps for the hard AI
+def ai_move(board, difficulty, threats=None):
     if difficulty == "easy":
         return random_ai_move(board)
     elif difficulty == "hard":
-        return algorithmic_ai_move(board)
+        return game_threats.threat_ai_move(board, threats)
+    elif difficulty == "expert":
+        return expert_ai_move(board)
     else:
         raise ValueError("Unknown difficulty level")
+
+# Entry point for AI worker processes, takes the compact Board.state() form
+def compute_ai_move(board_state, difficulty, ticket=None):
+    """The AI's move, None if the server moved move_cutoff up to ticket before the expert search was done."""
+    board = game_logic.Board.from_state(board_state)
+    if difficulty != "expert" or ticket is None or move_cutoff is None:
+        return ai_move(board, difficulty)
+    stop = lambda: move_cutoff.value >= ticket
+    column = cached_ai_move(board, difficulty)
+    if column is None and not stop():
+        column = game_search.expert_ai_move(board, stop=stop)
+        if column is not None:  # A search that was stopped isn't cached
+            remember_decision(EXPERT, board, column)
+    return column
+
+def ponder_ai_move(board_state, generation):
+    """Expert move for a position the player may reach, searched ahead of time.
+
+    Returns (column, CPU seconds used). The column is None when the server
+    moved ponder_generation on from generation before the search was done.
+    """
+    started = time.process_time()
+    board = game_logic.Board.from_state(board_state)
+    stop = None
+    if ponder_generation is not None:
+        stop = lambda: ponder_generation.value != generation
+        if stop():
+            return None, 0.0
+    column = cached_decision(EXPERT, board)
+    if column is None:
+        column = game_search.expert_ai_move(board, stop=stop)
+        if column is None:
+            return None, time.process_time() - started
+        remember_decision(EXPERT, board, column)
+    elif column == NO_COLUMN:
+        column = None
+    return column, time.process_time() - started
@@ -4,61 +4,301 @@
 
 ROWS, COLUMNS = 6, 7
 EMPTY, PLAYER1, PLAYER2 = " ", "X", "O"
+TOKENS = (PLAYER1, PLAYER2)
+
+# Bitboard layout: every column takes ROWS + 1 bits, bit 0 of a column is its
+# bottom cell and the extra top bit is a sentinel that is never set, so shifting
+# a whole board left or right can't wrap a line from one column into the next.
+#
+#   6 13 20 27 34 41 48   <- sentinel row
+#   5 12 19 26 33 40 47
+#   4 11 18 25 32 39 46
+#   3 10 17 24 31 38 45
+#   2  9 16 23 30 37 44
+#   1  8 15 22 29 36 43
+#   0  7 14 21 28 35 42
+COLUMN_HEIGHT = ROWS + 1
+BOARD_SIZE = ROWS * COLUMNS
+_TOKEN_INDEX = {PLAYER1: 0, PLAYER2: 1}
+
+# Zobrist keys, one random 64-bit number per token and cell. A board's hash
+# is the xor of the keys of its stones, kept up to date by play() and undo().
+# The mirror hash uses the key of the cell mirrored left to right, so a
+# position and its mirror image get each other's hash. Both are kept in one
+# int, the mirror hash in the high 64 bits, so a move costs a single xor.
+# The seed is fixed so every process agrees on the hashes.
+def _zobrist_keys(seed=0x5EED_C4):
+    state = seed
+    keys = []
+    for _ in range(2 * COLUMNS * COLUMN_HEIGHT):
+        # splitmix64, enough to spread the bits and no need for the random module
+        state = (state + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        value = state
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        keys.append(value ^ (value >> 31))
+    size = COLUMNS * COLUMN_HEIGHT
+    return keys[:size], keys[size:]
+
+ZOBRIST = _zobrist_keys()
+HASH_MASK = (1 << 64) - 1
+
+
+def _with_mirror_keys(keys):
+    return [key | keys[(COLUMNS - 1 - bit // COLUMN_HEIGHT) * COLUMN_HEIGHT + bit % COLUMN_HEIGHT] << 64
+            for bit, key in enumerate(keys)]
+
+_ZOBRIST_PAIRS = tuple(_with_mirror_keys(keys) for keys in ZOBRIST)
+
+# Text of every possible row for Board.to_text(), keyed by the row's bits of
+# both bitboards shifted down to the bottom row: PLAYER1's bits as they are,
+# PLAYER2's one bit up. Bit 0 of a column is free for PLAYER1 and the bit
+# above it is the sentinel, so the two never overlap.
+_ROW_MASK = sum(1 << (col * COLUMN_HEIGHT) for col in range(COLUMNS))
+
+
+def _row_texts():
+    texts = {}
+    for code in range(3 ** COLUMNS):
+        key, cells = 0, []
+        for col in range(COLUMNS):
+            code, cell = divmod(code, 3)
+            if cell:
+                key |= 1 << (col * COLUMN_HEIGHT + cell - 1)
+            cells.append((EMPTY, PLAYER1, PLAYER2)[cell])
+        texts[key] = "|".join(cells)
+    return texts
+
+_ROW_TEXTS = _row_texts()
+
+
+def _has_four(bitboard):
+    # One shift-and-mask per direction: vertical, horizontal and both diagonals
+    for shift in (1, COLUMN_HEIGHT, COLUMN_HEIGHT - 1, COLUMN_HEIGHT + 1):
+        pairs = bitboard & (bitboard >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+class Board:
+    """Connect 4 position stored as one bitboard per player plus column heights.
+
+    Rows are indexed from the top like the old list-of-lists board, so
+    ``board[row][col]``, ``len(board)`` and iterating over rows still work for
+    code that only reads the grid.
+    """
+
+    __slots__ = ("bitboards", "heights", "moves", "history", "hashes")
+
+    def __init__(self):
+        self.bitboards = [0, 0]
+        # Next free bit of every column
+        self.heights = [col * COLUMN_HEIGHT for col in range(COLUMNS)]
+        self.moves = 0
+        self.history = []
+        self.hashes = 0  # Zobrist hash of the position, and of its mirror image above bit 64
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a board from a list-of-lists grid (row 0 is the top row)."""
+        board = cls()
+        for col in range(COLUMNS):
+            for row in range(ROWS - 1, -1, -1):
+                token = rows[row][col]
+                if token == EMPTY:
+                    break
+                board.play(col, token)
+        return board
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a board from the (bitboard, bitboard) pair returned by state()."""
+        board = cls()
+        board.bitboards = list(state)
+        mask = state[0] | state[1]
+        for col in range(COLUMNS):
+            height = (mask >> (col * COLUMN_HEIGHT) & ((1 << ROWS) - 1)).bit_count()
+            board.heights[col] += height
+            board.history.extend([col] * height)
+        board.moves = len(board.history)
+        for index, bitboard in enumerate(state):
+            while bitboard:
+                bit_index = (bitboard & -bitboard).bit_length() - 1
+                board.hashes ^= _ZOBRIST_PAIRS[index][bit_index]
+                bitboard &= bitboard - 1
+        return board
+
+    def state(self):
+        """Compact picklable form of the position, e.g. to send it to another process."""
+        return (self.bitboards[0], self.bitboards[1])
+
+    def copy(self):
+        board = Board.__new__(Board)
+        board.bitboards = self.bitboards[:]
+        board.heights = self.heights[:]
+        board.moves = self.moves
+        board.history = self.history[:]
+        board.hashes = self.hashes
+        return board
+
+    @property
+    def hash(self):
+        return self.hashes & HASH_MASK
+
+    @property
+    def mirror_hash(self):
+        return self.hashes >> 64
+
+    def canonical_key(self):
+        """Key shared by the position and its mirror image, and whether this board is the mirrored one.
+
+        The hashes leave out whose turn it is, which follows from the
+        number of stones in a game where the players alternate.
+        """
+        position, mirror = self.hashes & HASH_MASK, self.hashes >> 64
+        if mirror < position:
+            return mirror, True
+        return position, False
+
+    @property
+    def current_token(self):
+        """Token of the player whose turn it is, assuming PLAYER1 moved first."""
+        return TOKENS[self.moves & 1]
+
+    def can_play(self, column):
+        return self.heights[column] < column * COLUMN_HEIGHT + ROWS
+
+    def play(self, column, player_token):
+        """Drop a token in the column and return the row it landed on.
+
+        Returns None if the column is full.
+        """
+        bit_index = self.heights[column]
+        bottom = column * COLUMN_HEIGHT
+        if bit_index >= bottom + ROWS:
+            return None
+        index = _TOKEN_INDEX[player_token]
+        self.bitboards[index] |= 1 << bit_index
+        self.hashes ^= _ZOBRIST_PAIRS[index][bit_index]
+        self.heights[column] = bit_index + 1
+        self.moves += 1
+        self.history.append(column)
+        return ROWS - 1 - (bit_index - bottom)
+
+    def undo(self):
+        """Take back the last move played."""
+        column = self.history.pop()
+        bit_index = self.heights[column] - 1
+        self.heights[column] = bit_index
+        bit = 1 << bit_index
+        index = 0 if self.bitboards[0] & bit else 1
+        self.bitboards[index] &= ~bit
+        self.hashes ^= _ZOBRIST_PAIRS[index][bit_index]
+        self.moves -= 1
+
+    def has_won(self, player_token):
+        return _has_four(self.bitboards[_TOKEN_INDEX[player_token]])
+
+    def has_won_at(self, row, column, player_token):
+        """Check only the four lines through the given cell."""
+        bitboard = self.bitboards[_TOKEN_INDEX[player_token]]
+        bit_index = column * COLUMN_HEIGHT + ROWS - 1 - row
+        for shift in (1, COLUMN_HEIGHT, COLUMN_HEIGHT - 1, COLUMN_HEIGHT + 1):
+            count = 1
+            index = bit_index + shift
+            while count < 4 and bitboard >> index & 1:
+                count += 1
+                index += shift
+            index = bit_index - shift
+            while count < 4 and index >= 0 and bitboard >> index & 1:
+                count += 1
+                index -= shift
+            if count >= 4:
+                return True
+        return False
+
+    def is_full(self):
+        return self.moves == BOARD_SIZE
+
+    def cell(self, row, column):
+        bit = 1 << (column * COLUMN_HEIGHT + ROWS - 1 - row)
+        if self.bitboards[0] & bit:
+            return PLAYER1
+        if self.bitboards[1] & bit:
+            return PLAYER2
+        return EMPTY
+
+    def to_text(self):
+        """The grid as rows of cells joined by "|", top row first, one line per row."""
+        player1, player2 = self.bitboards
+        return "\n".join([_ROW_TEXTS[player1 >> height & _ROW_MASK | (player2 >> height & _ROW_MASK) << 1]
+                          for height in range(ROWS - 1, -1, -1)])
+
+    def to_rows(self):
+        """Return the position as a fresh list-of-lists grid."""
+        return [self[row] for row in range(ROWS)]
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += ROWS
+        if not 0 <= row < ROWS:
+            raise IndexError("board row out of range")
+        return [self.cell(row, col) for col in range(COLUMNS)]
+
+    def __len__(self):
+        return ROWS
+
+    def __iter__(self):
+        for row in range(ROWS):
+            yield self[row]
+
+
+# Accept both a Board and an old list-of-lists grid
+def as_board(board):
+    if isinstance(board, Board):
+        return board
+    return Board.from_rows(board)
 
 # Initialize the game board
 def create_board():
-    return [[EMPTY for _ in range(COLUMNS)] for _ in range(ROWS)]
+    return Board()
 
 # Print the game board (simple CLI interface)
 def print_board(board):
     for row in board:
         print('|' + '|'.join(row) + '|')
 
-# Make a move on the board
+# Make a move on the board, return the row the token landed on
 def make_move(board, column, player_token):
-    for row in reversed(board):
-        if row[column] == EMPTY:
-            row[column] = player_token
-            return True  # Move was successful
-    return False  # Column is full, move was not made
+    if isinstance(board, Board):
+        return board.play(column, player_token)
+    for row in range(len(board) - 1, -1, -1):
+        if board[row][column] == EMPTY:
+            board[row][column] = player_token
+            return row  # Move was successful
+    return None  # Column is full, move was not made
 
 # Check if the current player has won
 def check_win(board, player_token):
-    # Check horizontal
-    for row in range(ROWS):
-        for col in range(COLUMNS - 3):
-            if board[row][col] == player_token and board[row][col + 1] == player_token \
-               and board[row][col + 2] == player_token and board[row][col + 3] == player_token:
-                return True
-
-    # Check vertical
-    for col in range(COLUMNS):
-        for row in range(ROWS - 3):
-            if board[row][col] == player_token and board[row + 1][col] == player_token \
-               and board[row + 2][col] == player_token and board[row + 3][col] == player_token:
-                return True
-
-    # Check diagonals with positive slope
-    for col in range(COLUMNS - 3):
-        for row in range(3, ROWS):
-            if board[row][col] == player_token and board[row - 1][col + 1] == player_token \
-               and board[row - 2][col + 2] == player_token and board[row - 3][col + 3] == player_token:
-                return True
-
-    # Check diagonals with negative slope
-    for col in range(COLUMNS - 3):
-        for row in range(ROWS - 3):
-            if board[row][col] == player_token and board[row + 1][col + 1] == player_token \
-               and board[row + 2][col + 2] == player_token and board[row + 3][col + 3] == player_token:
-                return True
+    return as_board(board).has_won(player_token)
 
+# Check if the token just dropped at (row, col) completed a line of four
+def check_win_at(board, row, col, player_token):
+    if isinstance(board, Board):
+        return board.has_won_at(row, col, player_token)
+    for row_step, col_step in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        count = 1
+        for direction in (1, -1):
+            r, c = row + row_step * direction, col + col_step * direction
+            while 0 <= r < ROWS and 0 <= c < COLUMNS and board[r][c] == player_token:
+                count += 1
+                r += row_step * direction
+                c += col_step * direction
+        if count >= 4:
+            return True
     return False
 
 def is_draw(board):
-    # Check if any cell in the board is still empty, indicating the game is not a draw
-    for row in board:
-        if EMPTY in row:
-            return False
-    # If the board is full and no win condition is met, it's a draw
-    return True
-
+    # A full board with no win condition met is a draw
+    return as_board(board).is_full()
@@ -0,0 +1,151 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Evaluate many positions at once with NumPy.
+
+Positions are (N, 6, 7) int8 arrays with row 0 at the top, like the
+list-of-lists board, and cells holding EMPTY_CODE, PLAYER1_CODE or
+PLAYER2_CODE. Internally they are turned into N pairs of uint64 bitboards
+and every check is a handful of array-wide shifts and masks. The scalar
+functions in game_logic and game_ai stay the reference, every function
+here answers the same question for N positions.
+"""
+
+import numpy as np
+import game_logic
+
+EMPTY_CODE, PLAYER1_CODE, PLAYER2_CODE = 0, 1, 2
+TOKEN_CODES = {game_logic.EMPTY: EMPTY_CODE, game_logic.PLAYER1: PLAYER1_CODE, game_logic.PLAYER2: PLAYER2_CODE}
+NO_COLUMN = -1
+
+# Bit index of every cell in the bitboard layout of game_logic.Board
+_CELL_BITS = np.array([[col * game_logic.COLUMN_HEIGHT + game_logic.ROWS - 1 - row
+                        for col in range(game_logic.COLUMNS)]
+                       for row in range(game_logic.ROWS)], dtype=np.uint64)
+_BOTTOM_MASK = np.uint64(sum(1 << (col * game_logic.COLUMN_HEIGHT) for col in range(game_logic.COLUMNS)))
+_BOARD_MASK = np.uint64(int(_BOTTOM_MASK) * ((1 << game_logic.ROWS) - 1))
+_COLUMN_MASK = np.uint64((1 << game_logic.ROWS) - 1)
+# Vertical, horizontal and both diagonals
+_DIRECTIONS = (1, game_logic.COLUMN_HEIGHT, game_logic.COLUMN_HEIGHT - 1, game_logic.COLUMN_HEIGHT + 1)
+
+
+def from_boards(boards):
+    """Stack Board objects or list-of-lists grids into an (N, 6, 7) array."""
+    if all(isinstance(board, game_logic.Board) for board in boards):
+        states = np.array([board.state() for board in boards], dtype=np.uint64).reshape(-1, 2)
+        return from_bitboards(states[:, 0], states[:, 1])
+    cells = np.zeros((len(boards), game_logic.ROWS, game_logic.COLUMNS), dtype=np.int8)
+    for index, board in enumerate(boards):
+        cells[index] = [[TOKEN_CODES[token] for token in row] for row in board]
+    return cells
+
+
+def from_bitboards(player1_bitboards, player2_bitboards):
+    """Build the cell array from N pairs of bitboards given as uint64 arrays."""
+    player1 = np.asarray(player1_bitboards, dtype=np.uint64)[:, None, None]
+    player2 = np.asarray(player2_bitboards, dtype=np.uint64)[:, None, None]
+    one = np.uint64(1)
+    cells = ((player1 >> _CELL_BITS) & one).astype(np.int8) * PLAYER1_CODE
+    cells += ((player2 >> _CELL_BITS) & one).astype(np.int8) * PLAYER2_CODE
+    return cells
+
+
+def to_bitboards(cells):
+    """Return (player1, player2) uint64 arrays in the game_logic.Board layout."""
+    weights = np.uint64(1) << _CELL_BITS
+    player1 = np.where(cells == PLAYER1_CODE, weights, np.uint64(0)).sum(axis=(1, 2), dtype=np.uint64)
+    player2 = np.where(cells == PLAYER2_CODE, weights, np.uint64(0)).sum(axis=(1, 2), dtype=np.uint64)
+    return player1, player2
+
+
+def _shift(bitboards, shift):
+    if shift >= 0:
+        return bitboards << np.uint64(shift)
+    return bitboards >> np.uint64(-shift)
+
+
+def _has_four(bitboards):
+    found = np.zeros(bitboards.shape, dtype=bool)
+    for shift in _DIRECTIONS:
+        pairs = bitboards & _shift(bitboards, -shift)
+        found |= (pairs & _shift(pairs, -2 * shift)) != 0
+    return found
+
+
+def _winning_cells(position, mask):
+    """Vectorised game_search.winning_cells on uint64 arrays."""
+    cells = _shift(position, 1) & _shift(position, 2) & _shift(position, 3)
+    for shift in _DIRECTIONS[1:]:
+        pair = _shift(position, shift) & _shift(position, 2 * shift)
+        cells |= pair & _shift(position, 3 * shift)
+        cells |= pair & _shift(position, -shift)
+        pair = _shift(position, -shift) & _shift(position, -2 * shift)
+        cells |= pair & _shift(position, shift)
+        cells |= pair & _shift(position, -3 * shift)
+    return cells & (_BOARD_MASK ^ mask)
+
+
+def _column_masks(bitboards):
+    """Bool (N, 7) array, True for every column with a bit set."""
+    columns = [(_shift(bitboards, -col * game_logic.COLUMN_HEIGHT) & _COLUMN_MASK) != 0
+               for col in range(game_logic.COLUMNS)]
+    return np.stack(columns, axis=1)
+
+
+def _own_bitboards(cells, token):
+    player1, player2 = to_bitboards(cells)
+    return (player1, player2) if token == game_logic.PLAYER1 else (player2, player1)
+
+
+def win_flags(cells, token):
+    """Bool (N,) array, True where token has four in a row."""
+    own, _ = _own_bitboards(cells, token)
+    return _has_four(own)
+
+
+def draw_flags(cells):
+    """Bool (N,) array, True where the board is full, like game_logic.is_draw."""
+    return (cells != EMPTY_CODE).all(axis=(1, 2))
+
+
+def legal_move_masks(cells):
+    """Bool (N, 7) array, True for every column that isn't full."""
+    return cells[:, 0, :] == EMPTY_CODE
+
+
+def _winning_move_masks(own, other):
+    mask = own | other
+    possible = (mask + _BOTTOM_MASK) & _BOARD_MASK
+    return _column_masks(_winning_cells(own, mask) & possible)
+
+
+def winning_move_masks(cells, token):
+    """Bool (N, 7) array, True for every column where token would win right away.
+
+    Meant for positions where token hasn't already won, as in a running game.
+    """
+    own, other = _own_bitboards(cells, token)
+    return _winning_move_masks(own, other)
+
+
+def first_column(masks):
+    """Int (N,) array of the first True column of every row, NO_COLUMN if none."""
+    return np.where(masks.any(axis=1), masks.argmax(axis=1), NO_COLUMN)
+
+
+def find_winning_moves(cells, token):
+    """Vectorised game_ai.find_winning_move: the lowest winning column or NO_COLUMN."""
+    return first_column(winning_move_masks(cells, token))
+
+
+def analyse(cells, token=game_logic.PLAYER2):
+    """Everything the hard AI looks at, for N positions where token is to move."""
+    own, other = _own_bitboards(cells, token)
+    return {
+        "win": _has_four(own),
+        "opponent_win": _has_four(other),
+        "draw": draw_flags(cells),
+        "legal": legal_move_masks(cells),
+        "winning_column": first_column(_winning_move_masks(own, other)),
+        "blocking_column": first_column(_winning_move_masks(other, own)),
+    }
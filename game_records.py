@@ -0,0 +1,231 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Append-only log of finished games.
+
+File layout (little endian):
+    header  magic b"C4GL", version u16
+    records record length u16 (bytes after this field), end time u32,
+            result u8 (protocol.STATUS_*), move count u8,
+            session id, player 1, player 2 and AI difficulty as
+            u8 length + utf-8 each, then the columns packed 3 bits each
+
+Records are written in whole batches, so a crash can only cut the last
+one short. Opening the log for writing drops such a tail, and the reader
+stops at it.
+
+Usage:
+    python game_records.py stats [FILE]
+    python game_records.py dump [FILE] [--limit N]
+"""
+
+import argparse
+import collections
+import os
+import struct
+import threading
+import time
+import protocol
+
+MAGIC = b"C4GL"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sH")
+RECORD_LENGTH = struct.Struct("<H")
+RECORD_HEADER = struct.Struct("<IBB")
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "games.log")
+DEFAULT_SYNC_INTERVAL = 1.0  # Seconds between two fsyncs of the log
+READ_BUFFER = 1 << 20
+RESULT_NAMES = {protocol.STATUS_WIN_PLAYER1: "player 1 won", protocol.STATUS_WIN_PLAYER2: "player 2 won",
+                protocol.STATUS_DRAW: "draw"}
+
+GameRecord = collections.namedtuple("GameRecord", "session_id ended result player1 player2 difficulty moves")
+
+
+class GameLogError(Exception):
+    pass
+
+
+def pack_moves(columns):
+    """Pack columns 0-6 into 3 bits each, the first move in the lowest bits."""
+    packed = 0
+    for index, column in enumerate(columns):
+        packed |= column << (3 * index)
+    return packed.to_bytes((3 * len(columns) + 7) // 8, "little")
+
+
+def unpack_moves(packed, count):
+    value = int.from_bytes(packed, "little")
+    return [(value >> (3 * index)) & 7 for index in range(count)]
+
+
+def _pack_text(text):
+    encoded = str(text).encode("utf-8")[:255]
+    return bytes((len(encoded),)) + encoded
+
+
+def encode_record(session_id, result, player1, player2, difficulty, columns, ended=None):
+    body = (RECORD_HEADER.pack(int(time.time() if ended is None else ended), result, len(columns))
+            + _pack_text(session_id) + _pack_text(player1) + _pack_text(player2) + _pack_text(difficulty or "")
+            + pack_moves(columns))
+    return frame_record(body)
+
+
+def decode_record(body):
+    ended, result, count = RECORD_HEADER.unpack_from(body)
+    offset = RECORD_HEADER.size
+    texts = []
+    for _ in range(4):
+        length = body[offset]
+        texts.append(body[offset + 1:offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+    session_id, player1, player2, difficulty = texts
+    return GameRecord(session_id, ended, result, player1, player2, difficulty or None,
+                      unpack_moves(body[offset:], count))
+
+
+def frame_record(body):
+    return RECORD_LENGTH.pack(len(body)) + body
+
+
+def _check_header(log_file, path, magic=MAGIC, version=VERSION):
+    header = log_file.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        raise GameLogError(f"{path}: file too short")
+    file_magic, file_version = FILE_HEADER.unpack(header)
+    if file_magic != magic:
+        raise GameLogError(f"{path}: not a {magic.decode()} log")
+    if file_version != version:
+        raise GameLogError(f"{path}: unsupported log version {file_version}")
+
+
+def read_records(path, magic=MAGIC, version=VERSION):
+    """Yield the body of every complete record in a log, reading it in a stream."""
+    with open(path, "rb", buffering=READ_BUFFER) as log_file:
+        _check_header(log_file, path, magic, version)
+        while True:
+            prefix = log_file.read(RECORD_LENGTH.size)
+            if len(prefix) < RECORD_LENGTH.size:
+                return
+            (length,) = RECORD_LENGTH.unpack(prefix)
+            body = log_file.read(length)
+            if len(body) < length:
+                return  # Cut short by a crash
+            yield body
+
+
+def read_games(path):
+    """Yield every complete game of a log as a GameRecord."""
+    for body in read_records(path):
+        yield decode_record(body)
+
+
+def complete_length(path, magic=MAGIC, version=VERSION):
+    """Byte length of the log up to the end of its last complete record."""
+    with open(path, "rb", buffering=READ_BUFFER) as log_file:
+        _check_header(log_file, path, magic, version)
+        end = log_file.tell()
+        size = os.fstat(log_file.fileno()).st_size
+        while end + RECORD_LENGTH.size <= size:
+            log_file.seek(end)
+            (length,) = RECORD_LENGTH.unpack(log_file.read(RECORD_LENGTH.size))
+            if end + RECORD_LENGTH.size + length > size:
+                break
+            end += RECORD_LENGTH.size + length
+        return end
+
+
+class AppendLog:
+    """Writer side of a log of length-prefixed records.
+
+    append() only queues the framed record. A background thread writes the
+    queue out and fsyncs once per sync_interval, so the move path never
+    waits on the disk. Records appended since the last sync are lost if
+    the machine goes down.
+    """
+
+    def __init__(self, path, magic, version, sync_interval=DEFAULT_SYNC_INTERVAL):
+        self.path = path
+        self.sync_interval = sync_interval
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            end = complete_length(path, magic, version)
+            if end < os.path.getsize(path):
+                os.truncate(path, end)
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(magic, version))
+        self.pending = []
+        self.lock = threading.Lock()
+        self.closing = threading.Event()
+        self.written = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def append(self, record):
+        with self.lock:
+            self.pending.append(record)
+
+    def _run(self):
+        while not self.closing.wait(self.sync_interval):
+            self._write_pending()
+        self._write_pending()
+
+    def _write_pending(self):
+        with self.lock:
+            records, self.pending = self.pending, []
+        if records:
+            self.file.write(b"".join(records))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.written += len(records)
+
+    def close(self):
+        self.closing.set()
+        self.thread.join()
+        self.file.close()
+
+
+class GameLog(AppendLog):
+    def __init__(self, path, sync_interval=DEFAULT_SYNC_INTERVAL):
+        super().__init__(path, MAGIC, VERSION, sync_interval)
+
+
+def stats(path):
+    games = 0
+    moves = 0
+    results = collections.Counter()
+    by_difficulty = collections.Counter()
+    for record in read_games(path):
+        games += 1
+        moves += len(record.moves)
+        results[record.result] += 1
+        by_difficulty[record.difficulty or "pvp"] += 1
+    print(f"{path}: {games} games, {moves / games if games else 0:.1f} moves on average")
+    print("results: " + ", ".join(f"{RESULT_NAMES.get(result, result)} {count}"
+                                  for result, count in sorted(results.items())))
+    print("games: " + ", ".join(f"{name} {count}" for name, count in by_difficulty.most_common()))
+
+
+def dump(path, limit):
+    for index, record in enumerate(read_games(path)):
+        if index >= limit:
+            break
+        moves = "".join(str(column + 1) for column in record.moves)
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.ended))} {record.session_id} "
+              f"{record.player1} vs {record.player2} ({record.difficulty or 'pvp'}): "
+              f"{RESULT_NAMES.get(record.result, record.result)}, moves {moves}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read the log of finished games.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stats_parser = commands.add_parser("stats", help="count games and results")
+    stats_parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    dump_parser = commands.add_parser("dump", help="print games one per line")
+    dump_parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    dump_parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        stats(args.path)
+    else:
+        dump(args.path, args.limit)
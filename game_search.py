@@ -0,0 +1,251 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+import time
+import game_logic
+import position_cache
+
+H1 = game_logic.COLUMN_HEIGHT
+BOTTOM_MASK = sum(1 << (col * H1) for col in range(game_logic.COLUMNS))
+BOARD_MASK = BOTTOM_MASK * ((1 << game_logic.ROWS) - 1)
+CENTER_MASK = ((1 << game_logic.ROWS) - 1) << (game_logic.COLUMNS // 2 * H1)
+
+# Explore the center columns first, they take part in the most lines of four
+MOVE_ORDER = sorted(range(game_logic.COLUMNS), key=lambda col: abs(game_logic.COLUMNS // 2 - col))
+
+WIN_SCORE = 1000
+EXACT, LOWER, UPPER = 0, 1, 2
+
+DEFAULT_TIME_BUDGET = 1.0  # Seconds per AI move
+DEFAULT_TABLE_SIZE = 1 << 18  # Transposition table slots, must be a power of two
+_TIME_CHECK_INTERVAL = 2048  # Nodes between two clock reads
+EVALUATION_CACHE_SIZE = 1 << 16
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def winning_cells(position, mask):
+    """Return the empty cells that would complete a line of four for position."""
+    # Vertical
+    cells = (position << 1) & (position << 2) & (position << 3)
+    for shift in (H1, H1 - 1, H1 + 1):  # Horizontal and both diagonals
+        pair = (position << shift) & (position << 2 * shift)
+        cells |= pair & (position << 3 * shift)
+        cells |= pair & (position >> shift)
+        pair = (position >> shift) & (position >> 2 * shift)
+        cells |= pair & (position << shift)
+        cells |= pair & (position >> 3 * shift)
+    return cells & (BOARD_MASK ^ mask)
+
+
+def position_key(board):
+    """Unique key of a position: the stones of the side to move plus the mask."""
+    mask = board.bitboards[0] | board.bitboards[1]
+    return board.bitboards[board.moves & 1] + mask
+
+
+def evaluate(board):
+    """Heuristic score of a position from the side to move's point of view."""
+    mask = board.bitboards[0] | board.bitboards[1]
+    own = board.bitboards[board.moves & 1]
+    other = board.bitboards[(board.moves & 1) ^ 1]
+    threats = winning_cells(own, mask).bit_count() - winning_cells(other, mask).bit_count()
+    center = (own & CENTER_MASK).bit_count() - (other & CENTER_MASK).bit_count()
+    return 4 * threats + center
+
+
+# Leaf scores of every search in the process. The score doesn't change when
+# the board is mirrored, so a position and its mirror image share an entry.
+evaluations = position_cache.PositionCache(EVALUATION_CACHE_SIZE)
+
+def cached_evaluate(board):
+    hashes = board.hashes
+    key = min(hashes & game_logic.HASH_MASK, hashes >> 64)
+    score = evaluations.get(key)
+    if score is None:
+        score = evaluate(board)
+        evaluations.put(key, score)
+    return score
+
+
+class TranspositionTable:
+    """Fixed size table of search results.
+
+    Every slot keeps one entry. A new result replaces the stored one if the
+    slot holds the same position, an entry left over from an older search,
+    or a result searched to a smaller depth.
+    """
+
+    def __init__(self, size=DEFAULT_TABLE_SIZE):
+        self.size = size
+        self.slots = [None] * size
+        self.generation = 0
+
+    def _index(self, key):
+        return ((key * 0x9E3779B97F4A7C15) >> 17) & (self.size - 1)
+
+    def new_search(self):
+        self.generation += 1
+
+    def get(self, key):
+        entry = self.slots[self._index(key)]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def put(self, key, depth, flag, score, move):
+        index = self._index(key)
+        entry = self.slots[index]
+        if entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.slots[index] = (key, depth, flag, score, move, self.generation)
+
+    def clear(self):
+        self.slots = [None] * self.size
+
+
+class Searcher:
+    """Negamax search with alpha-beta pruning and iterative deepening."""
+
+    def __init__(self, table=None):
+        self.table = table if table is not None else TranspositionTable()
+        self.nodes = 0
+        self.deadline = None
+        self.stop = None
+        self.stopped = False
+
+    def best_move(self, board, time_budget=DEFAULT_TIME_BUDGET, max_depth=None, stop=None):
+        """Return (column, score, depth) of the best move found in the time budget.
+
+        stop is called along with the clock checks, the search gives up once
+        it returns True and stopped tells afterwards whether it did.
+        """
+        board = game_logic.as_board(board).copy()
+        self.nodes = 0
+        self.deadline = time.perf_counter() + time_budget if time_budget else None
+        self.stop = stop
+        self.stopped = False
+        self.table.new_search()
+
+        moves = [col for col in MOVE_ORDER if board.can_play(col)]
+        if not moves:
+            return None, 0, 0
+        remaining = game_logic.BOARD_SIZE - board.moves
+        if max_depth is None or max_depth > remaining:
+            max_depth = remaining
+
+        best = (moves[0], 0, 0)
+        for depth in range(1, max_depth + 1):
+            try:
+                column, score = self._search_root(board, moves, depth)
+            except SearchTimeout:
+                break
+            best = (column, score, depth)
+            if abs(score) >= WIN_SCORE - game_logic.BOARD_SIZE:
+                break  # The outcome is already known
+        return best
+
+    def _out_of_time(self):
+        if self.stop is not None and self.stop():
+            self.stopped = True
+            return True
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+    def _search_root(self, board, moves, depth):
+        token = board.current_token
+        alpha, beta = -WIN_SCORE, WIN_SCORE
+        entry = self.table.get(position_key(board))
+        if entry is not None and entry[4] in moves:
+            moves = [entry[4]] + [col for col in moves if col != entry[4]]
+        best_column = moves[0]
+        for col in moves:
+            row = board.play(col, token)
+            if board.has_won_at(row, col, token):
+                score = WIN_SCORE - board.moves
+            else:
+                score = -self._negamax(board, depth - 1, -beta, -alpha)
+            board.undo()
+            if score > alpha:
+                alpha = score
+                best_column = col
+        self.table.put(position_key(board), depth, EXACT, alpha, best_column)
+        return best_column, alpha
+
+    def _negamax(self, board, depth, alpha, beta):
+        self.nodes += 1
+        if self.nodes % _TIME_CHECK_INTERVAL == 0 and self._out_of_time():
+            raise SearchTimeout()
+
+        if board.moves == game_logic.BOARD_SIZE:
+            return 0
+
+        bitboards = board.bitboards
+        mask = bitboards[0] | bitboards[1]
+        own = bitboards[board.moves & 1]
+        possible = (mask + BOTTOM_MASK) & BOARD_MASK
+        # The side to move wins right away
+        if winning_cells(own, mask) & possible:
+            return WIN_SCORE - board.moves - 1
+        if depth <= 0:
+            return cached_evaluate(board)
+
+        # Never let the opponent complete a line on the next move
+        opponent_wins = winning_cells(bitboards[(board.moves & 1) ^ 1], mask) & possible
+        if opponent_wins:
+            if opponent_wins & (opponent_wins - 1):
+                return -(WIN_SCORE - board.moves - 2)  # Two threats, can't block both
+            moves = [col for col in MOVE_ORDER if opponent_wins >> (col * H1) & ((1 << H1) - 1)]
+        else:
+            moves = [col for col in MOVE_ORDER if board.can_play(col)]
+
+        original_alpha = alpha
+        key = own + mask
+        entry = self.table.get(key)
+        if entry is not None:
+            if entry[1] >= depth:
+                flag, score = entry[2], entry[3]
+                if flag == EXACT:
+                    return score
+                if flag == LOWER and score > alpha:
+                    alpha = score
+                elif flag == UPPER and score < beta:
+                    beta = score
+                if alpha >= beta:
+                    return score
+            if entry[4] in moves:
+                moves.remove(entry[4])
+                moves.insert(0, entry[4])
+
+        token = board.current_token
+        best_score = -WIN_SCORE
+        best_column = moves[0]
+        for col in moves:
+            board.play(col, token)
+            score = -self._negamax(board, depth - 1, -beta, -alpha)
+            board.undo()
+            if score > best_score:
+                best_score = score
+                best_column = col
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.put(key, depth, flag, best_score, best_column)
+        return best_score
+
+
+# One table per process, reused across moves so later searches start warm
+_searcher = Searcher()
+
+def expert_ai_move(board, time_budget=DEFAULT_TIME_BUDGET, stop=None):
+    """Best column in the time budget, None if stop() cut the search short."""
+    column, _, _ = _searcher.best_move(board, time_budget, stop=stop)
+    return None if _searcher.stopped else column
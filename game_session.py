@@ -1,29 +1,67 @@
 # Student's name: Aladin Nour Mawasi
 # Student's ID: 316172410
 
-import uuid
+import collections
+import itertools
+import logging
+import math
+import secrets
 import game_logic  
 import game_ai  
+import game_threats
+
+logger = logging.getLogger("connect4.session")
+
+# Session states. One shared string each, sessions only hold a reference
+WAITING = "waiting"
+READY = "ready"
+NO_SPECTATORS = frozenset()  # Shared by every session nobody watches
+# Ids count up from a random start, so ids of sessions saved before a
+# restart don't come up again
+_session_ids = itertools.count(secrets.randbits(62))
+# Clock settings in seconds, shared by every session of a server. game_time
+# is each player's clock for a game (0 for none), increment is added to it
+# after every move (Fischer) and move_time caps a single move (0 for no cap).
+TimeControl = collections.namedtuple("TimeControl", "game_time increment move_time")
 
 class GameSession:
-    def __init__(self, player1, ai_difficulty=None, is_ai_game=False,num_wins=1):
-        self.session_id = str(uuid.uuid4())
+    # No per-session __dict__, the server keeps one of these per table
+    __slots__ = ("session_id", "board", "seats", "ai_difficulty", "is_ai_game", "turn", "winner", "draw", "state",
+                 "player_wins", "ai_wins", "num_wins", "player_moves", "ai_moves", "seq", "broadcast_seq",
+                 "spectators", "resume_secret", "time_control", "clocks", "turn_started", "last_active",
+                 "threats")
+
+    def __init__(self, player1, ai_difficulty=None, is_ai_game=False,num_wins=1, time_control=None):
+        self.session_id = next(_session_ids)
         self.board = game_logic.create_board()
-        self.players = {player1: game_logic.PLAYER1}
+        # Player ids by seat, PLAYER1 first. None while a seat is free
+        self.seats = [player1, "AI" if is_ai_game else None]
         self.ai_difficulty = ai_difficulty
         self.is_ai_game = is_ai_game  
-        if is_ai_game:
-            self.players["AI"] = game_logic.PLAYER2
         self.turn = game_logic.PLAYER1
         self.winner = None
         self.draw = False
-        self.state = "waiting"
+        self.state = WAITING
         self.player_wins = 0
         self.ai_wins = 0
         self.num_wins = num_wins
         self.player_moves = 0
         self.ai_moves = 0
-        print(f"GameSession initialized. AI game: {self.is_ai_game}, AI difficulty: {self.ai_difficulty}")
+        self.seq = 0  # Numbers every move of the session, across games
+        self.broadcast_seq = 0  # Last seq the players were sent
+        self.spectators = NO_SPECTATORS  # Addresses of the connections watching the game
+        # Resume tokens of both seats, 8 bytes each. A player sends its token
+        # with RESUME to get its seat back after a restart
+        self.resume_secret = secrets.token_bytes(16)
+        # Seconds left on the clocks of both seats, None for an untimed session.
+        # The times are time.monotonic() values the server passes in
+        self.time_control = time_control
+        self.clocks = None
+        self.reset_clocks()
+        self.turn_started = 0.0
+        self.last_active = 0.0  # Last move of a player, or when the session started
+        self.threats = None  # Window counts of the hard AI, made on its first move
+        logger.debug("GameSession initialized. AI game: %s, AI difficulty: %s", self.is_ai_game, self.ai_difficulty)
 
 
 
@@ -32,15 +70,105 @@ class GameSession:
     def update_state(self, new_state):
         """Update the session's state."""
         self.state = new_state
+
+    def token_of(self, player_id):
+        """Token of the seat the player holds, None if it has none."""
+        if self.seats[0] == player_id:
+            return game_logic.PLAYER1
+        if self.seats[1] == player_id:
+            return game_logic.PLAYER2
+        return None
+
+    def player_at(self, token):
+        return self.seats[0 if token == game_logic.PLAYER1 else 1]
+
+    def sit(self, player_id, token):
+        self.seats[0 if token == game_logic.PLAYER1 else 1] = player_id
+
+    def is_full(self):
+        return self.seats[1] is not None
+
+    def seated(self):
+        """(player id, token) of every taken seat, the AI included."""
+        return [(player_id, token) for player_id, token in zip(self.seats, game_logic.TOKENS) if player_id is not None]
+
+    def resume_token(self, token):
+        return self.resume_secret[:8] if token == game_logic.PLAYER1 else self.resume_secret[8:]
+
+    def add_spectator(self, addr):
+        if not self.spectators:
+            self.spectators = set()
+        self.spectators.add(addr)
+
+    def remove_spectator(self, addr):
+        if addr in self.spectators:
+            self.spectators.discard(addr)
+            if not self.spectators:
+                self.spectators = NO_SPECTATORS
     
 
-    def make_move(self, column, player_id):
-        """Attempt to make a move on the board and handle AI response if applicable."""
-        player_token = self.players.get(player_id)
+    def reset_clocks(self):
+        """Give both players a full clock for a new game. The AI plays untimed."""
+        control = self.time_control
+        if control is not None:
+            game_time = control.game_time or math.inf
+            self.clocks = [game_time, math.inf if self.is_ai_game else game_time]
+
+    def clock_running(self):
+        """True while a player, not the AI, has to move in a game that's on."""
+        return (self.clocks is not None and (self.is_ai_game or self.state == READY)
+                and not self.winner and not self.draw and not self.is_ai_turn())
+
+    def start_turn(self, now):
+        self.turn_started = now
+
+    def charge_move(self, token, now):
+        """Take the time a move took off the token's clock and add the increment."""
+        if self.clocks is not None:
+            index = 0 if token == game_logic.PLAYER1 else 1
+            left = max(0.0, self.clocks[index] - (now - self.turn_started))
+            self.clocks[index] = left + self.time_control.increment
+        self.turn_started = self.last_active = now
+
+    def turn_deadline(self):
+        """When the player to move runs out of time, None if no clock is running."""
+        if not self.clock_running():
+            return None
+        allowed = self.clocks[0 if self.turn == game_logic.PLAYER1 else 1]
+        if self.time_control.move_time:
+            allowed = min(allowed, self.time_control.move_time)
+        return None if allowed == math.inf else self.turn_started + allowed
+
+    def clock_state(self, now):
+        """(seconds left on player 1's clock, on player 2's, for the current move).
+
+        None for an untimed session, math.inf for a clock that doesn't run
+        out and None for the move while no clock is running.
+        """
+        if self.clocks is None:
+            return None
+        left = list(self.clocks)
+        deadline = self.turn_deadline()
+        if self.clock_running():
+            index = 0 if self.turn == game_logic.PLAYER1 else 1
+            left[index] = max(0.0, left[index] - (now - self.turn_started))
+        return left[0], left[1], None if deadline is None else max(0.0, deadline - now)
+
+    def time_out(self):
+        """The player to move ran out of time, the other seat wins the game."""
+        self.winner = self.player_at(game_logic.PLAYER2 if self.turn == game_logic.PLAYER1 else game_logic.PLAYER1)
+
+    def make_move(self, column, player_id, play_ai=True):
+        """Attempt to make a move on the board and handle AI response if applicable.
+
+        With play_ai=False the AI's reply is left to the caller, see apply_ai_move().
+        """
+        player_token = self.token_of(player_id)
         # Check if it's the correct player's turn and if the move is valid
-        if player_token == self.turn and 0 <= column < len(self.board[0]):
-            move_made = game_logic.make_move(self.board, column, player_token)
-            if move_made:
+        if player_token == self.turn and 0 <= column < game_logic.COLUMNS:
+            row = game_logic.make_move(self.board, column, player_token)
+            if row is not None:
+                self.seq += 1
                 # Increment the move count based on the player making the move
                 if player_token == game_logic.PLAYER1:
                     self.player_moves += 1
@@ -48,7 +176,7 @@ class GameSession:
                     self.ai_moves += 1
 
                 # After making a move, check for win or draw
-                if game_logic.check_win(self.board, player_token):
+                if game_logic.check_win_at(self.board, row, column, player_token):
                     self.winner = player_id
                 elif game_logic.is_draw(self.board):
                     self.draw = True
@@ -57,40 +185,73 @@ class GameSession:
                     self.switch_turns()
                 
                 # If it's now the AI's turn, make AI move
-                if self.turn == game_logic.PLAYER2 and self.is_ai_game:
+                if play_ai and self.is_ai_turn():
                     self.make_ai_move()
                 return True
         return False
 
+    def logged_moves(self):
+        """(seq, column, row, token) of every move of the current game, oldest first.
+
+        The moves are read back from the board's history rather than kept twice.
+        """
+        history = self.board.history
+        first_seq = self.seq - len(history) + 1
+        heights = [0] * game_logic.COLUMNS
+        moves = []
+        for index, column in enumerate(history):
+            heights[column] += 1
+            moves.append((first_seq + index, column, game_logic.ROWS - heights[column], game_logic.TOKENS[index & 1]))
+        return moves
+
+    def unsent_moves(self):
+        """Return the moves made since the last call, oldest first."""
+        moves = [move for move in self.logged_moves() if move[0] > self.broadcast_seq]
+        self.broadcast_seq = self.seq
+        return moves
+
     def switch_turns(self):
         """Switch turns between PLAYER1 and PLAYER2."""
         self.turn = game_logic.PLAYER2 if self.turn == game_logic.PLAYER1 else game_logic.PLAYER1
 
+    def is_ai_turn(self):
+        """Return True if the game is on and the AI has to move next."""
+        return self.is_ai_game and self.turn == game_logic.PLAYER2 and not self.winner and not self.draw
+
     def make_ai_move(self):
-        print("Entering make_ai_move method.")
-        if self.is_ai_game and self.turn == game_logic.PLAYER2:
-            ai_column = game_ai.ai_move(self.board, self.ai_difficulty)
-            print(f"AI selected column {ai_column} for its move.")
-
-            if ai_column is not None:
-                made_move = game_logic.make_move(self.board, ai_column, game_logic.PLAYER2)
-                print(f"Move made by AI in column {ai_column}: {'Success' if made_move else 'Failed'}")
-                
-                # After making a move, check for win or draw
-                if game_logic.check_win(self.board, game_logic.PLAYER2):
-                    self.winner = "AI"
-                    print("AI wins the game.")
-                elif game_logic.is_draw(self.board):
-                    self.draw = True
-                    print("Game is a draw.")
-                else:
-                    self.switch_turns()  # It's now the player's turn
+        logger.debug("Entering make_ai_move method.")
+        if self.is_ai_turn():
+            if self.threats is None and self.ai_difficulty == "hard":
+                self.threats = game_threats.ThreatCounts()
+            ai_column = game_ai.ai_move(self.board, self.ai_difficulty, self.threats)
+            logger.debug("AI selected column %s for its move.", ai_column)
+            return self.apply_ai_move(ai_column)
+        else:
+            logger.debug("AI move not triggered due to game state or missing AI in players.")
+        return None
+
+    def apply_ai_move(self, ai_column):
+        """Play a column chosen by the AI, possibly computed in another process."""
+        if ai_column is not None and self.is_ai_turn():
+            row = game_logic.make_move(self.board, ai_column, game_logic.PLAYER2)
+            logger.debug("Move made by AI in column %s: %s", ai_column, "Success" if row is not None else "Failed")
+            if row is None:
+                return None
+            self.seq += 1
+            self.ai_moves += 1
 
-                return ai_column  # Return the column where AI made its move for server notification
+            # After making a move, check for win or draw
+            if game_logic.check_win_at(self.board, row, ai_column, game_logic.PLAYER2):
+                self.winner = "AI"
+                logger.debug("AI wins the game.")
+            elif game_logic.is_draw(self.board):
+                self.draw = True
+                logger.debug("Game is a draw.")
             else:
-                print("AI did not choose a valid column. This should be checked.")
-        else:
-            print("AI move not triggered due to game state or missing AI in players.")
+                self.switch_turns()  # It's now the player's turn
+
+            return ai_column  # Return the column where AI made its move for server notification
+        logger.warning("AI did not choose a valid column. This should be checked.")
         return None
 
     def get_board_state(self):
@@ -108,7 +269,7 @@ class GameSession:
     
     def serialize_board(self):
         """Return the board state as a string for easy transmission over the network."""
-        return '\n'.join(['|'.join(row) for row in self.board])
+        return self.board.to_text()
     
     def reset_board(self):
         self.board = game_logic.create_board()
@@ -117,6 +278,7 @@ class GameSession:
         self.turn = game_logic.PLAYER1
         self.player_moves = 0
         self.ai_moves = 0
+        self.reset_clocks()
 
     def update_wins(self):
         if self.winner == "AI":
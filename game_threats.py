@@ -0,0 +1,157 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Threat table engine of the hard AI.
+
+A window is a line of four cells a player can still complete. WINDOWS
+lists the 69 windows of the board and CELL_WINDOWS the ones through each
+cell, both worked out once at import, with cells numbered like the bits of
+game_logic's bitboards. ThreatCounts keeps how many tokens each player has
+in every window and catches up with its board move by move, so a move is
+judged by the few windows through its cell and no board is ever copied.
+
+The AI wins if it can and blocks if it must. Otherwise every column is
+scored by the windows its token extends for the AI and spoils for the
+player, and by what it does to the cell on top: a column that lets the
+player win right above it is only played when no other is left.
+"""
+
+import random
+import game_logic
+
+ROWS, COLUMNS, HEIGHT = game_logic.ROWS, game_logic.COLUMNS, game_logic.COLUMN_HEIGHT
+CENTRE_ORDER = sorted(range(COLUMNS), key=lambda col: abs(COLUMNS // 2 - col))
+
+# Score of a window by the AI's tokens in it once the move is played, and of
+# spoiling one of the player's windows by the player's tokens in it
+EXTEND_SCORES = (0, 1, 4, 24)
+SPOIL_SCORES = (0, 1, 6, 0)
+DOUBLE_THREAT_SCORE = 500  # Two cells to win on next move, the player can only block one
+GIVES_WIN_SCORE = -10000  # The player wins on top of the move
+LOSES_THREAT_SCORE = -20  # The player gets to block a winning cell of the AI's on top of the move
+
+
+def _windows():
+    windows = []
+    for col in range(COLUMNS):
+        for row in range(ROWS):  # Counted from the bottom, like the bits
+            for step_col, step_row in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                if 0 <= col + 3 * step_col < COLUMNS and 0 <= row + 3 * step_row < ROWS:
+                    windows.append(tuple((col + i * step_col) * HEIGHT + row + i * step_row for i in range(4)))
+    return tuple(windows)
+
+
+WINDOWS = _windows()
+CELL_WINDOWS = tuple(tuple(index for index, window in enumerate(WINDOWS) if cell in window)
+                     for cell in range(COLUMNS * HEIGHT))
+
+
+class ThreatCounts:
+    """Tokens of each player in every window of one board, see sync()."""
+
+    __slots__ = ("board", "moves", "counts")
+
+    def __init__(self):
+        self.board = None
+        self.moves = 0
+        self.counts = None  # Per window counts of PLAYER1 and PLAYER2
+
+    def sync(self, board):
+        """Catch up with the moves played on board since the last call.
+
+        Another board, or one with moves taken back, is counted from scratch.
+        """
+        if board is not self.board or board.moves < self.moves:
+            self.board = board
+            self.counts = ([0] * len(WINDOWS), [0] * len(WINDOWS))
+            for index, bitboard in enumerate(board.bitboards):
+                while bitboard:
+                    low = bitboard & -bitboard
+                    self._add(low.bit_length() - 1, index)
+                    bitboard ^= low
+        elif board.moves > self.moves:
+            # The newest moves are the top cells of their columns
+            heights = board.heights[:]
+            for column in reversed(board.history[self.moves - board.moves:]):
+                heights[column] -= 1
+                cell = heights[column]
+                self._add(cell, 0 if board.bitboards[0] >> cell & 1 else 1)
+        self.moves = board.moves
+
+    def _add(self, cell, index):
+        counts = self.counts[index]
+        for window in CELL_WINDOWS[cell]:
+            counts[window] += 1
+
+
+def wins_at(own, other, cell):
+    """True if a token of the own counts' player on cell completes a window."""
+    for window in CELL_WINDOWS[cell]:
+        if own[window] == 3 and not other[window]:
+            return True
+    return False
+
+
+def score_move(board, mine, theirs, column):
+    """Score of the AI dropping a token in the column, with mine and theirs the window counts."""
+    cell = board.heights[column]
+    above = cell + 1 if cell % HEIGHT < ROWS - 1 else None
+    windows = CELL_WINDOWS[cell]
+    score = 0
+    for window in windows:
+        if not theirs[window]:
+            score += EXTEND_SCORES[mine[window] + 1]
+        if not mine[window]:
+            score += SPOIL_SCORES[theirs[window]]
+        mine[window] += 1
+    # Cells the AI could win on next move, found through the windows the move completes to three
+    occupied = board.bitboards[0] | board.bitboards[1] | 1 << cell
+    next_wins = set()
+    for window in windows:
+        if mine[window] == 3 and not theirs[window]:
+            for target in WINDOWS[window]:
+                if not occupied >> target & 1 and (target == above or target == board.heights[target // HEIGHT]):
+                    next_wins.add(target)
+    if above is not None:
+        if wins_at(theirs, mine, above):
+            score += GIVES_WIN_SCORE
+        elif wins_at(mine, theirs, above):
+            next_wins.add(above)
+            if len(next_wins) < 2:
+                score += LOSES_THREAT_SCORE
+    if len(next_wins) >= 2:
+        score += DOUBLE_THREAT_SCORE
+    for window in windows:
+        mine[window] -= 1
+    return score
+
+
+def threat_ai_move(board, threats=None):
+    """Column for the player to move, None if the board is full.
+
+    threats is the ThreatCounts kept for the board between moves, a
+    temporary one is counted from scratch without it.
+    """
+    board = game_logic.as_board(board)
+    if threats is None:
+        threats = ThreatCounts()
+    threats.sync(board)
+    index = board.moves & 1
+    mine, theirs = threats.counts[index], threats.counts[index ^ 1]
+    columns = [col for col in CENTRE_ORDER if board.can_play(col)]
+    if not columns:
+        return None
+    for col in columns:
+        if wins_at(mine, theirs, board.heights[col]):
+            return col
+    for col in columns:
+        if wins_at(theirs, mine, board.heights[col]):
+            return col
+    best_score, best = None, []
+    for col in columns:
+        score = score_move(board, mine, theirs, col)
+        if best_score is None or score > best_score:
+            best_score, best = score, [col]
+        elif score == best_score:
+            best.append(col)
+    return random.choice(best)
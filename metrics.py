@@ -0,0 +1,194 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Counters, gauges and histograms for the servers, and a sampling profiler.
+
+Recording a value is a few attribute updates, cheap enough for the per-move
+path. render() turns everything registered into the Prometheus text format,
+which the servers hand out on their optional admin port:
+    GET /metrics            all metrics
+    GET /profile/start      start sampling the event loop thread, ?interval=MS
+    GET /profile/stop       stop and return the samples as collapsed stacks
+"""
+
+import bisect
+import collections
+import http.server
+import sys
+import threading
+import urllib.parse
+
+# Seconds, from a fast command parse to a slow AI search
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Bytes waiting in a client's output buffer
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+
+DEFAULT_PROFILE_INTERVAL = 0.005
+
+registry = []
+
+
+class Counter:
+    """A count that only goes up. With read given, the count is kept elsewhere and read when rendered."""
+
+    def __init__(self, name, help_text, read=None):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.read = read
+        registry.append(self)
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self):
+        value = self.read() if self.read is not None else self.value
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {value}"]
+
+
+class Gauge:
+    """A value read when the metrics are rendered, so keeping it current costs nothing."""
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        registry.append(self)
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        registry.append(self)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Sample the stack of one thread from a background thread.
+
+    Samples are counted per call stack and reported as collapsed stacks,
+    one "outer;inner;innermost count" line each, the input format of the
+    usual flame graph tools.
+    """
+
+    def __init__(self):
+        self.samples = collections.Counter()
+        self.thread = None
+        self.stopping = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self, thread_id, interval=DEFAULT_PROFILE_INTERVAL):
+        if self.running:
+            return False
+        self.samples.clear()
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, args=(thread_id, interval), daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop sampling and return the collapsed stacks, busiest first."""
+        if not self.running:
+            return ""
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def _run(self, thread_id, interval):
+        while not self.stopping.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+
+profiler = SamplingProfiler()
+
+
+def admin_response(path, thread_id):
+    """Answer one admin request, return (HTTP status code, body).
+
+    thread_id is the thread the profiler samples, the one running the
+    server's event loop.
+    """
+    url = urllib.parse.urlsplit(path)
+    query = urllib.parse.parse_qs(url.query)
+    if url.path == "/metrics":
+        return 200, render()
+    if url.path == "/profile/start":
+        try:
+            interval = float(query.get("interval", [DEFAULT_PROFILE_INTERVAL * 1000])[0]) / 1000
+        except ValueError:
+            return 400, "interval must be a number of milliseconds.\n"
+        if not profiler.start(thread_id, interval):
+            return 409, "The profiler is already running.\n"
+        return 200, f"Sampling every {interval * 1000:g} ms.\n"
+    if url.path == "/profile/stop":
+        if not profiler.running:
+            return 409, "The profiler is not running.\n"
+        return 200, profiler.stop()
+    return 404, "Try /metrics, /profile/start or /profile/stop.\n"
+
+
+class AdminHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, body = admin_response(self.path, self.server.thread_id)
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would flood the server log
+
+
+def start_admin_server(port, thread_id, host="127.0.0.1"):
+    """Serve the admin endpoints from a daemon thread, away from the event loop.
+
+    Rendering only reads the metrics, so it needs no lock with the loop
+    thread that updates them.
+    """
+    admin_server = http.server.ThreadingHTTPServer((host, port), AdminHandler)
+    admin_server.daemon_threads = True
+    admin_server.thread_id = thread_id
+    threading.Thread(target=admin_server.serve_forever, daemon=True).start()
+    return admin_server
@@ -0,0 +1,202 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Precomputed best moves for the first plies of the game.
+
+Book file layout (little endian):
+    header  magic b"C4OB", version u16, plies u8, reserved u8, entry count u32
+    entries entry count times (position key u64, column u8), sorted by key
+
+Keys are canonical: a position and its left-right mirror image share one
+entry, stored for whichever of the two has the smaller key.
+
+Usage:
+    python opening_book.py generate [--plies N] [--depth D] [--out FILE]
+    python opening_book.py verify [FILE]
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import game_logic
+import game_search
+
+MAGIC = b"C4OB"
+VERSION = 1
+HEADER = struct.Struct("<4sHBBI")
+ENTRY = struct.Struct("<QB")
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+DEFAULT_PLIES = 6
+DEFAULT_DEPTH = 10
+
+H1 = game_logic.COLUMN_HEIGHT
+_COLUMN_MASK = (1 << H1) - 1
+
+
+class BookError(Exception):
+    pass
+
+
+def mirror(bitboard):
+    """Flip a bitboard left to right."""
+    flipped = 0
+    for col in range(game_logic.COLUMNS):
+        flipped |= ((bitboard >> (col * H1)) & _COLUMN_MASK) << ((game_logic.COLUMNS - 1 - col) * H1)
+    return flipped
+
+
+def canonical_key(board):
+    """Return (key, mirrored) for the book entry of a position."""
+    key = game_search.position_key(board)
+    mask = board.bitboards[0] | board.bitboards[1]
+    mirrored_key = mirror(board.bitboards[board.moves & 1]) + mirror(mask)
+    if mirrored_key < key:
+        return mirrored_key, True
+    return key, False
+
+
+class OpeningBook:
+    """Read-only view of a book file, memory-mapped so lookups don't load it."""
+
+    def __init__(self, path):
+        with open(path, "rb") as book_file:
+            if os.fstat(book_file.fileno()).st_size < HEADER.size:
+                raise BookError(f"{path}: file too short")
+            self._map = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.plies, _, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise BookError(f"{path}: not an opening book")
+        if version != VERSION:
+            raise BookError(f"{path}: unsupported book version {version}")
+        if len(self._map) != HEADER.size + self.count * ENTRY.size:
+            raise BookError(f"{path}: size does not match {self.count} entries")
+        self.path = path
+
+    def entry(self, index):
+        return ENTRY.unpack_from(self._map, HEADER.size + index * ENTRY.size)
+
+    def _find(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            middle_key, column = self.entry(middle)
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return column
+        return None
+
+    def lookup(self, board):
+        """Return the book move for the position, or None if it isn't in the book."""
+        if board.moves >= self.plies:
+            return None
+        key, mirrored = canonical_key(board)
+        column = self._find(key)
+        if column is not None and mirrored:
+            column = game_logic.COLUMNS - 1 - column
+        return column
+
+    def close(self):
+        self._map.close()
+
+
+def book_positions(plies):
+    """Yield every position with fewer than plies moves where the game is still on."""
+    board = game_logic.create_board()
+    seen = set()
+
+    def walk():
+        key, _ = canonical_key(board)
+        if key in seen:
+            return
+        seen.add(key)
+        yield board
+        if board.moves + 1 >= plies:
+            return
+        token = board.current_token
+        for col in range(game_logic.COLUMNS):
+            row = board.play(col, token)
+            if row is None:
+                continue
+            if not board.has_won_at(row, col, token):
+                yield from walk()
+            board.undo()
+
+    yield from walk()
+
+
+def write_book(path, plies, entries):
+    entries = sorted(entries.items())
+    with open(path + ".tmp", "wb") as book_file:
+        book_file.write(HEADER.pack(MAGIC, VERSION, plies, 0, len(entries)))
+        for key, column in entries:
+            book_file.write(ENTRY.pack(key, column))
+    os.replace(path + ".tmp", path)
+
+
+def generate(path, plies, depth):
+    searcher = game_search.Searcher()
+    entries = {}
+    for board in book_positions(plies):
+        key, mirrored = canonical_key(board)
+        column, _, _ = searcher.best_move(board, None, depth)
+        if mirrored:
+            column = game_logic.COLUMNS - 1 - column
+        entries[key] = column
+        if len(entries) % 500 == 0:
+            print(f"{len(entries)} positions searched")
+    write_book(path, plies, entries)
+    print(f"Wrote {len(entries)} positions up to ply {plies} to {path}")
+
+
+def verify(path):
+    """Check the file structure and that every book position has a legal move."""
+    book = OpeningBook(path)
+    problems = []
+    previous_key = -1
+    for index in range(book.count):
+        key, column = book.entry(index)
+        if key <= previous_key:
+            problems.append(f"entry {index}: keys out of order")
+        if column >= game_logic.COLUMNS:
+            problems.append(f"entry {index}: column {column} out of range")
+        previous_key = key
+
+    positions = 0
+    for board in book_positions(book.plies):
+        positions += 1
+        column = book.lookup(board)
+        if column is None:
+            problems.append(f"missing position after moves {board.history}")
+        elif not board.can_play(column):
+            problems.append(f"illegal move {column} after moves {board.history}")
+    if positions != book.count:
+        problems.append(f"book has {book.count} entries, expected {positions}")
+    book.close()
+
+    for problem in problems[:20]:
+        print(problem)
+    print(f"{path}: version {VERSION}, {book.count} entries, {book.plies} plies, "
+          f"{len(problems)} problem(s)")
+    return not problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or check the opening book.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="search every early position")
+    generate_parser.add_argument("--plies", type=int, default=DEFAULT_PLIES)
+    generate_parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    generate_parser.add_argument("--out", default=DEFAULT_PATH)
+    verify_parser = commands.add_parser("verify", help="check a book file")
+    verify_parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate(args.out, args.plies, args.depth)
+    else:
+        sys.exit(0 if verify(args.path) else 1)
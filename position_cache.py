@@ -0,0 +1,45 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Bounded cache of results per position, shared by every session of a process.
+
+Keys are Board.canonical_key() hashes, so a position and its mirror image
+share an entry. Once the cache is full the least recently used entry is
+evicted.
+"""
+
+import collections
+
+DEFAULT_SIZE = 1 << 16
+
+
+class PositionCache:
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value, None if there is none."""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
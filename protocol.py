@@ -0,0 +1,212 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Framed binary protocol shared by the server and the client.
+
+A client switches to it by adding BINARY to its START_GAME command and
+ending that command with a newline. From then on every message in both
+directions is a frame: a 2-byte big endian payload length followed by the
+payload. The first payload byte is the message type.
+
+Adding DELTA as well asks for one MSG_DELTA per move instead of a whole
+board per update. The client keeps its own copy of the board and sends
+SNAPSHOT when it joins a game in progress or sees a gap in the sequence
+numbers. A game that ends with a delta is over, the next one starts on an
+empty board. So is one that ends with a MSG_STATUS, which is sent instead
+when the game ended without a move, on a timeout.
+
+Client to server:
+    MSG_TEXT    utf-8 command, e.g. b"START_GAME 2 hard 3" or b"SNAPSHOT"
+    MSG_MOVE    column u8
+
+Server to client:
+    MSG_TEXT    utf-8 notice
+    MSG_UPDATE  ai column u8 (NO_COLUMN if none), status u8, turn u8,
+                player wins u16, ai wins u16, series winner u8,
+                board as 42 two-bit cells in 11 bytes
+    MSG_READY   token u8 the recipient plays with
+    MSG_DELTA   seq u32, column u8, row u8 counted from the top, token u8,
+                then status, turn, wins and series as in MSG_UPDATE
+    MSG_SNAPSHOT seq u32 of the last move, status u8, turn u8,
+                player wins u16, ai wins u16, board as in MSG_UPDATE
+    MSG_STATUS  seq u32 of the last move, then status, turn, wins and
+                series as in MSG_UPDATE
+
+A server that runs with clocks ends MSG_UPDATE, MSG_SNAPSHOT, MSG_STATUS and
+the last MSG_DELTA of an update with the clock state: milliseconds left on player
+1's clock u32, on player 2's u32 and for the current move u32, NO_CLOCK
+for a clock that doesn't run out or while no clock is running.
+"""
+
+import math
+import struct
+import game_logic
+
+BINARY = "binary"
+TEXT = "text"
+DELTA = "delta"
+
+MSG_TEXT, MSG_MOVE, MSG_UPDATE, MSG_READY, MSG_DELTA, MSG_SNAPSHOT, MSG_STATUS = 0, 1, 2, 3, 4, 5, 6
+NO_COLUMN = 0xFF
+NO_CLOCK = 0xFFFFFFFF
+
+STATUS_ONGOING, STATUS_WIN_PLAYER1, STATUS_WIN_PLAYER2, STATUS_DRAW = 0, 1, 2, 3
+WINNER_TOKENS = {STATUS_WIN_PLAYER1: game_logic.PLAYER1, STATUS_WIN_PLAYER2: game_logic.PLAYER2}
+SERIES_NONE, SERIES_PLAYER, SERIES_AI = 0, 1, 2
+
+LENGTH = struct.Struct(">H")
+UPDATE = struct.Struct(">BBBBHHB11s")
+MOVE_DELTA = struct.Struct(">BIBBBBBHHB")
+SNAPSHOT = struct.Struct(">BIBBHH11s")
+STATUS = struct.Struct(">BIBBHHB")
+CLOCK = struct.Struct(">III")
+MAX_PAYLOAD = 0xFFFF
+
+TOKEN_CODES = {game_logic.EMPTY: 0, game_logic.PLAYER1: 1, game_logic.PLAYER2: 2}
+CODE_TOKENS = {code: token for token, code in TOKEN_CODES.items()}
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def frame(payload):
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError("payload too large for one frame")
+    return LENGTH.pack(len(payload)) + payload
+
+
+def split_frame(buffer):
+    """Return (payload, rest) for the first complete frame, or (None, buffer)."""
+    if len(buffer) < LENGTH.size:
+        return None, buffer
+    (length,) = LENGTH.unpack_from(buffer)
+    end = LENGTH.size + length
+    if len(buffer) < end:
+        return None, buffer
+    return buffer[LENGTH.size:end], buffer[end:]
+
+
+def text_frame(text):
+    return frame(bytes((MSG_TEXT,)) + text.encode("utf-8"))
+
+
+def move_frame(column):
+    return frame(bytes((MSG_MOVE, column)))
+
+
+def ready_frame(token):
+    return frame(bytes((MSG_READY, TOKEN_CODES[token])))
+
+
+def pack_board(board):
+    """Pack the 42 cells, top row first, four cells per byte."""
+    packed = 0
+    for row in board:
+        for token in row:
+            packed = packed << 2 | TOKEN_CODES[token]
+    packed <<= 2 * (44 - game_logic.BOARD_SIZE)  # Pad the last byte
+    return packed.to_bytes(11, "big")
+
+
+def unpack_board(packed):
+    value = int.from_bytes(packed, "big") >> 2 * (44 - game_logic.BOARD_SIZE)
+    cells = []
+    for _ in range(game_logic.BOARD_SIZE):
+        cells.append(CODE_TOKENS[value & 3])
+        value >>= 2
+    cells.reverse()
+    return [cells[row * game_logic.COLUMNS:(row + 1) * game_logic.COLUMNS] for row in range(game_logic.ROWS)]
+
+
+def pack_clock(clock):
+    """Clock trailer for a GameSession.clock_state(), empty for an untimed session."""
+    if clock is None:
+        return b""
+    return CLOCK.pack(*(NO_CLOCK if left is None or left == math.inf else min(int(left * 1000), NO_CLOCK - 1)
+                        for left in clock))
+
+
+def unpack_clock(payload, offset):
+    """Seconds left on both clocks and for the move, None for NO_CLOCK. None if there is no trailer."""
+    if len(payload) < offset + CLOCK.size:
+        return None
+    return tuple(None if left == NO_CLOCK else left / 1000 for left in CLOCK.unpack_from(payload, offset))
+
+
+def update_frame(board, ai_column, status, turn, player_wins, ai_wins, series, clock=None):
+    payload = UPDATE.pack(MSG_UPDATE, NO_COLUMN if ai_column is None else ai_column, status,
+                          TOKEN_CODES[turn], player_wins, ai_wins, series, pack_board(board))
+    return frame(payload + pack_clock(clock))
+
+
+def decode_update(payload):
+    """Return the fields of a MSG_UPDATE payload as a dict."""
+    _, ai_column, status, turn, player_wins, ai_wins, series, packed = UPDATE.unpack_from(payload)
+    return {
+        "ai_column": None if ai_column == NO_COLUMN else ai_column,
+        "status": status,
+        "turn": CODE_TOKENS[turn],
+        "player_wins": player_wins,
+        "ai_wins": ai_wins,
+        "series": series,
+        "board": unpack_board(packed),
+        "clock": unpack_clock(payload, UPDATE.size),
+    }
+
+
+def delta_frame(seq, column, row, token, status, turn, player_wins, ai_wins, series, clock=None):
+    return frame(MOVE_DELTA.pack(MSG_DELTA, seq, column, row, TOKEN_CODES[token], status,
+                                 TOKEN_CODES[turn], player_wins, ai_wins, series) + pack_clock(clock))
+
+
+def decode_delta(payload):
+    _, seq, column, row, token, status, turn, player_wins, ai_wins, series = MOVE_DELTA.unpack_from(payload)
+    return {
+        "seq": seq,
+        "column": column,
+        "row": row,
+        "token": CODE_TOKENS[token],
+        "status": status,
+        "turn": CODE_TOKENS[turn],
+        "player_wins": player_wins,
+        "ai_wins": ai_wins,
+        "series": series,
+        "clock": unpack_clock(payload, MOVE_DELTA.size),
+    }
+
+
+def snapshot_frame(seq, board, status, turn, player_wins, ai_wins, clock=None):
+    return frame(SNAPSHOT.pack(MSG_SNAPSHOT, seq, status, TOKEN_CODES[turn], player_wins, ai_wins,
+                               pack_board(board)) + pack_clock(clock))
+
+
+def decode_snapshot(payload):
+    _, seq, status, turn, player_wins, ai_wins, packed = SNAPSHOT.unpack_from(payload)
+    return {
+        "seq": seq,
+        "status": status,
+        "turn": CODE_TOKENS[turn],
+        "player_wins": player_wins,
+        "ai_wins": ai_wins,
+        "board": unpack_board(packed),
+        "clock": unpack_clock(payload, SNAPSHOT.size),
+    }
+
+
+def status_frame(seq, status, turn, player_wins, ai_wins, series, clock=None):
+    return frame(STATUS.pack(MSG_STATUS, seq, status, TOKEN_CODES[turn], player_wins, ai_wins, series)
+                 + pack_clock(clock))
+
+
+def decode_status(payload):
+    _, seq, status, turn, player_wins, ai_wins, series = STATUS.unpack_from(payload)
+    return {
+        "seq": seq,
+        "status": status,
+        "turn": CODE_TOKENS[turn],
+        "player_wins": player_wins,
+        "ai_wins": ai_wins,
+        "series": series,
+        "clock": unpack_clock(payload, STATUS.size),
+    }
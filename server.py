@@ -2,29 +2,188 @@
 # Student's ID: 316172410
 
 
+import argparse
+import collections
+import itertools
+import logging
+import math
+import multiprocessing
+import os
 import selectors
 import socket
+import struct
+import threading
+import time
 import types
-import sys
+import admission
 import game_logic
+import game_ai
+import game_records
+import game_search
 import game_session
-from concurrent.futures import ThreadPoolExecutor
+import metrics
+import opening_book
+import protocol
+import session_store
+import timing_wheel
+from concurrent.futures import ProcessPoolExecutor
 
 sel = selectors.DefaultSelector()
 active_sessions = {}
-max_players = 5
-connected_players = 0
+waiting_sessions = collections.OrderedDict()  # PvP sessions waiting for a second player, oldest first
+clients = {}  # addr -> connection data of admitted clients, for both the selector and the asyncio server
+admission_control = admission.AdmissionController()
+idle_timeout = admission.DEFAULT_IDLE_TIMEOUT
+# Timers of the event loop: idle connections, turn clocks and session reaping.
+# timers_changed, when set, is called with the deadline of every new timer so
+# a loop that sleeps until its next timer can wake up earlier.
+timers = timing_wheel.TimingWheel()
+timers_changed = None
+session_timers = {}  # session_id -> timer for the session's next deadline, see check_session()
+time_control = None  # game_session.TimeControl when games are played on the clock
+DEFAULT_SESSION_TIMEOUT = 900.0  # Seconds without a move before a session is closed
+DEFAULT_WAITING_TIMEOUT = 600.0  # Seconds a PvP player waits for an opponent
+session_timeout = DEFAULT_SESSION_TIMEOUT
+waiting_timeout = DEFAULT_WAITING_TIMEOUT
+# A spectator with more output pending skips updates and gets a snapshot
+# once it has caught up. One that stays behind this long is dropped.
+SPECTATOR_BACKLOG_LIMIT = 64 * 1024
+SPECTATOR_STALL_TIMEOUT = 30.0
+# Reading from a client stops once this much output is pending for it, and
+# goes on when it is down to OUTPUT_LOW_WATER, so a client that doesn't read
+# its replies can't make the server queue more of them.
+OUTPUT_HIGH_WATER = 128 * 1024
+OUTPUT_LOW_WATER = 32 * 1024
+SEND_BATCH = 64  # Most chunks handed to one sendmsg() call, well under IOV_MAX
+# Input a connection waiting in the admission queue may send before it is
+# closed, enough for the command it runs once admitted
+MAX_QUEUED_INPUT = 4 * 1024
+MAX_COMMAND_LENGTH = 1024  # Longest text command kept while its newline hasn't arrived
+ACCEPT_BACKOFF = 0.5  # Seconds without accepting after accept() failed, e.g. out of file descriptors
 
-def log(message):
-    print(f"[LOG] {message}")
+# AI moves are computed in worker processes so a long search doesn't hold up
+# the other connections. ai_pool stays None when AI runs in the server process.
+ai_pool = None
+ai_timeout = 5.0  # Seconds before a pending AI move falls back to the hard AI
+pending_ai_moves = {}  # session_id -> (future, deadline, time requested)
+pending_ai_lock = threading.Lock()
+# Pondering: while a player of an expert AI session thinks, the pool searches
+# the positions its likely replies lead to, one at a time, so the AI's answer
+# is in the cache by the time the move comes. ponder_budget is the CPU time
+# pondering may take per session, 0 turns it off. Pondering only runs while
+# the pool has no real AI move to compute.
+ponder_budget = 0.0
+ponder_generation = None  # multiprocessing.Value shared with the workers, bumped to stop their pondering
+ai_move_cutoff = None  # multiprocessing.Value shared with the workers, AI moves with a ticket up to it give up
+ai_move_tickets = itertools.count(1)  # Numbers the AI moves sent to the pool, in the order of their deadlines
+ponder_jobs = {}  # session_id -> (future, reply column, board after it)
+ponder_replies = {}  # session_id -> replies still to ponder this turn, likeliest first
+ponder_cpu = collections.Counter()  # session_id -> CPU seconds spent pondering for it
+pondered = {}  # session_id -> hashes of the boards pondered this turn
+wakeup_recv, wakeup_send = socket.socketpair()
+game_log = None  # game_records.GameLog when finished games are recorded
+# Sessions are saved so they survive a restart, see session_store.py.
+# dirty_sessions holds the ids changed since the last snapshot.
+saved_sessions = None  # session_store.SessionStore when sessions are saved
+dirty_sessions = set()
+resume_index = {}  # resume token -> id of a live session
+next_snapshot = 0.0
+# Set when this process is one of several workers started by supervisor.py:
+# index and count of the workers, waiting (shared array of how many PvP
+# players each one has waiting), inbox (where other workers hand this one
+# connections) and peers (the inboxes of all workers, by index).
+shard = None
+HANDOFF = struct.Struct("<HHI")  # Lengths of the command, unread input and unsent output
+HANDOFF_MAX = 64 * 1024
+
+logger = logging.getLogger("connect4.server")
+LOG_LEVELS = ("debug", "info", "warning", "error")
+
+command_parse_time = metrics.Histogram("connect4_command_parse_seconds",
+                                       "Time to split one message off the input buffer and decode it.")
+move_time = metrics.Histogram("connect4_move_seconds", "Time to handle a MOVE, with the AI reply if it runs in process.")
+ai_think_time = metrics.Histogram("connect4_ai_think_seconds", "Time from asking for an AI move to having it.")
+send_queue_bytes = metrics.Histogram("connect4_send_queue_bytes", "Output pending for a client after queueing more.",
+                                     metrics.SIZE_BUCKETS)
+commands_total = metrics.Counter("connect4_commands_total", "Client messages processed.")
+ai_fallbacks_total = metrics.Counter("connect4_ai_fallbacks_total",
+                                     "AI moves that failed or timed out and were played by the hard AI.")
+ponder_jobs_total = metrics.Counter("connect4_ponder_jobs_total", "Positions sent to the pool to ponder.")
+ponder_hits_total = metrics.Counter("connect4_ponder_hits_total", "Player moves whose AI reply was pondered.")
+ponder_cpu_seconds_total = metrics.Counter("connect4_ponder_cpu_seconds_total", "CPU time the workers spent pondering.")
+accept_errors_total = metrics.Counter("connect4_accept_errors_total",
+                                      "Failed accept() calls, each one stops accepting for ACCEPT_BACKOFF.")
+metrics.Gauge("connect4_active_sessions", "Sessions in progress or waiting for a player.", lambda: len(active_sessions))
+metrics.Gauge("connect4_connections", "Admitted client connections.", lambda: len(clients))
+metrics.Gauge("connect4_queued_connections", "Connections waiting for a slot.", lambda: len(admission_control.queue))
+metrics.Gauge("connect4_pending_ai_moves", "AI moves being computed in the pool.", lambda: len(pending_ai_moves))
+metrics.Gauge("connect4_spectators", "Connections watching a game.",
+              lambda: sum(len(session.spectators) for session in active_sessions.values()))
+spectator_updates_skipped_total = metrics.Counter("connect4_spectator_updates_skipped_total",
+                                                  "Updates not queued for spectators that were behind.")
+games_recorded_total = metrics.Counter("connect4_games_recorded_total", "Finished games queued for the game log.")
+spectators_dropped_total = metrics.Counter("connect4_spectators_dropped_total",
+                                           "Spectators closed for staying behind too long.")
+time_forfeits_total = metrics.Counter("connect4_time_forfeits_total", "Games lost by running out of time.")
+sessions_reaped_total = metrics.Counter("connect4_sessions_reaped_total",
+                                        "Sessions closed for sitting idle or waiting too long for an opponent.")
+metrics.Gauge("connect4_timers", "Timers pending on the event loop.", lambda: len(timers))
+output_bytes_sent_total = metrics.Counter("connect4_output_bytes_sent_total", "Bytes of output written to clients.")
+reads_paused_total = metrics.Counter("connect4_reads_paused_total",
+                                     "Times reading from a client stopped because its output backed up.")
+
+def register_cache_metrics(prefix, what, cache):
+    metrics.Counter(f"{prefix}_hits_total", f"{what} served from the cache.", lambda: cache.hits)
+    metrics.Counter(f"{prefix}_misses_total", f"{what} not found in the cache.", lambda: cache.misses)
+    metrics.Counter(f"{prefix}_evictions_total", f"{what} dropped from the full cache.", lambda: cache.evictions)
+    metrics.Gauge(f"{prefix}_entries", f"{what} in the cache.", lambda: len(cache))
+
+# Caches of this process. AI moves computed in the pool use the caches of the workers
+register_cache_metrics("connect4_ai_decision_cache", "AI decisions", game_ai.decisions)
+register_cache_metrics("connect4_evaluation_cache", "Position evaluations", game_search.evaluations)
+
+def log(message, *args, level=logging.DEBUG):
+    """Log a %-style message, formatted only if the level is enabled.
+
+    Everything said per command or per move is DEBUG, which stays off unless
+    the server runs with --log-level debug.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, message, *args)
+
+def schedule(delay, callback, *args):
+    """Run callback(*args) on the event loop in delay seconds, return the timer to cancel it."""
+    timer = timers.schedule(time.monotonic() + delay, callback, *args)
+    if timers_changed is not None:
+        timers_changed(timers.deadline_of(timer))
+    return timer
+
+def cancel_timer(timer):
+    if timer is not None:
+        timers.cancel(timer)
+
+def run_timers():
+    timers.advance()
 
 def start_game(addr, game_type, ai_difficulty, num_wins, data):
-    log(f"Starting game for {addr}, game_type: {game_type}, AI difficulty: {ai_difficulty}, Num wins: {num_wins}")
+    log("Starting game for %s, game_type: %s, AI difficulty: %s, Num wins: %s", addr, game_type, ai_difficulty, num_wins)
     if game_type == "2":  # AI game
-        new_session = game_session.GameSession(player1=addr, ai_difficulty=ai_difficulty, is_ai_game=True, num_wins=int(num_wins))
-        active_sessions[new_session.session_id] = new_session
+        if ai_difficulty not in game_ai.DIFFICULTIES:
+            send_message(data, f"Unknown AI difficulty. Choose one of: {', '.join(game_ai.DIFFICULTIES)}.")
+            return
+        num_wins = int(num_wins) if str(num_wins).isdigit() else 0
+        if not 1 <= num_wins <= session_store.MAX_NUM_WINS:
+            send_message(data, f"Number of wins must be between 1 and {session_store.MAX_NUM_WINS}.")
+            return
+        leave_session(data)
+        if not admission_control.can_open_session(len(active_sessions)):
+            send_message(data, "All game tables are taken. Please try again shortly.")
+            return
+        new_session = game_session.GameSession(player1=addr, ai_difficulty=ai_difficulty, is_ai_game=True,
+                                               num_wins=num_wins, time_control=time_control)
+        track_session(new_session)
         data.session_id = new_session.session_id
-        log(f"New AI game session created with ID {new_session.session_id} for player {addr}")
+        log("New AI game session created with ID %s for player %s", new_session.session_id, addr, level=logging.INFO)
         response_message = "New AI game session created. Your turn or AI's turn depending on the game logic."
     else:
         # Handle player vs player game session initialization
@@ -32,83 +191,515 @@ def start_game(addr, game_type, ai_difficulty, num_wins, data):
         response_message = "New player session created. Waiting for another player."
     
     if data and hasattr(data, 'outb'):
-        data.outb += response_message.encode('utf-8')
+        send_message(data, response_message)
+        send_resume_token(data)
 
 
 
 
 def accept_wrapper(sock):
-    global connected_players
-    conn, addr = sock.accept()
-    log(f"Accepted connection from {addr}")
+    try:
+        conn, addr = sock.accept()
+    except BlockingIOError:
+        return  # Another worker on the port took it first
+    except OSError as exc:
+        # Most likely out of file descriptors (EMFILE, ENFILE). The pending
+        # connection keeps the socket readable, so stop watching it for a
+        # while instead of failing on every turn of the loop
+        log("Failed to accept a connection, pausing for %.1fs: %r", ACCEPT_BACKOFF, exc, level=logging.ERROR)
+        accept_errors_total.inc()
+        sel.unregister(sock)
+        schedule(ACCEPT_BACKOFF, sel.register, sock, selectors.EVENT_READ, None)
+        return
+    log("Accepted connection from %s", addr, level=logging.INFO)
+    register_connection(conn, addr)
 
-    if connected_players >= max_players:
-        log(f"Player capacity reached. Rejecting connection from {addr}")
-        conn.sendall("Server capacity reached. Please try again later.".encode())
+def register_connection(conn, addr):
+    """Serve a connection on the selector, return its data or None if it was rejected."""
+    def close():
+        sel.unregister(conn)
         conn.close()
-        return
+        close_connection(data)
+
+    def detach():
+        # Stop serving the connection here without closing it, see hand_off()
+        sel.unregister(conn)
+        close_connection(data)
+        return conn
+
+    def notify():
+        if not data.closed:
+            update_events(conn, data)
 
-    connected_players += 1
+    decision, data = open_connection(addr, close)
+    if decision == admission.REJECTED:
+        # Best effort, the reason is short enough for any socket buffer and a
+        # client that isn't reading can't hold up the loop
+        conn.setblocking(False)
+        try:
+            conn.send(b"".join(data.outb))
+        except OSError:
+            pass
+        conn.close()
+        return None
+
+    data.detach = detach
     conn.setblocking(False)
-    data = types.SimpleNamespace(addr=addr, inb=b"", outb=b"")
-    events = selectors.EVENT_READ | selectors.EVENT_WRITE
-    sel.register(conn, events, data=data)
-    assign_player_to_session(addr, data)
+    data.events = wanted_events(data)
+    sel.register(conn, data.events, data=data)
+    data.notify = notify
+    return data
 
-def assign_player_to_session(addr, data):
-    # Check if there's an existing session waiting for a player
-    for session_id, session in active_sessions.items():
-        if session.state == "waiting" and len(session.players) < 2:
-            session.players[addr] = game_logic.PLAYER2
-            data.session_id = session_id
-            # Check if the session is now full and update state accordingly
-            if len(session.players) == 2:
-                session.update_state("ready")
-                notify_players_session_ready(session_id)
+def reading_paused(data, pending):
+    """Whether to stop reading from a client with this much output pending, see OUTPUT_HIGH_WATER."""
+    if data.reading_paused:
+        data.reading_paused = pending > OUTPUT_LOW_WATER
+    elif pending > OUTPUT_HIGH_WATER:
+        log("Pausing reads from %s with %d bytes pending", data.addr, pending)
+        reads_paused_total.inc()
+        data.reading_paused = True
+    return data.reading_paused
+
+def wanted_events(data):
+    """Selector events for a connection: writes only while output is pending,
+    reads unless too much of it is."""
+    events = 0 if reading_paused(data, data.out_size) else selectors.EVENT_READ
+    if data.outb:
+        events |= selectors.EVENT_WRITE
+    return events
+
+def update_events(conn, data):
+    events = wanted_events(data)
+    if events != data.events:
+        data.events = events
+        sel.modify(conn, events, data=data)
+
+def new_connection_data(addr, notify=None, close=None):
+    """Per-connection state shared by both servers.
+
+    notify is called whenever output gets queued for the client and close
+    drops the connection. detach, where the server supports it, stops
+    serving the connection and returns its socket. outb holds the queued output as a deque of bytes
+    chunks, out_size their total length. The selector server keeps the events
+    it watches for the connection in events.
+    """
+    return types.SimpleNamespace(addr=addr, inb=b"", outb=collections.deque(), out_size=0, session_id=None,
+                                 events=0, reading_paused=False, idle_timer=None,
+                                 notify=notify, close=close, detach=None, spectating=None, behind_since=None,
+                                 protocol=protocol.TEXT, deltas=False, pending_command=None, admitted=False, closed=False,
+                                 queue_position=None, last_active=time.monotonic())
+
+def open_connection(addr, close, notify=None):
+    """Ask admission control for a slot, return (decision, data).
+
+    A queued connection is admitted as soon as a slot is released, and told
+    its place in the line once its first command shows which protocol it
+    speaks. The output of a rejected one holds the reason.
+    """
+    data = new_connection_data(addr, notify, close)
+    decision, reason = admission_control.request(addr, data)
+    if decision == admission.REJECTED:
+        log("Rejecting connection from %s: %s", addr, reason, level=logging.WARNING)
+        send_message(data, reason)
+    elif decision == admission.QUEUED:
+        data.queue_position = len(admission_control.queue)
+        log("Queued connection from %s at position %s", addr, data.queue_position, level=logging.INFO)
+    else:
+        add_client(data)
+    return decision, data
+
+def close_connection(data):
+    """Release everything a closed connection held."""
+    if data.closed:
+        return
+    data.closed = True
+    cancel_timer(data.idle_timer)
+    data.idle_timer = None
+    if data.admitted:
+        remove_client(data)
+        for ticket in admission_control.release(data.addr):
+            admit_queued(ticket)
+    else:
+        admission_control.withdraw(data.addr)
+
+def admit_queued(data):
+    log("Admitting queued connection from %s", data.addr, level=logging.INFO)
+    add_client(data)
+    send_message(data, "A slot is free, welcome!")
+    # Commands sent while waiting in the queue run now
+    if data.pending_command is not None:
+        command, data.pending_command = data.pending_command, None
+        process_command(command.decode("utf-8"), data, None)
+    handle_input(data)
+
+def add_client(data):
+    """Index an admitted connection by address.
+
+    The player joins the matchmaking queue with START_GAME, so clients that
+    go on to play the AI never hold up a PvP session.
+    """
+    data.admitted = True
+    clients[data.addr] = data
+    data.idle_timer = schedule(idle_timeout, check_idle, data)
+
+def remove_client(data):
+    clients.pop(data.addr, None)
+    leave_session(data)
+    stop_spectating(data)
+
+def receive(data, recv_data):
+    """Take bytes read from a client and run the commands they complete."""
+    data.inb += recv_data
+    data.last_active = time.monotonic()
+    if data.admitted:
+        handle_input(data)
+    elif len(data.inb) > MAX_QUEUED_INPUT:
+        log("Closing queued connection from %s with %d bytes of input", data.addr, len(data.inb),
+            level=logging.WARNING)
+        data.close()
+    elif data.queue_position is not None:
+        # Switch a queued client to frames right away so the queue notice
+        # reaches it in the format it expects. Its command runs on admission.
+        command, newline, rest = data.inb.partition(b"\n")
+        if newline and framed_options(command.decode("utf-8", "replace").split()[1:]):
+            data.pending_command, data.inb = command, rest
+            data.protocol = protocol.BINARY
+        wait = admission_control.estimated_wait(data.queue_position)
+        estimate = f"about {wait:.0f} seconds" if wait is not None else "unknown"
+        send_message(data, f"Server is full. You are number {data.queue_position} in the queue, "
+                           f"estimated wait {estimate}.")
+        data.queue_position = None  # Tell it only once
+
+def is_waiting_on_others(data):
+    """True if a quiet client is just waiting for an opponent or the AI, or watching."""
+    if data.spectating in active_sessions:
+        return True
+    session = active_sessions.get(data.session_id)
+    if session is None:
+        return False
+    if (session.state == game_session.WAITING and not session.is_ai_game) or session.is_ai_turn():
+        return True
+    return session.token_of(data.addr) != session.turn
+
+def check_idle(data):
+    """Timer callback: close a connection that sent nothing for idle_timeout seconds while it was on it.
+
+    Input doesn't move the timer, it is set again from last_active when it fires.
+    """
+    data.idle_timer = None
+    if data.closed:
+        return
+    now = time.monotonic()
+    if now - data.last_active >= idle_timeout and not is_waiting_on_others(data):
+        log("Closing idle connection to %s", data.addr, level=logging.INFO)
+        data.close()
+        return
+    data.idle_timer = schedule(max(data.last_active + idle_timeout - now, 0.0) or idle_timeout, check_idle, data)
+
+def check_stalled_spectator(data, behind_since):
+    """Timer callback: drop a spectator that is still behind since behind_since."""
+    if not data.closed and data.behind_since == behind_since:
+        log("Dropping spectator %s, behind for %.0f seconds", data.addr, time.monotonic() - behind_since,
+            level=logging.INFO)
+        spectators_dropped_total.inc()
+        data.close()
+
+def queue_output(data, encoded):
+    """Queue bytes already encoded for the client's protocol.
+
+    The bytes are queued by reference, so an update encoded once is shared
+    by the queues of every player and spectator of the session.
+    """
+    data.outb.append(encoded)
+    data.out_size += len(encoded)
+    send_queue_bytes.observe(data.out_size)
+    if data.notify is not None:
+        data.notify()
+
+def take_output(data):
+    """Remove and return every queued chunk."""
+    chunks = list(data.outb)
+    data.outb.clear()
+    data.out_size = 0
+    return chunks
+
+def send_output(data, sock):
+    """Write queued chunks until the socket would block.
+
+    Up to SEND_BATCH chunks go out in one sendmsg() call. A chunk written in
+    part is replaced by a memoryview of its rest, so the only copy of the
+    output is the kernel's.
+    """
+    outb = data.outb
+    while outb:
+        chunks = list(itertools.islice(outb, SEND_BATCH))
+        try:
+            sent = sock.sendmsg(chunks)
+        except BlockingIOError:
             return
+        data.out_size -= sent
+        output_bytes_sent_total.inc(sent)
+        for chunk in chunks:
+            if sent < len(chunk):
+                if sent:
+                    outb[0] = memoryview(chunk)[sent:]
+                return  # The socket buffer is full
+            sent -= len(chunk)
+            outb.popleft()
+    output_drained(data)
+
+def output_drained(data):
+    """Called once a client's queue is empty, catches up a spectator that skipped updates."""
+    if data.behind_since is not None:
+        data.behind_since = None
+        send_snapshot(data)
+
+def send_message(data, message):
+    """Queue a text message for a client."""
+    if data.protocol == protocol.BINARY:
+        queue_output(data, protocol.text_frame(message))
+    else:
+        queue_output(data, message.encode('utf-8'))
+
+def assign_player_to_session(addr, data):
+    # Join the session that has been waiting for a player the longest
+    while waiting_sessions:
+        session_id, _ = waiting_sessions.popitem(last=False)
+        session = active_sessions.get(session_id)
+        if session is None or session.state != game_session.WAITING or session.is_full():
+            continue
+        session.sit(addr, game_logic.PLAYER2)
+        data.session_id = session_id
+        session.update_state(game_session.READY)
+        session.last_active = now = time.monotonic()
+        session.start_turn(now)
+        schedule_session_check(session)
+        dirty_sessions.add(session_id)
+        notify_players_session_ready(session_id)
+        return
 
     # If no existing session found, create a new session
     create_new_session(addr, data)
     
 def create_new_session(addr, data):
-    new_session = game_session.GameSession(player1=addr)
-    active_sessions[new_session.session_id] = new_session
+    if not admission_control.can_open_session(len(active_sessions)):
+        log("Session limit reached, no session for %s", addr, level=logging.WARNING)
+        return
+    new_session = game_session.GameSession(player1=addr, time_control=time_control)
+    track_session(new_session)
+    waiting_sessions[new_session.session_id] = None
     data.session_id = new_session.session_id
-    print(f"[LOG] New session created with ID {new_session.session_id} for player {addr}. Waiting for another player.")
+    log("New session created with ID %s for player %s. Waiting for another player.", new_session.session_id, addr, level=logging.INFO)
+
+
+def leave_session(data):
+    """Take the client out of its session and evict the session, which is abandoned now."""
+    session_id, data.session_id = data.session_id, None
+    evict_session(session_id, "Your opponent left the game. Send START_GAME to play again.", data.addr)
+
+def evict_session(session_id, notice, leaver=None):
+    """Drop a session, telling its players but leaver notice and its spectators that the game is over."""
+    session = active_sessions.pop(session_id, None)
+    if session is None:
+        return
+    waiting_sessions.pop(session_id, None)
+    cancel_timer(session_timers.pop(session_id, None))
+    for token in game_logic.TOKENS:
+        resume_index.pop(session.resume_token(token), None)
+    dirty_sessions.discard(session_id)
+    if saved_sessions is not None:
+        saved_sessions.remove(session_id)
+    with pending_ai_lock:
+        pending = pending_ai_moves.pop(session_id, None)
+    if pending is not None:
+        pending[0].cancel()
+    stop_pondering(session_id)
+    pondered.pop(session_id, None)
+    ponder_cpu.pop(session_id, None)
+    for addr in session.seats:
+        other = find_client_by_addr(addr) if addr != leaver else None
+        if other is not None and other.session_id == session_id:
+            other.session_id = None
+            send_message(other, notice)
+    for addr in session.spectators:
+        viewer = find_client_by_addr(addr)
+        if viewer is not None and viewer.spectating == session_id:
+            viewer.spectating = viewer.behind_since = None
+            send_message(viewer, "The game you were watching is over.")
+    log("Session %s evicted, %d active", session_id, len(active_sessions), level=logging.INFO)
+
+def track_session(session):
+    """Make a new or restored session live."""
+    if shard is not None:
+        # The first byte of a resume token names the worker that has the session
+        tag, secret = bytes((shard.index,)), session.resume_secret
+        session.resume_secret = tag + secret[1:8] + tag + secret[9:]
+    if session.time_control is None and time_control is not None:
+        session.time_control = time_control  # Restored sessions play on this server's clocks
+        session.reset_clocks()
+    active_sessions[session.session_id] = session
+    for token in game_logic.TOKENS:
+        resume_index[session.resume_token(token)] = session.session_id
+    dirty_sessions.add(session.session_id)
+    session.last_active = now = time.monotonic()
+    session.start_turn(now)
+    schedule_session_check(session)
+
+def schedule_session_check(session):
+    """Set the session's timer for its next deadline: the turn clock, or closing it once idle.
+
+    A timer that fires no later than that is kept, check_session() sets the next one when it fires.
+    """
+    if is_waiting_for_opponent(session):
+        deadline = session.last_active + waiting_timeout
+    else:
+        deadline = session.last_active + session_timeout
+    turn_deadline = session.turn_deadline()
+    if turn_deadline is not None:
+        deadline = min(deadline, turn_deadline)
+    timer = session_timers.get(session.session_id)
+    if timer is not None:
+        if timer.pending() and timers.deadline_of(timer) <= deadline:
+            return
+        timers.cancel(timer)
+    session_timers[session.session_id] = schedule(max(0.0, deadline - time.monotonic()), check_session,
+                                                  session.session_id)
+
+def check_session(session_id):
+    """Timer callback: evict a session that waited or sat idle too long, or time out the player to move."""
+    session_timers.pop(session_id, None)
+    session = active_sessions.get(session_id)
+    if session is None:
+        return
+    now = time.monotonic()
+    if is_waiting_for_opponent(session) and now - session.last_active >= waiting_timeout:
+        log("Session %s found no opponent in %.0f seconds", session_id, waiting_timeout, level=logging.INFO)
+        sessions_reaped_total.inc()
+        evict_session(session_id, "No opponent showed up. Send START_GAME to try again.")
+    elif now - session.last_active >= session_timeout:
+        log("Session %s idle for %.0f seconds", session_id, now - session.last_active, level=logging.INFO)
+        sessions_reaped_total.inc()
+        evict_session(session_id, "The game was closed after sitting idle. Send START_GAME to play again.")
+    elif session.turn_deadline() is not None and now >= session.turn_deadline():
+        time_out_player(session, session_id)
+    else:
+        schedule_session_check(session)
 
+def is_waiting_for_opponent(session):
+    return not session.is_ai_game and session.state == game_session.WAITING
+
+def time_out_player(session, session_id):
+    """The player to move ran out of time and loses the game."""
+    loser = session.turn
+    log("Player %s of session %s ran out of time", loser, session_id, level=logging.INFO)
+    time_forfeits_total.inc()
+    session.time_out()
+    for addr, _ in session.seated():
+        client = find_client_by_addr(addr)
+        if client is not None and client.session_id == session_id:
+            send_message(client, f"{loser} ran out of time.")
+    update_game_state(session, session_id)
+
+def format_clock(left):
+    return "no limit" if left is None or left == math.inf else f"{left:.1f}s"
+
+def clock_text(clock):
+    """Clock line of a text update, empty for an untimed session."""
+    if clock is None:
+        return ""
+    player1, player2, move = clock
+    text = f"Time left: {game_logic.PLAYER1} {format_clock(player1)}, {game_logic.PLAYER2} {format_clock(player2)}"
+    if move is not None:
+        text += f", this move {format_clock(move)}"
+    return text + "\n"
+
+def send_resume_token(data):
+    """Tell a seated player the token that gets its seat back after a server restart."""
+    session = active_sessions.get(data.session_id)
+    seat = session.token_of(data.addr) if session is not None else None
+    if seat is not None:
+        send_message(data, f"Resume token: {session.resume_token(seat).hex()}")
 
 def notify_players_session_ready(session_id):
     session = active_sessions[session_id]
     message = "Both players connected. The game starts now."
-    for player_addr, _ in session.players.items():
+    for player_addr, token in session.seated():
         client = find_client_by_addr(player_addr)
         if client:
-            client.data.outb += message.encode('utf-8')
-    print(f"[LOG] Notification sent for session {session_id}.")
+            if client.protocol == protocol.BINARY:
+                queue_output(client, protocol.ready_frame(token))
+            else:
+                send_message(client, message)
+            send_resume_token(client)
+    log("Notification sent for session %s.", session_id)
 
 def service_connection(key, mask):
     sock = key.fileobj
     data = key.data
-    if mask & selectors.EVENT_READ:
-        recv_data = sock.recv(1024)
-        if recv_data:
-            data.inb += recv_data
-            process_command(data.inb.decode("utf-8"), data, sock)
-            data.inb = b""
+    try:
+        if mask & selectors.EVENT_READ:
+            recv_data = sock.recv(1024)
+            if recv_data:
+                try:
+                    receive(data, recv_data)
+                except Exception as exc:
+                    log("Failed to process command from %s: %r", data.addr, exc, level=logging.WARNING)
+                if data.closed:
+                    return  # Closed by its own input, see receive()
+            else:
+                log("Closing connection to %s", data.addr, level=logging.INFO)
+                data.close()
+                return
+        if mask & selectors.EVENT_WRITE and data.outb:
+            log("Sending %d bytes to %s", data.out_size, data.addr)
+            send_output(data, sock)
+            if not data.closed:
+                update_events(sock, data)
+    except OSError as exc:
+        log("Connection to %s failed: %r", data.addr, exc, level=logging.WARNING)
+        data.close()
+
+def handle_input(data):
+    """Process every complete message in the client's input buffer."""
+    while data.inb:
+        started = time.perf_counter()
+        if data.protocol == protocol.BINARY:
+            payload, data.inb = protocol.split_frame(data.inb)
+            if payload is None:
+                return  # Wait for the rest of the frame
+            command_parse_time.observe(time.perf_counter() - started)
+            commands_total.inc()
+            handle_frame(payload, data)
         else:
-            log(f"Closing connection to {data.addr}")
-            sel.unregister(sock)
-            sock.close()
-            global connected_players
-            connected_players -= 1
-    if mask & selectors.EVENT_WRITE and data.outb:
-        log(f"Sending to {data.addr}: {data.outb.decode('utf-8')}")
-        sent = sock.send(data.outb)
-        data.outb = data.outb[sent:]
+            # Text commands end with a newline. A read can end in the middle
+            # of one, e.g. of a START_GAME ... BINARY, so the rest waits for
+            # its newline
+            command, newline, rest = data.inb.partition(b"\n")
+            if not newline:
+                if len(data.inb) > MAX_COMMAND_LENGTH:
+                    log("Dropping %d bytes of input without a newline from %s", len(data.inb), data.addr,
+                        level=logging.WARNING)
+                    data.inb = b""
+                    send_message(data, "Command too long.")
+                return
+            data.inb = rest
+            if command.strip():
+                command = command.decode("utf-8")
+                command_parse_time.observe(time.perf_counter() - started)
+                commands_total.inc()
+                process_command(command, data, None)
+
+def handle_frame(payload, data):
+    if payload[:1] == bytes((protocol.MSG_MOVE,)) and len(payload) == 2:
+        handle_move(data, payload[1])
+    elif payload[:1] == bytes((protocol.MSG_TEXT,)):
+        process_command(payload[1:].decode("utf-8"), data, None)
+    else:
+        send_message(data, "Unknown command.")
 
 def process_command(command, data, sock):
     args = command.strip().split()
-    log(f"Processing command from {data.addr}: {command}")
+    log("Processing command from %s: %s", data.addr, command)
 
     current_session = active_sessions.get(data.session_id, None)
 
@@ -116,125 +707,768 @@ def process_command(command, data, sock):
         game_type = args[1].upper()
         ai_difficulty = args[2] if len(args) > 2 else None
         num_wins = args[3] if len(args) > 3 else 1
+        apply_protocol_options(data, args[4:])
+        stop_spectating(data)
 
         if game_type == "2":  # AI game
             start_game(data.addr, game_type, ai_difficulty, num_wins, data)
         else:  # Player vs Player game
             if current_session:
                 # If the player is already in a session, ignore the START_GAME command
-                log(f"Player {data.addr} already in an active or ready session ({data.session_id}). Ignoring START_GAME command.")
-                data.outb += "You are already in a session. Please wait for another player or start a new game.".encode()
+                log("Player %s already in an active or ready session (%s). Ignoring START_GAME command.", data.addr, data.session_id)
+                send_message(data, "You are already in a session. Please wait for another player or start a new game.")
+            elif can_hand_off(data) and not waiting_sessions and (worker := worker_with_waiting_player()) is not None:
+                # Someone is waiting on another worker, the player is matched there
+                hand_off(data, worker, command)
             else:
                 assign_player_to_session(data.addr, data)
-                if data.session_id:
-                    data.outb += "New player session created. Waiting for another player.".encode()
-                else:
-                    data.outb += "Failed to create or join a session.".encode()
+                session = active_sessions.get(data.session_id)
+                if session is None:
+                    send_message(data, "Failed to create or join a session. All game tables may be taken.")
+                elif session.state == game_session.WAITING:
+                    send_message(data, "New player session created. Waiting for another player.")
+                    send_resume_token(data)
+                # Otherwise the player was matched and both got the start notification
 
     elif args[0].upper() == "MOVE" and len(args) == 2:
-        if not current_session:
-            log(f"No active session found for {data.addr}. Ignoring MOVE command.")
-            data.outb += "No active game. Start a new game first.".encode()
+        handle_move(data, int(args[1]))
+    elif args[0].upper() == "SNAPSHOT":
+        send_snapshot(data)
+    elif args[0].upper() == "SPECTATE":
+        # SPECTATE [session id] [BINARY] [DELTA]
+        options = [arg for arg in args[1:] if framed_options([arg])]
+        session_ids = [arg for arg in args[1:] if arg not in options]
+        apply_protocol_options(data, options)
+        spectate(data, parse_session_id(session_ids[0]) if session_ids else None)
+    elif args[0].upper() == "RESUME" and len(args) >= 2:
+        # RESUME <token> [BINARY] [DELTA]
+        apply_protocol_options(data, args[2:])
+        resume(data, args[1])
+    else:
+        send_message(data, "Unknown command.")
+
+def framed_options(options):
+    """True if command options ask for frames, DELTA implies BINARY."""
+    return any(option.lower() in (protocol.BINARY, protocol.DELTA) for option in options)
+
+def apply_protocol_options(data, options):
+    if framed_options(options):
+        data.protocol = protocol.BINARY
+        data.deltas = protocol.DELTA in (option.lower() for option in options)
+
+def parse_session_id(text):
+    # Session ids are ints, anything else matches no session
+    return int(text) if text.isdigit() else text
+
+def is_watchable(session):
+    # A PvP session still waiting for its second player has nothing to show
+    return session.is_ai_game or session.state != game_session.WAITING
+
+def spectate(data, session_id=None):
+    """Subscribe the client to a session's updates, the most watched one if no id is given."""
+    leave_session(data)
+    stop_spectating(data)
+    if session_id is None:
+        watchable = [session for session in active_sessions.values() if is_watchable(session)]
+        session = max(watchable, key=lambda session: len(session.spectators), default=None)
+    else:
+        session = active_sessions.get(session_id)
+    if session is None or not is_watchable(session):
+        send_message(data, "No such game to watch.")
+        return
+    session.add_spectator(data.addr)
+    data.spectating = session.session_id
+    log("%s is watching session %s", data.addr, session.session_id, level=logging.INFO)
+    send_message(data, f"Watching game {session.session_id}.")
+    send_snapshot(data)
+
+def stop_spectating(data):
+    session = active_sessions.get(data.spectating)
+    if session is not None:
+        session.remove_spectator(data.addr)
+    data.spectating = data.behind_since = None
+
+def resume(data, token_hex):
+    """Give a player its seat back, in a live session or one saved before a restart."""
+    try:
+        token = bytes.fromhex(token_hex)
+    except ValueError:
+        token = None
+    session = active_sessions.get(resume_index.get(token))
+    if session is None and token is not None and saved_sessions is not None:
+        session = saved_sessions.restore(token)
+        if session is not None:
+            track_session(session)
+            log("Session %s restored from %s", session.session_id, saved_sessions.path, level=logging.INFO)
+    if session is None and token and can_hand_off(data) and token[0] != shard.index and token[0] < shard.count:
+        # The session belongs to another worker
+        hand_off(data, token[0], f"RESUME {token_hex} {' '.join(protocol_options(data))}")
+        return
+    if session is None:
+        send_message(data, "Unknown or expired resume token.")
+        return
+    if data.session_id != session.session_id:
+        leave_session(data)
+    stop_spectating(data)
+    seat = game_logic.PLAYER1 if session.resume_token(game_logic.PLAYER1) == token else game_logic.PLAYER2
+    holder = find_client_by_addr(session.player_at(seat))
+    if holder is not None and holder is not data and holder.session_id == session.session_id:
+        holder.session_id = None  # Resumed from another connection
+        send_message(holder, "Your seat was resumed from another connection.")
+    session.sit(data.addr, seat)
+    data.session_id = session.session_id
+    session.last_active = time.monotonic()
+    schedule_session_check(session)
+    log("%s resumed seat %s in session %s", data.addr, seat, session.session_id, level=logging.INFO)
+    send_message(data, f"Resumed game {session.session_id}, you play {seat}.")
+    send_snapshot(data)
+    if session.is_ai_turn() and session.session_id not in pending_ai_moves:
+        # The server went down while the AI was thinking
+        if ai_pool is not None:
+            request_ai_move(session, session.session_id)
+        else:
+            update_game_state(session, session.session_id)
+
+def protocol_options(data):
+    """Command options that keep a client handed to another worker in its format."""
+    if data.protocol != protocol.BINARY:
+        return []
+    return ["BINARY", "DELTA"] if data.deltas else ["BINARY"]
+
+def can_hand_off(data):
+    return shard is not None and shard.count > 1 and data.detach is not None
+
+def worker_with_waiting_player():
+    """Another worker with a PvP player waiting, trying the next ones first."""
+    for offset in range(1, shard.count):
+        worker = (shard.index + offset) % shard.count
+        if shard.waiting[worker] > 0:
+            return worker
+    return None
+
+def hand_off(data, worker, command):
+    """Pass a connection to another worker, which runs command for it."""
+    conn = data.detach()
+    encoded = command.encode("utf-8")
+    output = b"".join(take_output(data))
+    message = HANDOFF.pack(len(encoded), len(data.inb), len(output)) + encoded + data.inb + output
+    try:
+        if len(message) > HANDOFF_MAX:
+            raise OSError("handoff message too long")
+        socket.send_fds(shard.peers[worker], [message], [conn.fileno()])
+    except OSError as exc:
+        log("Could not hand %s to worker %d: %r", data.addr, worker, exc, level=logging.WARNING)
+    else:
+        log("Handed %s to worker %d", data.addr, worker)
+    data.inb = b""
+    conn.close()  # The other worker holds its own descriptor for the socket
+
+def take_handoffs():
+    """Serve the connections other workers handed to this one."""
+    while True:
+        try:
+            message, fds, _, _ = socket.recv_fds(shard.inbox, HANDOFF_MAX, 1)
+        except BlockingIOError:
             return
+        if not fds:
+            continue
+        conn = socket.socket(fileno=fds[0])
+        try:
+            addr = conn.getpeername()
+        except OSError:
+            conn.close()  # The client went away in the meantime
+            continue
+        data = register_connection(conn, addr)
+        if data is None:
+            continue
+        command_length, input_length, output_length = HANDOFF.unpack_from(message)
+        offset = HANDOFF.size
+        command = message[offset:offset + command_length].decode("utf-8")
+        offset += command_length
+        data.inb = message[offset:offset + input_length]
+        output = message[offset + input_length:offset + input_length + output_length]
+        if output:
+            queue_output(data, output)
+        if data.admitted:
+            process_command(command, data, None)
+            handle_input(data)
+        else:
+            data.pending_command = command.encode("utf-8")
 
-        column = int(args[1])
-        if current_session.make_move(column, data.addr):
-            update_game_state(current_session, data.session_id)
+def balance_waiting_players():
+    """Publish how many PvP players wait here, and move them to a lower worker that has some too.
+
+    Two workers that each got a lone player at the same moment would
+    otherwise both keep waiting. The lowest worker with waiting players
+    collects them, so they pair up there.
+    """
+    shard.waiting[shard.index] = len(waiting_sessions)
+    if not waiting_sessions:
+        return
+    worker = next((worker for worker in range(shard.index) if shard.waiting[worker] > 0), None)
+    if worker is None:
+        return
+    session_id = next(iter(waiting_sessions))
+    session = active_sessions.get(session_id)
+    data = find_client_by_addr(session.player_at(game_logic.PLAYER1)) if session is not None else None
+    if data is not None and can_hand_off(data):
+        hand_off(data, worker, f"START_GAME 1 - 1 {' '.join(protocol_options(data))}")
+        shard.waiting[shard.index] = len(waiting_sessions)
+
+def send_snapshot(data):
+    """Send the whole board, for delta clients and spectators that joined late or missed a move."""
+    session = active_sessions.get(data.session_id or data.spectating)
+    if session is None:
+        send_message(data, "No active game. Start a new game first.")
+    elif data.protocol == protocol.BINARY:
+        queue_output(data, protocol.snapshot_frame(session.seq, session.board, game_status_code(session),
+                                                   session.turn, session.player_wins, session.ai_wins,
+                                                   session.clock_state(time.monotonic())))
+    else:
+        send_message(data, f"Board State:\n{session.serialize_board()}\nGame Status: {session.get_game_status()}\n"
+                           f"{clock_text(session.clock_state(time.monotonic()))}")
+
+def handle_move(data, column):
+    started = time.perf_counter()
+    current_session = active_sessions.get(data.session_id, None)
+    if not current_session:
+        log("No active session found for %s. Ignoring MOVE command.", data.addr)
+        send_message(data, "No active game. Start a new game first.")
+        return
+
+    now = time.monotonic()
+    token = current_session.token_of(data.addr)
+    deadline = current_session.turn_deadline()
+    if deadline is not None and now >= deadline and token == current_session.turn:
+        # Its timer hasn't fired yet, but the move came too late
+        time_out_player(current_session, data.session_id)
+        return
+    if current_session.make_move(column, data.addr, play_ai=False):
+        current_session.charge_move(token, now)
+        stop_pondering(data.session_id)
+        if current_session.board.hash in pondered.pop(data.session_id, ()):
+            ponder_hits_total.inc()
+        if current_session.is_ai_turn() and ai_pool is not None:
+            request_ai_move(current_session, data.session_id)
         else:
-            data.outb += "Invalid move. Try again.".encode()
+            # Without a pool update_game_state plays the AI's reply right here
+            update_game_state(current_session, data.session_id)
     else:
-        data.outb += "Unknown command.".encode()
+        send_message(data, "Invalid move. Try again.")
+    move_time.observe(time.perf_counter() - started)
 
 
 
-def find_client_by_addr(addr):
-    for key in sel.get_map().values():
-        if hasattr(key.data, 'addr') and key.data.addr == addr:
-            return key
-    return None
+def request_ai_move(session, session_id):
+    """Send the AI's turn to the process pool, the reply goes out once it's back.
+
+    A position some session already had is answered from the cache right away.
+    The easy and hard AI take less time than the trip to the pool and play
+    in this process, the hard AI with the window counts its session keeps.
+    """
+    if session.ai_difficulty != "expert":
+        update_game_state(session, session_id)
+        return
+    ai_column = game_ai.cached_ai_move(session.board, session.ai_difficulty)
+    if ai_column is not None:
+        update_game_state(session, session_id, session.apply_ai_move(ai_column))
+        return
+    if ponder_jobs:
+        # Real moves go first, stop what the workers are pondering
+        ponder_generation.value += 1
+    ticket = next(ai_move_tickets)
+    future = ai_pool.submit(game_ai.compute_ai_move, session.board.state(), session.ai_difficulty, ticket)
+    with pending_ai_lock:
+        now = time.monotonic()
+        pending_ai_moves[session_id] = (future, now + ai_timeout, now, ticket)
+    future.add_done_callback(wake_event_loop)
+    wake_event_loop()  # Let the loop pick up the new deadline
+    log("AI move for session %s sent to the process pool", session_id)
+
+def wake_event_loop(_future=None):
+    # Called from the pool's result thread, makes sel.select() return
+    try:
+        wakeup_send.send(b"\0")
+    except BlockingIOError:
+        pass  # The loop already has a wakeup to read
+
+def ai_wait_timeout():
+    """Seconds until the next pending AI move times out, None if nothing is pending."""
+    with pending_ai_lock:
+        if not pending_ai_moves:
+            return None
+        deadline = min(deadline for _, deadline, _, _ in pending_ai_moves.values())
+    return max(0, deadline - time.monotonic())
+
+def collect_ai_moves():
+    """Apply the AI moves that came back and fall back for the ones that timed out."""
+    now = time.monotonic()
+    finished = []
+    with pending_ai_lock:
+        for session_id, (future, deadline, requested, ticket) in list(pending_ai_moves.items()):
+            if future.done() or now >= deadline:
+                del pending_ai_moves[session_id]
+                finished.append((session_id, future, requested, ticket))
+
+    for session_id, future, requested, ticket in finished:
+        session = active_sessions.get(session_id)
+        if session is None:
+            continue
+        ai_think_time.observe(now - requested)
+        ai_column = None
+        if future.done() and not future.cancelled():
+            try:
+                ai_column = future.result()
+            except Exception as exc:
+                log("AI worker failed for session %s: %s", session_id, exc, level=logging.ERROR)
+            if ai_column is not None and session.ai_difficulty == "expert":
+                game_ai.remember_decision(game_ai.EXPERT, session.board, ai_column)
+        else:
+            if not future.cancel():
+                # A worker is searching, make it give up so the worker is free again.
+                # Deadlines come in ticket order, every older move timed out already
+                ai_move_cutoff.value = max(ai_move_cutoff.value, ticket)
+            log("AI move for session %s timed out, falling back to the hard AI", session_id, level=logging.WARNING)
+        if ai_column is None:
+            ai_fallbacks_total.inc()
+            ai_column = game_ai.ai_move(session.board, "hard")
+        ai_column = session.apply_ai_move(ai_column)
+        update_game_state(session, session_id, ai_column)
+
+def start_pondering(session, session_id):
+    """Ponder the player's likely replies if the session is an expert AI game waiting on the player."""
+    if (ponder_budget and ai_pool is not None and session.ai_difficulty == "expert" and session.is_ai_game
+            and not session.winner and not session.draw and not session.is_ai_turn()):
+        stop_pondering(session_id)
+        pondered[session_id] = set()
+        ponder_replies[session_id] = game_ai.likely_replies(session.board)
+        ponder_next(session, session_id)
+
+def ponder_next(session, session_id):
+    """Send the session's next reply that needs a search to the pool, if the pool is idle and budget is left."""
+    replies = ponder_replies.get(session_id)
+    if replies is None or session_id in ponder_jobs or pending_ai_moves:
+        return
+    while replies and ponder_cpu[session_id] < ponder_budget:
+        column = replies.pop(0)
+        board = session.board.copy()
+        row = board.play(column, board.current_token)
+        if board.has_won_at(row, column, session.turn) or board.is_full():
+            continue  # The game would be over, the AI has nothing to answer
+        if game_ai.cached_ai_move(board, "expert") is not None:
+            continue
+        future = ai_pool.submit(game_ai.ponder_ai_move, board.state(), ponder_generation.value)
+        future.add_done_callback(wake_event_loop)
+        ponder_jobs[session_id] = (future, column, board)
+        ponder_jobs_total.inc()
+        return
+    del ponder_replies[session_id]
+
+def finish_ponder(session_id, future, board):
+    """Keep the move a finished ponder job found, True if it found one."""
+    if future.cancelled():
+        return False
+    try:
+        ai_column, cpu = future.result()
+    except Exception as exc:
+        log("Pondering failed for session %s: %s", session_id, exc, level=logging.ERROR)
+        ponder_replies.pop(session_id, None)
+        return False
+    ponder_cpu[session_id] += cpu
+    ponder_cpu_seconds_total.inc(cpu)
+    if ai_column is None:
+        return False
+    game_ai.remember_decision(game_ai.EXPERT, board, ai_column)
+    pondered[session_id].add(board.hash)
+    return True
+
+def stop_pondering(session_id):
+    """Stop pondering for the session, keeping a move that is already in."""
+    ponder_replies.pop(session_id, None)
+    job = ponder_jobs.pop(session_id, None)
+    if job is None:
+        return
+    future, _, board = job
+    if future.done():
+        finish_ponder(session_id, future, board)
+    elif not future.cancel():
+        # A worker has it, make the search give up
+        ponder_generation.value += 1
+
+def collect_ponders():
+    """Keep the moves that came back from pondering, and go on pondering once the pool is idle."""
+    for session_id, (future, column, board) in list(ponder_jobs.items()):
+        if future.done():
+            del ponder_jobs[session_id]
+            if not finish_ponder(session_id, future, board) and session_id in ponder_replies:
+                # Stopped for a real move, try it again later
+                ponder_replies[session_id].insert(0, column)
+    if ponder_replies and not pending_ai_moves:
+        for session_id in list(ponder_replies):
+            session = active_sessions.get(session_id)
+            if session is not None:
+                ponder_next(session, session_id)
 
 # Server initialization code remains unchanged
-def update_game_state(session, session_id):
-    log(f"Entering update_game_state for session {session_id}")
+def update_game_state(session, session_id, ai_column=None):
+    log("Entering update_game_state for session %s", session_id)
+    dirty_sessions.add(session_id)
 
     game_status = session.get_game_status()
     message = ""
 
+    if ai_column is not None:
+        message += f"AI moved to column {ai_column}.\n"
+
     # Trigger the AI move if it's an AI game and it's the AI's turn
-    if session.is_ai_game and session.turn == game_logic.PLAYER2:
-        log(f"AI turn detected for session {session_id}")
+    if session.is_ai_turn():
+        log("AI turn detected for session %s", session_id)
+        started = time.perf_counter()
         ai_column = session.make_ai_move()
-        log(f"AI move triggered, selected column: {ai_column}")
+        ai_think_time.observe(time.perf_counter() - started)
+        log("AI move triggered, selected column: %s", ai_column)
 
         if ai_column is not None:
             message += f"AI moved to column {ai_column}.\n"
             game_status = session.get_game_status()  # Refresh game status after AI's move
-            log(f"AI made a move in column {ai_column}. Game status: {game_status}")
+            log("AI made a move in column %s. Game status: %s", ai_column, game_status)
 
-    board_state = session.serialize_board()
-    message += f"Board State:\n{board_state}\nGame Status: {game_status}\n"
+    # Fields of the update, taken before the board is reset below. The text
+    # body is only put together if a text client gets the update
+    board, turn = session.board, session.turn
+    results = ""
+    status = game_status_code(session)
+    player_wins, ai_wins, series = session.player_wins, session.ai_wins, protocol.SERIES_NONE
+    wins_before = (player_wins, ai_wins)
+    moves, last_seq = session.unsent_moves(), session.seq
+    now = time.monotonic()
 
     # Check if the game has ended (win or draw)
     if session.winner or session.draw:
-        log(f"Game ended for session {session_id}. Winner: {session.winner}, Draw: {session.draw}")
+        log("Game ended for session %s. Winner: %s, Draw: %s", session_id, session.winner, session.draw)
+        record_game(session, status)
         session.update_wins()
         series_winner = session.check_series_winner()
+        player_wins, ai_wins = session.player_wins, session.ai_wins
         if series_winner:
-            message += f"Series winner: {series_winner}\n"
-            message += f"Player wins: {session.player_wins}, AI wins: {session.ai_wins}\n"
-            log(f"Series ended for session {session_id}. Series winner: {series_winner}")
+            series = protocol.SERIES_PLAYER if series_winner == "PLAYER" else protocol.SERIES_AI
+            results = f"Series winner: {series_winner}\nPlayer wins: {session.player_wins}, AI wins: {session.ai_wins}\n"
+            log("Series ended for session %s. Series winner: %s", session_id, series_winner)
             # Reset the session 
             session.player_wins = 0
             session.ai_wins = 0
             session.reset_board()
         else:
-            message += f"Player wins: {session.player_wins}, AI wins: {session.ai_wins}\n"
-            log(f"Game ended for session {session_id}. No series winner yet.")
+            results = f"Player wins: {session.player_wins}, AI wins: {session.ai_wins}\n"
+            log("Game ended for session %s. No series winner yet.", session_id)
             session.reset_board()  # Reset the board for the next game
 
-    # Send the updated game state to all real players
-    for addr in session.players.keys():
-        if addr != "AI":
+    # The next turn starts now, its clock goes out with the update
+    session.start_turn(now)
+    schedule_session_check(session)
+    start_pondering(session, session_id)
+    clock = session.clock_state(now)
+
+    def encode_text():
+        return (f"{message}Board State:\n{board.to_text()}\nGame Status: {game_status}\n{results}"
+                f"{clock_text(clock)}").encode("utf-8")
+
+    def encode_deltas():
+        if not moves:
+            # The game ended without a move, on a timeout
+            return protocol.status_frame(last_seq, status, turn, player_wins, ai_wins, series, clock)
+        # Only the last move of the update can have ended the game
+        frames = []
+        for index, (seq, column, row, token) in enumerate(moves):
+            if index < len(moves) - 1:
+                next_turn = game_logic.PLAYER2 if token == game_logic.PLAYER1 else game_logic.PLAYER1
+                frames.append(protocol.delta_frame(seq, column, row, token, protocol.STATUS_ONGOING, next_turn,
+                                                   *wins_before, protocol.SERIES_NONE))
+            else:
+                frames.append(protocol.delta_frame(seq, column, row, token, status, turn,
+                                                   player_wins, ai_wins, series, clock))
+        return b"".join(frames)
+
+    encoders = {
+        protocol.TEXT: encode_text,
+        protocol.BINARY: lambda: protocol.update_frame(board, ai_column, status, turn, player_wins, ai_wins, series,
+                                                       clock),
+        protocol.DELTA: encode_deltas,
+    }
+    # Encode the update once per format asked for, every recipient of a
+    # format queues the same bytes
+    encoded = {}
+
+    def encoded_for(client):
+        update_format = protocol.DELTA if client.deltas else client.protocol
+        if update_format not in encoded:
+            encoded[update_format] = encoders[update_format]()
+        return encoded[update_format]
+
+    for addr in session.seats:
+        if addr is not None and addr != "AI":
             client = find_client_by_addr(addr)
             if client:
-                log(f"Sending game state update to {addr} for session {session_id}")
-                client.data.outb += message.encode("utf-8")
+                log("Sending game state update to %s for session %s", addr, session_id)
+                queue_output(client, encoded_for(client))
+
+    for addr in session.spectators:
+        viewer = find_client_by_addr(addr)
+        if viewer is None:
+            continue
+        if viewer.behind_since is not None or viewer.out_size > SPECTATOR_BACKLOG_LIMIT:
+            # Skip updates until it has caught up, output_drained() then sends a snapshot
+            if viewer.behind_since is None:
+                viewer.behind_since = now
+                schedule(SPECTATOR_STALL_TIMEOUT, check_stalled_spectator, viewer, now)
+                log("Spectator %s is behind, switching it to snapshots", addr, level=logging.INFO)
+            spectator_updates_skipped_total.inc()
+            continue
+        queue_output(viewer, encoded_for(viewer))
+
+    log("Exiting update_game_state for session %s", session_id)
 
-    log(f"Exiting update_game_state for session {session_id}")
+
+def record_game(session, result):
+    """Queue a finished game for the game log, if there is one. The log writes it out in the background."""
+    if game_log is None:
+        return
+    player1, player2 = (format_addr(addr) for addr in session.seats)
+    columns = list(session.board.history)
+    game_log.append(game_records.encode_record(session.session_id, result, player1, player2,
+                                               session.ai_difficulty, columns))
+    games_recorded_total.inc()
+
+def format_addr(addr):
+    return f"{addr[0]}:{addr[1]}" if isinstance(addr, tuple) else str(addr)
+
+def game_status_code(session):
+    if session.draw:
+        return protocol.STATUS_DRAW
+    if session.winner:
+        if session.token_of(session.winner) == game_logic.PLAYER2:
+            return protocol.STATUS_WIN_PLAYER2
+        return protocol.STATUS_WIN_PLAYER1
+    return protocol.STATUS_ONGOING
 
 
 def find_client_by_addr(addr):
-    """Helper function to find the client object by address."""
-    for key in sel.get_map().values():
-        if hasattr(key.data, 'addr') and key.data.addr == addr:
-            return key
-    return None
+    """Helper function to find the client's connection data by address."""
+    return clients.get(addr)
 
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage:", sys.argv[0], "<host> <port>")
-        sys.exit(1)
+def parse_args(description="Connect 4 game server.", argv=None):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("host")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--ai-workers", type=int, default=os.cpu_count() or 1,
+                        help="AI worker processes, 0 computes AI moves in the server process")
+    parser.add_argument("--ai-timeout", type=float, default=ai_timeout,
+                        help="seconds to wait for an AI move before falling back to the hard AI")
+    parser.add_argument("--ponder-budget", type=float, default=0,
+                        help="CPU seconds per session the expert AI may spend on the player's likely moves "
+                             "while the player thinks, 0 for no pondering")
+    parser.add_argument("--max-connections", type=int, default=admission.DEFAULT_MAX_CONNECTIONS,
+                        help="connections served at once, more wait in a queue")
+    parser.add_argument("--max-sessions", type=int, default=admission.DEFAULT_MAX_SESSIONS)
+    parser.add_argument("--max-per-ip", type=int, default=admission.DEFAULT_MAX_PER_IP,
+                        help="connections and queue places one address can hold")
+    parser.add_argument("--max-queue", type=int, default=admission.DEFAULT_MAX_QUEUE,
+                        help="connections waiting for a slot before new ones are rejected")
+    parser.add_argument("--backlog", type=int, default=1024, help="listen() backlog")
+    parser.add_argument("--idle-timeout", type=float, default=idle_timeout,
+                        help="seconds without input before a connection is closed")
+    parser.add_argument("--clock", type=float, default=0,
+                        help="seconds on each player's clock per game, 0 for no game clock")
+    parser.add_argument("--increment", type=float, default=0, help="seconds added to a player's clock per move")
+    parser.add_argument("--move-time", type=float, default=0, help="seconds allowed for one move, 0 for no limit")
+    parser.add_argument("--session-timeout", type=float, default=session_timeout,
+                        help="seconds without a move before a session is closed")
+    parser.add_argument("--waiting-timeout", type=float, default=waiting_timeout,
+                        help="seconds a PvP player waits for an opponent before its session is closed")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="warning",
+                        help="debug logs every command and move, which costs time per move")
+    parser.add_argument("--game-log", help="append every finished game to this file, see game_records.py")
+    parser.add_argument("--admin-port", type=int,
+                        help="serve /metrics and the profiler toggle on this localhost port")
+    parser.add_argument("--session-store",
+                        help="save running sessions to this file so players can RESUME them after a restart")
+    return parser.parse_args(argv)
+
+def configure_logging(args):
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+def configure_game_log(args):
+    global game_log
+    if args.game_log is not None:
+        game_log = game_records.GameLog(args.game_log)
+        print(f"Recording finished games in {args.game_log}")
+
+def close_game_log():
+    if game_log is not None:
+        game_log.close()
+
+def configure_session_store(args):
+    """Open the session journal. Saved sessions come back when their players send RESUME."""
+    global saved_sessions
+    if args.session_store is not None:
+        started = time.perf_counter()
+        saved_sessions = session_store.SessionStore(args.session_store)
+        print(f"Loaded {len(saved_sessions)} resumable sessions from {args.session_store} "
+              f"in {time.perf_counter() - started:.2f}s")
+
+def snapshot_sessions():
+    """Save the sessions changed since the last snapshot."""
+    global next_snapshot
+    next_snapshot = time.monotonic() + session_store.DEFAULT_SNAPSHOT_INTERVAL
+    if saved_sessions is None:
+        dirty_sessions.clear()
+        return
+    for session_id in dirty_sessions:
+        session = active_sessions.get(session_id)
+        # A PvP session that never got its second player isn't worth resuming
+        if session is not None and is_watchable(session):
+            try:
+                saved_sessions.save(session)
+            except Exception as exc:
+                # One session that can't be saved doesn't stop the others, or the server
+                log("Failed to save session %s: %r", session_id, exc, level=logging.ERROR)
+    dirty_sessions.clear()
+
+def close_session_store():
+    """Take a last snapshot and close the journal, sessions closed after this stay saved."""
+    global saved_sessions
+    if saved_sessions is not None:
+        snapshot_sessions()
+        saved_sessions.close()
+        saved_sessions = None
+
+def configure_admin(args):
+    """Start the admin endpoints if asked to, sampling the calling thread when profiling."""
+    if args.admin_port is not None:
+        metrics.start_admin_server(args.admin_port, threading.get_ident())
+        print(f"Admin endpoints on 127.0.0.1:{args.admin_port}")
+
+def configure_admission(args):
+    global admission_control, idle_timeout
+    admission_control = admission.AdmissionController(args.max_connections, args.max_sessions,
+                                                      args.max_per_ip, args.max_queue)
+    idle_timeout = args.idle_timeout
+
+def configure_clocks(args):
+    global time_control, session_timeout, waiting_timeout
+    if args.clock or args.move_time:
+        time_control = game_session.TimeControl(args.clock, args.increment, args.move_time)
+        print(f"Playing on the clock: {args.clock:g}s per game, {args.increment:g}s increment, "
+              f"{args.move_time:g}s per move")
+    session_timeout = args.session_timeout
+    waiting_timeout = args.waiting_timeout
+
+def loop_timeout():
+    """How long the event loop may sleep before it has housekeeping to do."""
+    wake_at = next_snapshot
+    next_timer = timers.next_deadline()
+    if next_timer is not None:
+        wake_at = min(wake_at, next_timer)
+    timeout = max(0, wake_at - time.monotonic())
+    ai_timeout_left = ai_wait_timeout()
+    if ai_timeout_left is not None:
+        timeout = min(timeout, ai_timeout_left)
+    return timeout
+
+
+def configure_ai(args):
+    """Load the opening book and start the AI process pool."""
+    global ai_pool, ai_timeout, ponder_budget, ponder_generation, ai_move_cutoff
+    ai_timeout = args.ai_timeout
+    book_path = None
+    if os.path.exists(opening_book.DEFAULT_PATH):
+        book_path = opening_book.DEFAULT_PATH
+        book = game_ai.load_opening_book(book_path)
+        print(f"Loaded opening book with {book.count} positions")
+    if args.ai_workers > 0:
+        ponder_generation = multiprocessing.Value("Q", 0, lock=False)
+        ai_move_cutoff = multiprocessing.Value("Q", 0, lock=False)
+        ai_pool = ProcessPoolExecutor(max_workers=args.ai_workers, initializer=game_ai.init_ai_worker,
+                                      initargs=(book_path, ponder_generation, ai_move_cutoff))
+        print(f"Computing AI moves in {args.ai_workers} worker process(es)")
+        ponder_budget = args.ponder_budget
+        if ponder_budget:
+            print(f"Pondering up to {ponder_budget:g} CPU seconds per session")
+
+
+def main(args, worker=None):
+    """Serve until interrupted. worker is set when running as one of supervisor.py's workers."""
+    global shard
+    shard = worker
+    host, port = args.host, args.port
+    if shard is not None:
+        # Every worker writes its own files and serves the admin endpoints on its own port
+        if args.game_log is not None:
+            args.game_log = f"{args.game_log}.{shard.index}"
+        if args.session_store is not None:
+            args.session_store = f"{args.session_store}.{shard.index}"
+        if args.admin_port is not None:
+            args.admin_port += shard.index
+    configure_logging(args)
+    configure_ai(args)
+    configure_admission(args)
+    configure_clocks(args)
+    configure_game_log(args)
+    configure_session_store(args)
+    configure_admin(args)
 
-    host, port = sys.argv[1], int(sys.argv[2])
     lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # A restarted server can take the port over while old connections linger in TIME_WAIT
+    lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if shard is not None:
+        # The workers all listen on the port, the kernel spreads connections over them
+        lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     lsock.bind((host, port))
-    lsock.listen()
+    lsock.listen(args.backlog)
     print(f"Listening on {host}:{port}")
     lsock.setblocking(False)
     sel.register(lsock, selectors.EVENT_READ, data=None)
+    wakeup_recv.setblocking(False)
+    wakeup_send.setblocking(False)
+    sel.register(wakeup_recv, selectors.EVENT_READ, data=None)
+    if shard is not None:
+        shard.inbox.setblocking(False)
+        for peer in shard.peers:
+            peer.setblocking(False)
+        sel.register(shard.inbox, selectors.EVENT_READ, data=None)
 
-    with ThreadPoolExecutor(max_workers=max_players) as executor:
-        try:
-            while True:
-                events = sel.select(timeout=None)
-                for key, mask in events:
-                    if key.data is None:
-                        executor.submit(accept_wrapper, key.fileobj)
-                    else:
-                        executor.submit(service_connection, key, mask)
-        except KeyboardInterrupt:
-            print("Caught keyboard interrupt, exiting")
-        finally:
-            sel.close()
\ No newline at end of file
+    # Connections are served on this thread only, so sessions and admission
+    # state are never touched from two places at once
+    try:
+        while True:
+            events = sel.select(timeout=loop_timeout())
+            for key, mask in events:
+                if key.fileobj is wakeup_recv:
+                    wakeup_recv.recv(4096)
+                elif shard is not None and key.fileobj is shard.inbox:
+                    take_handoffs()
+                elif key.data is None:
+                    accept_wrapper(key.fileobj)
+                elif not key.data.closed:
+                    service_connection(key, mask)
+            collect_ai_moves()
+            collect_ponders()
+            if shard is not None:
+                balance_waiting_players()
+            run_timers()
+            if time.monotonic() >= next_snapshot:
+                snapshot_sessions()
+    except KeyboardInterrupt:
+        print("Caught keyboard interrupt, exiting")
+    finally:
+        sel.close()
+        close_game_log()
+        close_session_store()
+        if ai_pool is not None:
+            ai_pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,178 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Snapshots of running sessions, so games survive a server restart.
+
+Every player gets a resume token when it takes a seat. The server saves
+the sessions that changed since its last snapshot once per interval, and
+after a restart a client sends RESUME <token> to get its seat back. A
+session is only rebuilt when the first of its players comes back.
+
+Journal layout (little endian), records as in game_records:
+    header  magic b"C4SS", version u16
+    records kind u8, session id u64, and for a saved session: saved
+            at u32, flags u8 (1 = AI game), num_wins u16, player wins
+            u16, ai wins u16, seq u32, both resume tokens (8 bytes
+            each), move count u8, AI difficulty as u8 length + utf-8,
+            then the current game's columns packed 3 bits each
+
+The journal only grows with saves and removals. It is rewritten with just
+the latest record of every live session once it has grown to twice that
+size, checked when it is opened and after every append. Opening it only
+indexes the records, sessions are decoded when a player resumes them.
+"""
+
+import os
+import struct
+import time
+import game_logic
+import game_records
+import game_session
+
+MAGIC = b"C4SS"
+VERSION = 2
+REMOVED, SAVED = 0, 1
+RECORD_KEY = struct.Struct("<BQ")  # Kind and session id
+SESSION = struct.Struct("<IBHHHI16sB")
+MAX_NUM_WINS = 0xFFFF  # Wins to take a series, and the win counts, are stored as u16
+AI_GAME = 1
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.journal")
+DEFAULT_SNAPSHOT_INTERVAL = 1.0
+RESUME_TTL = 3600.0  # Seconds a saved session waits for its players to come back
+COMPACT_MIN_BYTES = 1 << 20
+
+
+def _text(value):
+    encoded = str(value).encode("utf-8")[:255]
+    return bytes((len(encoded),)) + encoded
+
+
+def _read_text(body, offset):
+    length = body[offset]
+    return body[offset + 1:offset + 1 + length].decode("utf-8"), offset + 1 + length
+
+
+def encode_session(session, saved=None):
+    columns = session.board.history
+    return (RECORD_KEY.pack(SAVED, session.session_id)
+            + SESSION.pack(int(time.time() if saved is None else saved), AI_GAME if session.is_ai_game else 0,
+                           session.num_wins, session.player_wins, session.ai_wins, session.seq,
+                           session.resume_secret, len(columns))
+            + _text(session.ai_difficulty or "") + game_records.pack_moves(columns))
+
+
+def encode_removal(session_id):
+    return RECORD_KEY.pack(REMOVED, session_id)
+
+
+def decode_session(body):
+    """Rebuild a GameSession from a saved record, with nobody seated yet."""
+    _, session_id = RECORD_KEY.unpack_from(body)
+    _, flags, num_wins, player_wins, ai_wins, seq, secret, count = SESSION.unpack_from(body, RECORD_KEY.size)
+    difficulty, offset = _read_text(body, RECORD_KEY.size + SESSION.size)
+    session = game_session.GameSession(player1=offline_seat(game_logic.PLAYER1), ai_difficulty=difficulty or None,
+                                       is_ai_game=bool(flags & AI_GAME), num_wins=num_wins)
+    session.session_id = session_id
+    if not session.is_ai_game:
+        session.sit(offline_seat(game_logic.PLAYER2), game_logic.PLAYER2)
+        session.update_state(game_session.READY)
+    session.player_wins, session.ai_wins = player_wins, ai_wins
+    session.resume_secret = secret
+    # Replay the current game, the board's history numbers the moves from seq back
+    for column in game_records.unpack_moves(body[offset:], count):
+        game_logic.make_move(session.board, column, session.board.current_token)
+    session.turn = session.board.current_token
+    session.player_moves = (count + 1) // 2
+    session.ai_moves = count // 2 if session.is_ai_game else 0
+    session.seq = session.broadcast_seq = seq
+    return session
+
+
+def offline_seat(token):
+    """Stand-in player id for a seat whose player hasn't come back yet."""
+    return ("offline", token)
+
+
+class SessionStore:
+    def __init__(self, path, sync_interval=game_records.DEFAULT_SYNC_INTERVAL):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.records = {}  # session id -> latest saved record
+        self.tokens = {}  # resume token -> session id
+        self.live_bytes = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._load()
+        self.journal_bytes = os.path.getsize(path) if os.path.exists(path) else 0
+        if self._needs_compaction():
+            self._compact()
+        else:
+            self.log = game_records.AppendLog(path, MAGIC, VERSION, sync_interval)
+
+    def _load(self):
+        expired_before = time.time() - RESUME_TTL
+        for body in game_records.read_records(self.path, MAGIC, VERSION):
+            kind, session_id = RECORD_KEY.unpack_from(body)
+            self._drop(session_id)
+            if kind == SAVED and SESSION.unpack_from(body, RECORD_KEY.size)[0] >= expired_before:
+                self._index(session_id, body)
+
+    def _index(self, session_id, body):
+        self.records[session_id] = body
+        secret = SESSION.unpack_from(body, RECORD_KEY.size)[-2]
+        self.tokens[secret[:8]] = self.tokens[secret[8:]] = session_id
+        self.live_bytes += game_records.RECORD_LENGTH.size + len(body)
+
+    def _drop(self, session_id):
+        body = self.records.pop(session_id, None)
+        if body is not None:
+            secret = SESSION.unpack_from(body, RECORD_KEY.size)[-2]
+            self.tokens.pop(secret[:8], None)
+            self.tokens.pop(secret[8:], None)
+            self.live_bytes -= game_records.RECORD_LENGTH.size + len(body)
+
+    def _compact(self):
+        """Rewrite the journal with one record per live session."""
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as journal:
+            journal.write(game_records.FILE_HEADER.pack(MAGIC, VERSION))
+            journal.write(b"".join(game_records.frame_record(body) for body in self.records.values()))
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temporary, self.path)
+        self.journal_bytes = game_records.FILE_HEADER.size + self.live_bytes
+        self.log = game_records.AppendLog(self.path, MAGIC, VERSION, self.sync_interval)
+
+    def save(self, session):
+        body = encode_session(session)
+        self._drop(session.session_id)
+        self._index(session.session_id, body)
+        self._append(body)
+
+    def remove(self, session_id):
+        if session_id in self.records:
+            self._drop(session_id)
+            self._append(encode_removal(session_id))
+
+    def _append(self, body):
+        record = game_records.frame_record(body)
+        self.log.append(record)
+        self.journal_bytes += len(record)
+        if self._needs_compaction():
+            self.log.close()
+            self._compact()
+
+    def _needs_compaction(self):
+        return self.journal_bytes > max(COMPACT_MIN_BYTES, 2 * self.live_bytes)
+
+    def restore(self, token):
+        """Rebuild the session a resume token belongs to, None if there is none."""
+        session_id = self.tokens.get(token)
+        if session_id is None:
+            return None
+        return decode_session(self.records[session_id])
+
+    def __len__(self):
+        return len(self.records)
+
+    def close(self):
+        self.log.close()
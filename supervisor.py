@@ -0,0 +1,109 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Run several server.py workers on one port, one per core by default.
+
+Every worker is a process of its own with its own listening socket, bound
+with SO_REUSEPORT so the kernel spreads new connections over them, and its
+own event loop, sessions and AI pool. A PvP player whose worker has nobody
+waiting is handed to a worker that has: the workers publish how many
+players they have waiting in shared memory, and the client socket itself
+is passed over a Unix socket. A worker that exits is started again.
+
+Limits like --max-connections apply to each worker. --game-log and
+--session-store get the worker index appended, and worker i serves the
+admin endpoints on --admin-port + i.
+
+Usage:
+    python supervisor.py <host> <port> [--workers N] [options, see server.py --help]
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+import types
+
+RESTART_DELAY = 1.0  # Wait this long before restarting a worker that died right after its start
+
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def create_shards(count):
+    """Shared state of the workers, created before forking so every worker inherits it."""
+    waiting = multiprocessing.RawArray("i", count)
+    # A datagram socket pair per worker. The supervisor keeps both ends, so
+    # handoffs sent while a worker restarts wait for the new one.
+    pairs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(count)]
+    return [types.SimpleNamespace(index=index, count=count, waiting=waiting, inbox=pairs[index][0],
+                                  peers=[send for _, send in pairs])
+            for index in range(count)]
+
+
+def start_worker(shard, server_argv):
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        os.setpgrp()  # Ctrl-C reaches the supervisor only, which stops the workers one by one
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        # Imported after the fork so every worker has its own selector and wakeup socket
+        import server
+        server.main(server.parse_args("Connect 4 game server worker.", server_argv), shard)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(code)
+
+
+def supervise(shards, server_argv):
+    workers = {}  # pid -> shard
+    started = {}  # worker index -> time.monotonic() of its last start
+    for shard in shards:
+        workers[start_worker(shard, server_argv)] = shard
+        started[shard.index] = time.monotonic()
+    print(f"Started {len(shards)} workers")
+    try:
+        while True:
+            pid, status = os.wait()
+            shard = workers.pop(pid, None)
+            if shard is None:
+                continue
+            print(f"Worker {shard.index} (pid {pid}) exited with code {os.waitstatus_to_exitcode(status)}, "
+                  f"restarting it")
+            shard.waiting[shard.index] = 0
+            if time.monotonic() - started[shard.index] < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            workers[start_worker(shard, server_argv)] = shard
+            started[shard.index] = time.monotonic()
+    except KeyboardInterrupt:
+        print("Caught keyboard interrupt, stopping the workers")
+    finally:
+        for pid in workers:
+            os.kill(pid, signal.SIGINT)
+        for pid in workers:
+            os.waitpid(pid, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Connect 4 server workers on one port.",
+                                     epilog="Other options are passed to the workers, see server.py --help.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args, server_argv = parser.parse_known_args()
+    if not any(arg.startswith("--ai-workers") for arg in server_argv):
+        # Share the cores between the workers' AI pools
+        server_argv += ["--ai-workers", str(max(1, (os.cpu_count() or 1) // args.workers))]
+
+    # Started in the background SIGINT may be ignored, make it stop the supervisor either way
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, interrupt)
+    supervise(create_shards(args.workers), server_argv)
@@ -0,0 +1,53 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Test of an expert AI move that times out in the process pool.
+
+The server has to play the hard AI's move instead and make the worker
+give up the search, so the worker is free again long before the search's
+own time budget is over. Run with python -m pytest test_ai_timeout.py.
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+import game_ai
+import game_logic
+import game_search
+import server
+
+AI_TIMEOUT = 0.2
+
+
+def test_timed_out_search_frees_the_worker():
+    generation = multiprocessing.Value("Q", 0, lock=False)
+    cutoff = multiprocessing.Value("Q", 0, lock=False)
+    pool = ProcessPoolExecutor(max_workers=1, initializer=game_ai.init_ai_worker, initargs=(None, generation, cutoff))
+    saved = server.ai_pool, server.ai_move_cutoff, server.ponder_generation, server.ai_timeout
+    server.ai_pool, server.ai_move_cutoff, server.ponder_generation, server.ai_timeout = \
+        pool, cutoff, generation, AI_TIMEOUT
+    try:
+        pool.submit(int).result()  # The worker is up before the clock starts
+        game_ai.decisions.clear()
+        data = server.open_connection(("10.0.0.1", 1), close=None)[1]
+        server.process_command("START_GAME 2 expert 1", data, None)
+        server.process_command("MOVE 3", data, None)
+        session = server.active_sessions[data.session_id]
+        future, _, _, ticket = server.pending_ai_moves[data.session_id]
+        assert session.turn == game_logic.PLAYER2
+
+        time.sleep(AI_TIMEOUT + 0.05)
+        server.collect_ai_moves()
+        stopped_at = time.monotonic()
+        # The hard AI moved instead, and the search was told to give up
+        assert data.session_id not in server.pending_ai_moves
+        assert session.turn == game_logic.PLAYER1 and session.board.moves == 2
+        assert cutoff.value == ticket
+        assert future.result(timeout=game_search.DEFAULT_TIME_BUDGET) is None
+        assert pool.submit(int).result() == 0
+        assert time.monotonic() - stopped_at < game_search.DEFAULT_TIME_BUDGET / 2
+    finally:
+        server.ai_pool, server.ai_move_cutoff, server.ponder_generation, server.ai_timeout = saved
+        pool.shutdown(cancel_futures=True)
+        server.active_sessions.clear()
+        server.clients.clear()
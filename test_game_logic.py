@@ -0,0 +1,46 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Property tests for the win checks of game_logic.
+
+Random games are played on a Board and on an old list-of-lists grid side
+by side. After every move, check_win_at() through the new token has to
+agree with the full check_win() scan, and make_move() has to land the
+token on the same row on both. Run with python -m pytest test_game_logic.py.
+"""
+
+import random
+import game_logic
+
+GAMES = 3000
+SEED = 2
+
+
+def empty_grid():
+    return [[game_logic.EMPTY] * game_logic.COLUMNS for _ in range(game_logic.ROWS)]
+
+
+def test_check_win_at_agrees_with_full_scan():
+    rng = random.Random(SEED)
+    for game in range(GAMES):
+        board, grid = game_logic.create_board(), empty_grid()
+        for move in range(game_logic.BOARD_SIZE):
+            token = game_logic.TOKENS[move & 1]
+            column = rng.choice([col for col in range(game_logic.COLUMNS) if board.can_play(col)])
+            row = game_logic.make_move(board, column, token)
+            assert game_logic.make_move(grid, column, token) == row, (game, move)
+            won = game_logic.check_win(board, token)
+            assert game_logic.check_win_at(board, row, column, token) == won, (game, move)
+            assert game_logic.check_win_at(grid, row, column, token) == game_logic.check_win(grid, token) == won, \
+                (game, move)
+            if won:
+                break
+
+
+def test_make_move_on_full_column():
+    board, grid = game_logic.create_board(), empty_grid()
+    for move in range(game_logic.ROWS):
+        token = game_logic.TOKENS[move & 1]
+        assert game_logic.make_move(board, 0, token) == game_logic.make_move(grid, 0, token) == game_logic.ROWS - 1 - move
+    assert game_logic.make_move(board, 0, game_logic.PLAYER1) is None
+    assert game_logic.make_move(grid, 0, game_logic.PLAYER1) is None
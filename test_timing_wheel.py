@@ -0,0 +1,79 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Tests of the timing wheel, driven with made-up times instead of the clock.
+
+Run with python -m pytest test_timing_wheel.py.
+"""
+
+import timing_wheel
+
+TICK = timing_wheel.DEFAULT_TICK
+
+
+def make_wheel():
+    return timing_wheel.TimingWheel(now=0.0)
+
+
+def due(tick):
+    """A deadline in the middle of the tick before, the timer fires at tick."""
+    return (tick - 0.5) * TICK
+
+
+def test_cancel_a_timer_of_the_same_tick():
+    wheel = make_wheel()
+    fired = []
+    timers = {}
+    # Both are due in the same tick, whichever fires first cancels the other
+    timers["first"] = wheel.schedule(due(1), lambda: (fired.append("first"), wheel.cancel(timers["second"])))
+    timers["second"] = wheel.schedule(due(1), lambda: (fired.append("second"), wheel.cancel(timers["first"])))
+    assert wheel.advance(TICK) == 1
+    assert len(fired) == 1 and len(wheel) == 0
+    assert not timers["first"].pending() and not timers["second"].pending()
+
+
+def test_schedule_from_a_callback():
+    wheel = make_wheel()
+    fired = []
+    wheel.schedule(due(1), lambda: wheel.schedule(due(2), fired.append, "later"))
+    assert wheel.advance(TICK) == 1
+    assert fired == [] and len(wheel) == 1
+    assert wheel.advance(2 * TICK) == 1
+    assert fired == ["later"]
+
+
+def test_failing_callback_keeps_the_rest_of_the_tick():
+    wheel = make_wheel()
+    fired = []
+    for index in range(5):
+        wheel.schedule(due(1), fired.append, index)
+    wheel.schedule(due(1), lambda: 1 / 0)
+    assert wheel.advance(TICK) == 6
+    assert sorted(fired) == list(range(5)) and len(wheel) == 0
+
+
+def test_cascade_fires_on_time():
+    wheel = make_wheel()
+    fired = []
+    # Due on level 0, level 1 and level 2, and right where level 1 cascades
+    ticks = [3, timing_wheel.SLOTS - 1, timing_wheel.SLOTS, timing_wheel.SLOTS + 7, 5 * timing_wheel.SLOTS + 1,
+             timing_wheel.SLOTS ** 2 + 3]
+    for tick in ticks:
+        wheel.schedule(due(tick), lambda tick=tick: fired.append((tick, wheel.current)))
+    for tick in range(1, max(ticks) + 1):
+        wheel.advance(tick * TICK)
+    assert fired == [(tick, tick) for tick in ticks]
+    assert len(wheel) == 0
+
+
+def test_cancel_during_cascade_tick():
+    wheel = make_wheel()
+    fired = []
+    timers = {}
+    # Both come down from level 1 into the tick they fire at
+    tick = timing_wheel.SLOTS + 2
+    timers["first"] = wheel.schedule(due(tick), lambda: (fired.append("first"), wheel.cancel(timers["second"])))
+    timers["second"] = wheel.schedule(due(tick), lambda: (fired.append("second"), wheel.cancel(timers["first"])))
+    wheel.schedule(due(timing_wheel.SLOTS), fired.append, "boundary")
+    assert wheel.advance(tick * TICK) == 2
+    assert fired[0] == "boundary" and len(fired) == 2 and len(wheel) == 0
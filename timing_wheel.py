@@ -0,0 +1,156 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Hierarchical timing wheel for the timers of the server loop.
+
+Time is counted in ticks. The wheel has LEVELS rings of SLOTS slots each,
+level 0 holding the timers due within SLOTS ticks, level 1 those due within
+SLOTS**2 ticks, and so on. Whenever level 0 wraps around, the next slot of
+level 1 is cascaded down, its timers placed again by how far away they are
+now. Scheduling and cancelling a timer is one set operation however many
+timers there are, and timers fire at the first tick at or after their
+deadline.
+
+Deadlines are time.monotonic() values. The wheel has no thread of its own:
+the loop asks next_deadline() how long it may sleep and calls advance()
+when it wakes up. A callback may schedule and cancel timers, also ones
+due in the same tick, and one that raises is logged without keeping the
+other timers of its tick from firing.
+"""
+
+import logging
+import math
+import time
+
+BITS = 8
+SLOTS = 1 << BITS
+MASK = SLOTS - 1
+LEVELS = 4
+DEFAULT_TICK = 0.05  # Seconds, level 0 spans 12.8 seconds and level 3 about 6.8 years
+
+logger = logging.getLogger("connect4.timers")
+
+
+class Timer:
+    __slots__ = ("expires", "callback", "args", "slot")
+
+    def __init__(self, expires, callback, args):
+        self.expires = expires  # Tick the timer fires at
+        self.callback = callback
+        self.args = args
+        self.slot = None  # Set holding the timer while it is pending
+
+    def pending(self):
+        return self.slot is not None
+
+
+class TimingWheel:
+    def __init__(self, tick=DEFAULT_TICK, now=None):
+        self.tick = tick
+        self.current = int((time.monotonic() if now is None else now) / tick)  # Last tick done
+        self.levels = [[set() for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.pending = 0
+        self.next_tick = None  # Cached answer of next_deadline(), in ticks
+
+    def schedule(self, deadline, callback, *args):
+        """Call callback(*args) once deadline has passed, return the timer to cancel it."""
+        timer = Timer(max(math.ceil(deadline / self.tick), self.current + 1), callback, args)
+        self._place(timer)
+        self.pending += 1
+        if self.next_tick is not None and timer.expires < self.next_tick:
+            self.next_tick = timer.expires
+        return timer
+
+    def cancel(self, timer):
+        if timer.slot is not None:
+            timer.slot.discard(timer)
+            timer.slot = None
+            self.pending -= 1
+
+    def deadline_of(self, timer):
+        return timer.expires * self.tick
+
+    def _place(self, timer):
+        delta = timer.expires - self.current
+        level = 0
+        while delta >= SLOTS << (BITS * level) and level < LEVELS - 1:
+            level += 1
+        if level == LEVELS - 1:
+            # Deadlines beyond the range of the last level, years away, are cut to it
+            timer.expires = min(timer.expires, self.current + (SLOTS << (BITS * level)) - 1)
+        timer.slot = self.levels[level][(timer.expires >> (BITS * level)) & MASK]
+        timer.slot.add(timer)
+
+    def _cascade(self, tick):
+        """Place the timers of the higher level slots that start at tick again."""
+        for level in range(1, LEVELS):
+            index = (tick >> (BITS * level)) & MASK
+            slot = self.levels[level][index]
+            if slot:
+                self.levels[level][index] = set()
+                for timer in list(slot):
+                    self._place(timer)
+            if index:
+                break
+
+    def advance(self, now=None):
+        """Fire every timer due by now, return how many fired."""
+        # Rounded up by a hair, so the time next_deadline() returned reaches its tick
+        target = int((time.monotonic() if now is None else now) / self.tick + 1e-6)
+        fired = 0
+        while self.current < target:
+            if not self.pending:
+                self.current = target
+                break
+            self.current += 1
+            if not self.current & MASK:
+                self._cascade(self.current)
+            slot = self.levels[0][self.current & MASK]
+            if slot:
+                self.levels[0][self.current & MASK] = set()
+                # A copy, cancel() takes timers out of the slot while it fires
+                for timer in list(slot):
+                    if timer.slot is not slot:
+                        continue  # Cancelled by a callback of this tick
+                    timer.slot = None
+                    self.pending -= 1
+                    fired += 1
+                    try:
+                        timer.callback(*timer.args)
+                    except Exception:
+                        logger.exception("Timer callback %r failed", timer.callback)
+        if self.next_tick is not None and self.next_tick <= self.current:
+            self.next_tick = None
+        return fired
+
+    def next_deadline(self):
+        """Time the loop has to call advance() by, None without pending timers.
+
+        Exact for timers due within a turn of level 0, timers further away
+        make the loop wake up once per turn until they are cascaded down.
+        """
+        if not self.pending:
+            return None
+        if self.next_tick is None:
+            self.next_tick = self._next_tick()
+        return self.next_tick * self.tick
+
+    def _next_tick(self):
+        for tick in range(self.current + 1, self.current + SLOTS):
+            if not tick & MASK and self._cascades_at(tick):
+                return tick
+            if self.levels[0][tick & MASK]:
+                return tick
+        return self.current + SLOTS
+
+    def _cascades_at(self, tick):
+        for level in range(1, LEVELS):
+            index = (tick >> (BITS * level)) & MASK
+            if self.levels[level][index]:
+                return True
+            if index:
+                return False
+        return False
+
+    def __len__(self):
+        return self.pending
@@ -0,0 +1,132 @@
+# Student's name: Aladin Nour Mawasi
+# Student's ID: 316172410
+
+"""Headless self-play between the AI engines.
+
+Every pair of engines plays the same seeds twice, once with each engine
+moving first. Games run on game_logic.Board directly, spread over a
+process pool. Usage:
+    python tournament.py [--engines random algorithmic hard expert] [--games 100]
+                         [--workers N] [--expert-budget SECONDS]
+"""
+
+import argparse
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import time
+import game_ai
+import game_logic
+import game_threats
+import opening_book
+
+# algorithmic is the hard AI before game_threats: win, block or play at random
+ENGINES = ("random", "algorithmic", "hard", "expert")
+DEFAULT_EXPERT_BUDGET = 0.1
+
+
+def engine_move(engine, board, expert_budget, threats):
+    if engine == "random":
+        return game_ai.random_ai_move(board)
+    if engine == "algorithmic":
+        return game_ai.algorithmic_ai_move(board)
+    if engine == "hard":
+        return game_threats.threat_ai_move(board, threats)
+    if engine == "expert":
+        return game_ai.expert_ai_move(board, expert_budget)
+    raise ValueError(f"Unknown engine {engine}")
+
+
+def play_game(task):
+    """Play one game, return (first, second, winner, moves, think time per engine)."""
+    first, second, seed, expert_budget = task
+    random.seed(seed)
+    # Decisions cached by earlier games of the worker would make this one
+    # look faster, and which games those are depends on the pool's scheduling
+    game_ai.decisions.clear()
+    board = game_logic.create_board()
+    engines = {game_logic.PLAYER1: first, game_logic.PLAYER2: second}
+    think_time = {first: [0.0, 0], second: [0.0, 0]}
+    threats = game_threats.ThreatCounts()  # Kept up with the game like a session does
+    winner = None
+    while not board.is_full():
+        token = board.current_token
+        engine = engines[token]
+        start = time.perf_counter()
+        column = engine_move(engine, board, expert_budget, threats)
+        spent = think_time[engine]
+        spent[0] += time.perf_counter() - start
+        spent[1] += 1
+        row = board.play(column, token)
+        if board.has_won_at(row, column, token):
+            winner = engine
+            break
+    return first, second, winner, board.moves, think_time
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """95% confidence interval of a win rate."""
+    if trials == 0:
+        return 0.0, 0.0
+    rate = successes / trials
+    denominator = 1 + z * z / trials
+    center = (rate + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials)) / denominator
+    return center - margin, center + margin
+
+
+def schedule(engines, games, expert_budget):
+    for engine_a, engine_b in itertools.combinations(engines, 2):
+        for seed in range(games):
+            yield engine_a, engine_b, seed, expert_budget
+            yield engine_b, engine_a, seed, expert_budget
+
+
+def run(engines, games, workers, expert_budget):
+    results = {}  # (engine_a, engine_b) -> [a wins, b wins, draws, total moves]
+    think_time = {engine: [0.0, 0] for engine in engines}
+    book_path = opening_book.DEFAULT_PATH if os.path.exists(opening_book.DEFAULT_PATH) else None
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=game_ai.init_ai_worker, initargs=(book_path,)) as pool:
+        for first, second, winner, moves, spent in pool.imap_unordered(
+                play_game, schedule(engines, games, expert_budget), chunksize=4):
+            pair = tuple(sorted((first, second), key=engines.index))
+            tally = results.setdefault(pair, [0, 0, 0, 0])
+            if winner is None:
+                tally[2] += 1
+            else:
+                tally[pair.index(winner)] += 1
+            tally[3] += moves
+            for engine, (seconds, count) in spent.items():
+                think_time[engine][0] += seconds
+                think_time[engine][1] += count
+    elapsed = time.perf_counter() - start
+
+    print(f"{'engine A':<13}{'engine B':<13}{'games':>7}{'A wins':>8}{'B wins':>8}{'draws':>7}"
+          f"{'A win rate (95% CI)':>26}{'avg moves':>11}")
+    for (engine_a, engine_b), (a_wins, b_wins, draws, moves) in results.items():
+        played = a_wins + b_wins + draws
+        low, high = wilson_interval(a_wins, played)
+        interval = f"{a_wins / played:.1%} ({low:.1%}-{high:.1%})"
+        print(f"{engine_a:<13}{engine_b:<13}{played:>7}{a_wins:>8}{b_wins:>8}{draws:>7}"
+              f"{interval:>26}{moves / played:>11.1f}")
+    print()
+    for engine, (seconds, count) in think_time.items():
+        if count:
+            print(f"{engine:<13}{seconds / count * 1000:>10.3f} ms/move over {count} moves")
+    print(f"\n{sum(sum(tally[:3]) for tally in results.values())} games in {elapsed:.1f}s "
+          f"on {workers} worker(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play the AI engines against each other.")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--games", type=int, default=100, help="seeds per pairing, each played with both colours")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--expert-budget", type=float, default=DEFAULT_EXPERT_BUDGET,
+                        help="seconds the expert engine may think per move")
+    args = parser.parse_args()
+    run(args.engines, args.games, args.workers, args.expert_budget)